@@ -0,0 +1,79 @@
+"""
+Compare the row-by-row path with the columnar ledger.
+
+Run from the repository root:
+
+    python -m benchmarks.columnar --rows 200000
+"""
+
+import argparse
+from time import perf_counter
+from dataclasses import replace
+from benchmarks.ledger import generate_expenses
+from tracker.columnar import ColumnarLedger, np
+from tracker.models import Expense
+from tracker.query import ALL_EXPENSES, aggregate_expenses, filter_expenses
+from tracker.query import iter_matching, sort_expenses
+
+
+def row_aggregate(expenses, validated):
+    matching = filter_expenses(expenses, validated)
+    matching.sort(key=lambda x: x.date)
+    return aggregate_expenses(matching)
+
+
+def row_query(expenses, validated):
+    return sort_expenses(iter_matching(expenses, validated), validated)
+
+
+def best_of(repeat: int, func, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func(*args)
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    expenses = list(map(Expense.from_dict, generate_expenses(args.rows)))
+    start = perf_counter()
+    ledger = ColumnarLedger(expenses)
+    build = perf_counter() - start
+
+    cases = {
+        "summary, all": ALL_EXPENSES,
+        "summary, one year": replace(
+            ALL_EXPENSES, from_date="2023-01-01", to_date="2023-12-31"
+        ),
+        "summary, category": replace(ALL_EXPENSES, category="groceries"),
+        "summary, amount range": replace(
+            ALL_EXPENSES, min_amount=100.0, max_amount=200.0
+        ),
+        "list top 10 by amount": replace(
+            ALL_EXPENSES, category="rent", sort="amount", sort_direction=-1, limit=10
+        ),
+    }
+
+    print(f"{args.rows} expenses, numpy {'on' if np is not None else 'off'}")
+    print(f"columnar build: {build * 1000:.1f} ms")
+    print(f"{'case':<24} {'rows ms':>10} {'columnar ms':>12} {'speedup':>8}")
+    for name, validated in cases.items():
+        if name.startswith("list"):
+            slow = best_of(args.repeat, row_query, expenses, validated)
+            fast = best_of(args.repeat, ledger.query, validated)
+        else:
+            slow = best_of(args.repeat, row_aggregate, expenses, validated)
+            fast = best_of(args.repeat, ledger.aggregate, validated)
+        print(
+            f"{name:<24} {slow * 1000:>10.1f} {fast * 1000:>12.1f} {slow / fast:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
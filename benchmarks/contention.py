@@ -0,0 +1,171 @@
+"""
+Concurrent writers against one ledger.
+
+Starts several processes that each add (and then edit) expenses through
+ExpenseService at the same time, checks that no write was lost, that every
+ID is unique and that the rollup still matches, and reports the write
+throughput with and without group commit:
+
+    python -m benchmarks.contention --writers 8 --adds 200 --group-commit-ms 2
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+from time import perf_counter
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def writer(adds: int, worker: int):
+    """
+    Add expenses, then edit each of them once, in ./data.
+
+    Args:
+        adds: Number of expenses to add
+        worker: Writer number, stored in the notes
+
+    Returns:
+        None
+    """
+    from tracker.service import ExpenseService
+
+    ids = []
+    for n in range(adds):
+        expense = ExpenseService.add_expense(
+            "2025-06-15", "Food", 1.0, f"writer {worker} add {n}"
+        )
+        ids.append(expense["id"])
+    for id in ids:
+        ExpenseService.edit_expense(id, None, None, 2.0, None)
+
+
+def check(writers: int, adds: int) -> list[str]:
+    """
+    Check the ledger in ./data after the writers have finished.
+
+    Args:
+        writers: Number of writer processes
+        adds: Expenses added by each writer
+
+    Returns:
+        list[str]: A description of every problem found
+    """
+    from tracker.service import ExpenseService
+
+    expenses = ExpenseService.list_expenses({"month": "2025-06"})
+    problems = []
+    if len(expenses) != writers * adds:
+        problems.append(f"expected {writers * adds} expenses, found {len(expenses)}")
+    if len({exp["id"] for exp in expenses}) != len(expenses):
+        problems.append("duplicate expense IDs")
+    edited = sum(1 for exp in expenses if exp["amount"] == 2.0)
+    if edited != len(expenses):
+        problems.append(f"{len(expenses) - edited} edits were lost")
+    problems.extend(ExpenseService.check_rollup())
+    return problems
+
+
+def run(writers: int, adds: int, group_commit_ms: float) -> float:
+    """
+    Run the writers against a fresh ledger and check the result.
+
+    Args:
+        writers: Number of writer processes
+        adds: Expenses added by each writer
+        group_commit_ms: Group commit window (0 for off)
+
+    Returns:
+        float: Writes (adds and edits) per second
+    """
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO_DIR,
+        TRACKER_DAEMON="0",
+        TRACKER_GROUP_COMMIT_MS=str(group_commit_ms),
+    )
+    with tempfile.TemporaryDirectory() as cwd:
+        # start from an empty rollup so that the writers maintain it
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.contention", "--setup"],
+            cwd=cwd,
+            env=env,
+            check=True,
+        )
+        start = perf_counter()
+        children = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.contention",
+                    "--worker",
+                    str(worker),
+                    "--adds",
+                    str(adds),
+                ],
+                cwd=cwd,
+                env=env,
+            )
+            for worker in range(writers)
+        ]
+        for child in children:
+            if child.wait() != 0:
+                raise RuntimeError("a writer failed")
+        elapsed = perf_counter() - start
+        checker = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.contention",
+                "--check",
+                "--writers",
+                str(writers),
+                "--adds",
+                str(adds),
+            ],
+            cwd=cwd,
+            env=env,
+        )
+        if checker.returncode != 0:
+            raise RuntimeError("the ledger is inconsistent")
+    return 2 * writers * adds / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writers", type=int, default=8, help="writer processes")
+    parser.add_argument("--adds", type=int, default=100, help="adds per writer")
+    parser.add_argument(
+        "--group-commit-ms", type=float, default=2.0, help="group commit window"
+    )
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--setup", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--check", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.setup:
+        from tracker.service import ExpenseService
+
+        ExpenseService.rebuild_rollup()
+        return
+
+    if args.worker is not None:
+        writer(args.adds, args.worker)
+        return
+    if args.check:
+        problems = check(args.writers, args.adds)
+        for problem in problems:
+            print(f"FAIL: {problem}", file=sys.stderr)
+        sys.exit(1 if problems else 0)
+
+    for window in (0, args.group_commit_ms):
+        label = f"group commit {window:g} ms" if window else "group commit off"
+        rate = run(args.writers, args.adds, window)
+        print(f"{label:<24} {rate:>8.0f} writes/s  (no lost writes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Deterministic synthetic ledgers for the benchmarks.
+"""
+
+import math
+import random
+from datetime import date, timedelta
+from itertools import batched
+from typing import Iterator
+from tracker.utils import generateExpenseId
+
+FIRST_DATE = date(2020, 1, 1)
+LAST_DATE = date(2025, 12, 31)
+
+# category, median amount; earlier categories are more frequent (Zipf)
+CATEGORIES = [
+    ("Food", 12),
+    ("Transport", 6),
+    ("Groceries", 45),
+    ("Coffee", 4),
+    ("Shopping", 60),
+    ("Utilities", 90),
+    ("Entertainment", 25),
+    ("Health", 70),
+    ("Travel", 300),
+    ("Rent", 900),
+    ("Education", 150),
+    ("Gifts", 40),
+]
+
+WORDS = (
+    "lunch dinner with team taxi airport uber monthly bill invoice "
+    "weekend trip groceries market coffee bookshop pharmacy refill "
+    "gym membership cinema tickets birthday present course fees "
+    "electricity water internet phone train bus parking snacks"
+).split()
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+
+def parse_size(size: str) -> int:
+    """
+    Turn a size label such as 10k or 1m (or a plain number) into a row count.
+
+    Args:
+        size: Size label
+
+    Returns:
+        int: Number of expenses
+    """
+    return SIZES.get(size.lower()) or int(size)
+
+
+def generate_expenses(rows: int, seed: int = 0) -> Iterator[dict]:
+    """
+    Yield a reproducible ledger of expenses.
+
+    Expenses are spread over 2020-2025 and mostly added in date order, with
+    some backdated by up to a month. Categories follow a Zipf distribution,
+    amounts a log-normal distribution around a per-category median, and
+    notes range from 'N/A' to a dozen words.
+
+    Args:
+        rows: Number of expenses
+        seed: Random seed
+
+    Returns:
+        Iterator[dict]: Expense dictionaries with sequential IDs
+    """
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(CATEGORIES) + 1)]
+    span = (LAST_DATE - FIRST_DATE).days
+    for no in range(1, rows + 1):
+        day = int(span * no / rows) - rng.choice((0, 0, 0, rng.randint(0, 30)))
+        expense_date = FIRST_DATE + timedelta(days=min(max(day, 0), span))
+        category, median = rng.choices(CATEGORIES, weights)[0]
+        amount = round(median * math.exp(rng.gauss(0, 0.6)), 2)
+        if rng.random() < 0.3:
+            note = "N/A"
+        else:
+            note = " ".join(rng.choices(WORDS, k=rng.randint(1, 12)))
+        date_str = expense_date.isoformat()
+        yield {
+            "id": generateExpenseId(date_str, no),
+            "date": date_str,
+            "category": category,
+            "amount": amount,
+            "note": note,
+            "currency": "BDT",
+            "created_at": f"{date_str}T{rng.randint(8, 22):02d}:{rng.randint(0, 59):02d}:00",
+        }
+
+
+def build_ledger(rows: int, seed: int = 0, batch_size: int = 50_000) -> int:
+    """
+    Store a synthetic ledger with the configured storage engine in ./data.
+
+    Args:
+        rows: Number of expenses
+        seed: Random seed
+        batch_size: Expenses per storage write
+
+    Returns:
+        int: Number of expenses stored
+    """
+    from tracker.storage import save_many
+
+    stored = 0
+    for batch in batched(generate_expenses(rows, seed), batch_size):
+        stored += save_many(list(batch))
+    return stored
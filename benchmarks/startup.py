@@ -0,0 +1,101 @@
+"""
+Check the cold-start time of the CLI against a recorded budget.
+
+Runs 'python -X importtime -m tracker --help' several times in an empty
+directory and compares the median wall-clock time with the budget in
+benchmarks/startup_budget.json. Exits with status 1 when the budget is
+exceeded or when --help leaves files behind (such as the logs directory).
+
+    python -m benchmarks.startup            # check
+    python -m benchmarks.startup --record   # store a new budget
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+from time import perf_counter
+
+BUDGET_FILE = os.path.join(os.path.dirname(__file__), "startup_budget.json")
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# recorded budgets leave this much headroom over the measured median
+HEADROOM = 1.5
+
+
+def measure(runs: int) -> tuple[list[float], list[tuple[int, str]], list[str]]:
+    """
+    Time the CLI's --help in a fresh directory.
+
+    Args:
+        runs: Number of runs
+
+    Returns:
+        tuple: Wall-clock seconds per run, the slowest imports of the last run (cumulative microseconds, module) and the files left behind
+    """
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, TRACKER_DAEMON="0")
+    command = [sys.executable, "-X", "importtime", "-m", "tracker", "--help"]
+    timings = []
+    with tempfile.TemporaryDirectory() as cwd:
+        for _ in range(runs):
+            start = perf_counter()
+            result = subprocess.run(
+                command, cwd=cwd, env=env, capture_output=True, text=True
+            )
+            timings.append(perf_counter() - start)
+            if result.returncode != 0:
+                raise SystemExit(f"'tracker --help' failed:\n{result.stderr}")
+        leftovers = sorted(os.listdir(cwd))
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line.split("|")
+            if cumulative.strip().isdigit():
+                imports.append((int(cumulative), module.strip()))
+    imports.sort(reverse=True)
+    return timings, imports[:10], leftovers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=15)
+    parser.add_argument(
+        "--record", action="store_true", help="store the measured time as the budget"
+    )
+    args = parser.parse_args()
+
+    timings, imports, leftovers = measure(args.runs)
+    median = statistics.median(timings)
+    print(f"tracker --help: median {median * 1000:.1f} ms over {args.runs} runs")
+    print("slowest imports (cumulative):")
+    for cumulative, module in imports:
+        print(f"  {cumulative / 1000:>7.1f} ms  {module}")
+
+    if args.record:
+        budget = {"help_seconds": round(median * HEADROOM, 4)}
+        with open(BUDGET_FILE, "w") as f:
+            json.dump(budget, f, indent=2)
+            f.write("\n")
+        print(f"Recorded a budget of {budget['help_seconds'] * 1000:.1f} ms")
+        return
+
+    failed = False
+    if leftovers:
+        print(f"FAIL: --help created {', '.join(leftovers)}")
+        failed = True
+    with open(BUDGET_FILE, "r") as f:
+        budget = json.load(f)["help_seconds"]
+    if median > budget:
+        print(f"FAIL: over the budget of {budget * 1000:.1f} ms")
+        failed = True
+    else:
+        print(f"OK: within the budget of {budget * 1000:.1f} ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+Benchmark every subcommand on synthetic ledgers.
+
+Each ledger size gets a temporary directory holding a freshly generated
+ledger. A worker process builds it and times the ExpenseService API; the
+'python -m tracker' runs are then started from this (small) process,
+since a child's peak RSS includes that of the process it was forked from.
+Each case reports p50/p95 latency, peak RSS and bytes written per run.
+The result cache is switched off, so repeated list and summary runs
+time the query itself; the "cached" API cases time cache hits on their own.
+Results are saved as JSON and can be compared with a stored baseline:
+
+    python -m benchmarks.suite --sizes 10k,100k --output results.json
+    python -m benchmarks.suite --sizes 10k --baseline benchmarks/baseline.json
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+import platform
+import tempfile
+import resource
+import statistics
+import subprocess
+from time import perf_counter
+from benchmarks.ledger import build_ledger, parse_size
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# every run would otherwise be a hit after the first
+NO_CACHE = {"TRACKER_RESULT_CACHE_BYTES": "0"}
+
+LIST_FILTERS = {
+    "month": {"month": "2025-06"},
+    "range": {"from": "2025-01-01", "to": "2025-03-31"},
+    "month+category": {"month": "2025-06", "category": "food"},
+    "month+amount": {"month": "2025-06", "min": 10, "max": 100},
+    "range+all filters": {
+        "from": "2024-01-01",
+        "to": "2024-12-31",
+        "category": "groceries",
+        "min": 20,
+        "max": 80,
+    },
+    "all years by amount, top 10": {
+        "from": "2020-01-01",
+        "to": "2025-12-31",
+        "sort": "amount",
+        "desc": True,
+        "limit": 10,
+    },
+    "month by category": {"month": "2025-06", "sort": "category"},
+}
+
+SUMMARY_FILTERS = {
+    "month": {"month": "2025-06"},
+    "year": {"from": "2024-01-01", "to": "2024-12-31"},
+    "partial months": {"from": "2024-01-15", "to": "2024-04-10"},
+    "year+category": {"from": "2024-01-01", "to": "2024-12-31", "category": "rent"},
+}
+
+CLI_COMMANDS = {
+    "add": ["add", "--category", "Food", "--amount", "12.5", "--date", "2025-06-15"],
+    "list month": ["list", "--month", "2025-06"],
+    "list range csv": [
+        "list",
+        "--from",
+        "2025-01-01",
+        "--to",
+        "2025-03-31",
+        "--format",
+        "csv",
+    ],
+    "list top 10 by amount": [
+        "list",
+        "--from",
+        "2020-01-01",
+        "--to",
+        "2025-12-31",
+        "--sort",
+        "amount",
+        "--desc",
+        "--limit",
+        "10",
+    ],
+    "summary month": ["summary", "--month", "2025-06"],
+    "summary year csv": [
+        "summary",
+        "--from",
+        "2024-01-01",
+        "--to",
+        "2024-12-31",
+        "--format",
+        "csv",
+    ],
+}
+
+
+def _io_written(pid="self") -> int:
+    """
+    Bytes passed to write() by a process so far (0 where /proc is unavailable).
+    """
+    try:
+        with open(f"/proc/{pid}/io", "r") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _reset_peak_rss() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_kb() -> int:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _stats(timings: list[float], peak_rss_kb: int, written: int) -> dict:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))]
+    return {
+        "runs": len(timings),
+        "p50_ms": round(statistics.median(timings) * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "peak_rss_kb": peak_rss_kb,
+        "bytes_written": written // len(timings),
+    }
+
+
+def measure_api(func, repeat: int) -> dict:
+    """
+    Time a function called with the run number, in this process.
+
+    Args:
+        func: Callable taking the run number
+        repeat: Number of runs
+
+    Returns:
+        dict: runs, p50_ms, p95_ms, peak_rss_kb and bytes_written per run
+    """
+    _reset_peak_rss()
+    written = _io_written()
+    timings = []
+    for run in range(repeat):
+        start = perf_counter()
+        func(run)
+        timings.append(perf_counter() - start)
+    return _stats(timings, _peak_rss_kb(), _io_written() - written)
+
+
+def measure_cli(argv: list[str], repeat: int, cwd: str) -> dict:
+    """
+    Time 'python -m tracker' with the given arguments.
+
+    Args:
+        argv: Command line arguments
+        repeat: Number of runs
+        cwd: Directory holding the ledger
+
+    Returns:
+        dict: runs, p50_ms, p95_ms, peak_rss_kb and bytes_written per run
+    """
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, TRACKER_DAEMON="0", **NO_CACHE)
+    timings = []
+    peak_rss = 0
+    written = 0
+    for _ in range(repeat):
+        start = perf_counter()
+        child = subprocess.Popen(
+            [sys.executable, "-m", "tracker", *argv],
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+        # wait without reaping so the child's I/O counters can still be read
+        os.waitid(os.P_PID, child.pid, os.WEXITED | os.WNOWAIT)
+        timings.append(perf_counter() - start)
+        written += _io_written(child.pid)
+        _, status, usage = os.wait4(child.pid, 0)
+        child.returncode = os.waitstatus_to_exitcode(status)
+        if child.returncode != 0:
+            raise RuntimeError(f"'tracker {' '.join(argv)}' failed")
+        peak_rss = max(peak_rss, usage.ru_maxrss)
+    return _stats(timings, peak_rss, written)
+
+
+def run_api(rows: int, repeat: int) -> dict:
+    """
+    Generate a ledger in ./data and benchmark the API cases against it.
+
+    Args:
+        rows: Number of expenses in the ledger
+        repeat: Runs per API case
+
+    Returns:
+        dict: Results keyed by case name
+    """
+    from tracker.service import ExpenseService
+    from tracker.utils import (
+        format_table,
+        format_list_csv,
+        print_summary,
+        format_summary_csv,
+    )
+
+    results = {}
+    start = perf_counter()
+    build_ledger(rows)
+    results["build ledger"] = _stats([perf_counter() - start], _peak_rss_kb(), 0)
+
+    results["api: first list (builds indexes)"] = measure_api(
+        lambda run: ExpenseService.list_expenses(LIST_FILTERS["month"]), 1
+    )
+    results["api: first summary (builds rollup)"] = measure_api(
+        lambda run: ExpenseService.summarize_expenses(SUMMARY_FILTERS["month"]), 1
+    )
+
+    rng = random.Random(rows)
+    ids = [
+        exp["id"]
+        for exp in ExpenseService.list_expenses(
+            {"from": "2024-01-01", "to": "2024-12-31"}
+        )
+    ]
+    rng.shuffle(ids)
+    to_edit = ids[:repeat]
+    to_delete = ids[repeat : 2 * repeat]
+
+    results["api: add"] = measure_api(
+        lambda run: ExpenseService.add_expense("2025-06-15", "Food", 12.5, "N/A"),
+        repeat,
+    )
+    results["api: edit"] = measure_api(
+        lambda run: ExpenseService.edit_expense(
+            to_edit[run], None, None, float(run + 1), None
+        ),
+        repeat,
+    )
+    results["api: delete"] = measure_api(
+        lambda run: ExpenseService.delete_expense(to_delete[run]), repeat
+    )
+
+    for name, filters in LIST_FILTERS.items():
+        results[f"api: list {name}"] = measure_api(
+            lambda run: ExpenseService.list_expenses(filters), repeat
+        )
+    for name, filters in SUMMARY_FILTERS.items():
+        results[f"api: summary {name}"] = measure_api(
+            lambda run: ExpenseService.summarize_expenses(filters), repeat
+        )
+
+    os.environ.pop("TRACKER_RESULT_CACHE_BYTES")
+    results["api: list month, cached"] = measure_api(
+        lambda run: ExpenseService.list_expenses(LIST_FILTERS["month"]), repeat
+    )
+    results["api: summary month, cached"] = measure_api(
+        lambda run: ExpenseService.summarize_expenses(SUMMARY_FILTERS["month"]),
+        repeat,
+    )
+    os.environ.update(NO_CACHE)
+
+    month = ExpenseService.list_expenses(LIST_FILTERS["month"])
+    year = ExpenseService.list_expenses(SUMMARY_FILTERS["year"])
+    summary = ExpenseService.summarize_expenses(SUMMARY_FILTERS["year"])
+    results["format: table, one month"] = measure_api(
+        lambda run: list(format_table(month)), repeat
+    )
+    results["format: list csv, one year"] = measure_api(
+        lambda run: list(format_list_csv(year)), repeat
+    )
+    results["format: summary table"] = measure_api(
+        lambda run: list(print_summary(summary)), repeat
+    )
+    results["format: summary csv"] = measure_api(
+        lambda run: list(format_summary_csv(summary)), repeat
+    )
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """
+    Print the p50 change of every case against a baseline.
+
+    Args:
+        results: Results of this run
+        baseline: Results of an earlier run
+        threshold: Relative p50 slowdown reported as a regression (0.2 = 20%)
+
+    Returns:
+        bool: Whether any case regressed beyond the threshold
+    """
+    regressed = False
+    print(f"\n{'size':<6} {'case':<42} {'base p50':>10} {'p50':>10} {'change':>8}")
+    for size, cases in results["sizes"].items():
+        for name, current in cases.items():
+            before = baseline.get("sizes", {}).get(size, {}).get(name)
+            if not before or not before["p50_ms"]:
+                continue
+            change = current["p50_ms"] / before["p50_ms"] - 1
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressed = True
+            print(
+                f"{size:<6} {name:<42} {before['p50_ms']:>10.2f} {current['p50_ms']:>10.2f} {change:>+7.0%}{flag}"
+            )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", default="10k,100k", help="comma-separated: 10k, 100k, 1m, 10m"
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="runs per API case")
+    parser.add_argument("--cli-repeat", type=int, default=5, help="runs per CLI case")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with this results file")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="p50 slowdown that fails"
+    )
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run_api(parse_size(args.worker), args.repeat), sys.stdout)
+        return
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": os.environ.get("TRACKER_STORAGE", "journal"),
+            "repeat": args.repeat,
+            "cli_repeat": args.cli_repeat,
+        },
+        "sizes": {},
+    }
+    for size in args.sizes.split(","):
+        size = size.strip().lower()
+        print(f"Benchmarking {size} expenses...", file=sys.stderr)
+        with tempfile.TemporaryDirectory() as cwd:
+            worker = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.suite",
+                    "--worker",
+                    size,
+                    "--repeat",
+                    str(args.repeat),
+                ],
+                cwd=cwd,
+                env=dict(os.environ, PYTHONPATH=REPO_DIR, **NO_CACHE),
+                stdout=subprocess.PIPE,
+                text=True,
+                check=True,
+            )
+            cases = json.loads(worker.stdout)
+            for name, argv in CLI_COMMANDS.items():
+                cases[f"cli: {name}"] = measure_cli(argv, args.cli_repeat, cwd)
+        results["sizes"][size] = cases
+
+        print(f"\n{size} expenses")
+        print(
+            f"{'case':<42} {'p50 ms':>10} {'p95 ms':>10} {'peak RSS MB':>12} {'bytes/run':>10}"
+        )
+        for name, stats in cases.items():
+            print(
+                f"{name:<42} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f} "
+                f"{stats['peak_rss_kb'] / 1024:>12.1f} {stats['bytes_written']:>10}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+import subprocess
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    """
+    Run 'python -m tracker' in an empty directory, without a daemon and
+    without the caller's TRACKER_* settings.
+    """
+    env = {k: v for k, v in os.environ.items() if not k.startswith("TRACKER_")}
+    env.update(PYTHONPATH=REPO_DIR, TRACKER_DAEMON="0")
+
+    def run(*argv, **kwargs):
+        return subprocess.run(
+            [sys.executable, *kwargs.pop("python_args", ()), "-m", "tracker", *argv],
+            cwd=tmp_path,
+            env=env,
+            capture_output=True,
+            text=True,
+            **kwargs,
+        )
+
+    run.cwd = tmp_path
+    return run
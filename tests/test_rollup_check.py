@@ -0,0 +1,47 @@
+import json
+
+EXPENSES = [
+    ("Food", "12.5", "2025-06-02"),
+    ("Food", "40", "2025-06-10"),
+    ("Rent", "900", "2025-06-01"),
+    ("Food", "7.25", "2025-07-03"),
+]
+
+
+def _ledger(tracker):
+    for category, amount, date in EXPENSES:
+        result = tracker(
+            "add", "--category", category, "--amount", amount, "--date", date
+        )
+        assert result.returncode == 0, result.stderr
+    result = tracker("rollup", "--rebuild")
+    assert result.returncode == 0, result.stderr
+
+
+def test_check_passes_after_rebuild(tracker):
+    _ledger(tracker)
+
+    result = tracker("rollup", "--check")
+
+    assert result.returncode == 0, result.stdout
+    assert "consistent" in result.stdout
+
+
+def test_check_fails_on_corrupted_sketch_bucket(tracker):
+    _ledger(tracker)
+    path = tracker.cwd / "data" / "amounts.json"
+    state = json.loads(path.read_text())
+    bins = state["buckets"]["2025-06"]["Food"]["bins"]
+    # move one amount to the neighbouring bin: counts and totals still match
+    k = next(iter(bins))
+    bins[k] -= 1
+    if not bins[k]:
+        del bins[k]
+    bins[str(int(k) + 1)] = bins.get(str(int(k) + 1), 0) + 1
+    path.write_text(json.dumps(state))
+
+    result = tracker("rollup", "--check")
+
+    assert result.returncode == 1
+    assert "2025-06 Food" in result.stdout
+    assert "2025-07 Food" not in result.stdout
@@ -0,0 +1,43 @@
+# modules that --help must not import; see benchmarks/startup.py for the
+# time budget
+HEAVY_MODULES = (
+    "sqlite3",
+    "csv",
+    "multiprocessing",
+    "tracker.backends",
+    "tracker.daemon",
+    "tracker.service",
+    "tracker.storage",
+)
+
+
+def _imported(stderr: str) -> set[str]:
+    modules = set()
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip())
+    return modules
+
+
+def test_help_does_not_import_heavy_modules(tracker):
+    result = tracker("--help", python_args=("-X", "importtime"))
+    assert result.returncode == 0, result.stderr
+    imported = _imported(result.stderr)
+    assert "tracker.cli" in imported
+
+    heavy = sorted(
+        module
+        for module in imported
+        if any(
+            module == name or module.startswith(name + ".") for name in HEAVY_MODULES
+        )
+    )
+
+    assert heavy == []
+
+
+def test_help_creates_no_files(tracker):
+    result = tracker("--help")
+
+    assert result.returncode == 0, result.stderr
+    assert list(tracker.cwd.iterdir()) == []
@@ -1,4 +1,11 @@
-from .cli import main
+import sys
+from .client import forward
 
 if __name__ == "__main__":
+    code = forward(sys.argv[1:])
+    if code is not None:
+        sys.exit(code)
+
+    from .cli import main
+
     main()
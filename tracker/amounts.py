@@ -0,0 +1,95 @@
+from tracker.indexes import DerivedIndex
+from tracker.locking import write_lock
+from tracker.query import ALL_EXPENSES
+from tracker.sketch import add_amount, new_sketch, remove_amount
+from tracker.storage import generation, iter_expenses
+
+AMOUNTS_FILE = "./data/amounts.json"
+
+
+class AmountIndex(DerivedIndex):
+    """
+    Sketches of the amounts per (month, category), for summary percentiles.
+
+    Kept apart from the rollup so that the totals file stays small; the
+    sketches are much larger. Adding and removing an amount only touches
+    its sketch, so the index is logged: writes are appended to
+    data/amounts.log and folded into data/amounts.json once the log
+    outgrows it.
+    """
+
+    path = AMOUNTS_FILE
+    logged = True
+
+    def empty(self):
+        return {"buckets": {}}
+
+    def add(self, state, exp):
+        month = state["buckets"].setdefault(exp.date[:7], {})
+        sketch = month.get(exp.category)
+        if sketch is None:
+            sketch = month[exp.category] = new_sketch()
+        add_amount(sketch, exp.amount)
+
+    def remove(self, state, exp):
+        month_key = exp.date[:7]
+        month = state["buckets"].get(month_key, {})
+        sketch = month.get(exp.category)
+        if sketch is None:
+            return
+        remove_amount(sketch, exp.amount)
+        if sketch["count"] <= 0:
+            del month[exp.category]
+            if not month:
+                del state["buckets"][month_key]
+
+    def check(self) -> list[str]:
+        """
+        Compare the stored sketches with ones computed from the raw expenses.
+
+        Args:
+            None
+
+        Returns:
+            list[str]: A description of every sketch that differs
+        """
+        with write_lock():
+            stored = self._read() or self.empty()
+            actual = self.empty()
+            for exp in iter_expenses(ALL_EXPENSES):
+                self.add(actual, exp)
+            current = generation()
+
+        problems = []
+        if stored.get("generation") != current:
+            problems.append(
+                f"amount sketches reflect generation {stored.get('generation')}, data is at generation {current}"
+            )
+        for month in sorted(set(stored["buckets"]) | set(actual["buckets"])):
+            stored_month = stored["buckets"].get(month, {})
+            actual_month = actual["buckets"].get(month, {})
+            for cat in sorted(set(stored_month) | set(actual_month)):
+                have = stored_month.get(cat)
+                want = actual_month.get(cat)
+                if have is None or want is None:
+                    problems.append(
+                        f"{month} {cat}: amount sketch is {'missing' if have is None else 'not in the data'}"
+                    )
+                elif _differs(have, want):
+                    problems.append(
+                        f"{month} {cat}: stored amount sketch of {have['count']} amounts "
+                        f"does not match the {want['count']} stored expenses"
+                    )
+        return problems
+
+
+def _differs(have: dict, want: dict) -> bool:
+    # a sketch that once outgrew its exact values stays without them
+    return (
+        have["count"] != want["count"]
+        or have["zeros"] != want["zeros"]
+        or have["bins"] != want["bins"]
+        or have["histogram"] != want["histogram"]
+        or have["values"] is not None
+        and have["values"] != want["values"]
+    )
@@ -0,0 +1,726 @@
+import os
+import json
+import lzma
+import zlib
+import heapq
+import itertools
+from bisect import bisect_left
+from operator import itemgetter
+from tracker.storage import StorageEngine, DATA_FILE
+from tracker.config import get_int, get_setting
+from tracker.locking import atomic_open, write_lock
+from tracker.models import FIELDS, Expense, json_default
+from tracker.query import (
+    date_range,
+    sort_expenses,
+    aggregate_expenses,
+)
+from tracker.timings import count, phase, timed
+from tracker.utils import parseExpenseDate, parseExpenseNo
+
+BLOCK_DIR = "./data/blocks"
+MANIFEST_FILE = "./data/blocks/manifest.json"
+
+MANIFEST_VERSION = 1
+
+# version reported by load, as for the other engines
+DATA_VERSION = "2.0"
+
+# rows per compressed block
+BLOCK_ROWS = 4096
+
+COLUMNS = FIELDS
+
+CODECS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+# times a read looks at the manifest again after compaction removed its files
+READ_RETRIES = 5
+
+# the date range of IDs that carry no date
+ANY_DATE = ("0000-00-00", "9999-99-99")
+
+
+def _codec() -> str:
+    codec = get_setting("block_codec", "zlib")
+    if codec not in CODECS:
+        raise ValueError(
+            f"Invalid block_codec setting '{codec}'. Must be one of: {', '.join(CODECS)}."
+        )
+    return codec
+
+
+def _encode_block(expenses: list[dict], codec: str) -> bytes:
+    """
+    Compress expenses column by column, so that similar values sit together.
+
+    Args:
+        expenses: Expense dictionaries
+        codec: "zlib" or "lzma"
+
+    Returns:
+        bytes: Compressed block
+    """
+    columns = {column: [exp[column] for exp in expenses] for column in COLUMNS}
+    payload = json.dumps(columns, separators=(",", ":")).encode("utf-8")
+    return CODECS[codec][0](payload)
+
+
+def _decode_block(raw: bytes, codec: str) -> dict[str, list]:
+    return json.loads(CODECS[codec][1](raw))
+
+
+def _rows(columns: dict[str, list], keep=None) -> list[Expense]:
+    """
+    Turn decoded columns back into expense records.
+
+    Args:
+        columns: Decoded block
+        keep: Positions of the rows to return (default: all)
+
+    Returns:
+        list[Expense]: Expense records
+    """
+    values = [columns[column] for column in COLUMNS]
+    if keep is None:
+        return list(map(Expense.from_values, zip(*values)))
+    return [Expense.from_values([col[i] for col in values]) for i in keep]
+
+
+def _select(columns: dict[str, list], validated) -> list[int]:
+    """
+    Find the rows of a decoded block that match the filters, reading only
+    the date, category and amount columns.
+
+    Args:
+        columns: Decoded block
+        validated: Validated filter object
+
+    Returns:
+        list[int]: Positions of the matching rows
+    """
+    keep = range(len(columns["id"]))
+    bounds = date_range(validated)
+    if bounds:
+        first, last = bounds
+        dates = columns["date"]
+        keep = [i for i in keep if first <= dates[i] <= last]
+    if validated.category:
+        categories = columns["category"]
+        keep = [i for i in keep if categories[i].lower() == validated.category]
+    if validated.min_amount:
+        amounts = columns["amount"]
+        keep = [i for i in keep if amounts[i] >= validated.min_amount]
+    if validated.max_amount:
+        amounts = columns["amount"]
+        keep = [i for i in keep if amounts[i] <= validated.max_amount]
+    return list(keep)
+
+
+def _id_date_range(id: str) -> tuple[str, str]:
+    date = parseExpenseDate(id)
+    return (date, date) if date else ANY_DATE
+
+
+def _insertion_order(exp: dict) -> int:
+    # sequence numbers are handed out in insertion order
+    return parseExpenseNo(exp["id"]) or 0
+
+
+def _date_order(exp: dict) -> tuple[str, int]:
+    return exp["date"], _insertion_order(exp)
+
+
+def _read_tail(path: str) -> list[Expense]:
+    """
+    Read the expenses in a tail file, ignoring a torn final line.
+
+    Args:
+        path: Tail file
+
+    Returns:
+        list[Expense]: Expense records in insertion order (empty if the file is missing)
+    """
+    try:
+        with open(path, "rb") as f:
+            return _parse_tail(f)
+    except FileNotFoundError:
+        return []
+
+
+def _parse_tail(f) -> list[Expense]:
+    tail = [Expense.from_dict(json.loads(line)) for line in f if line.endswith(b"\n")]
+    count("bytes_read", f.tell())
+    return tail
+
+
+class BlockStorage(StorageEngine):
+    """
+    Compressed blocks of a few thousand rows with a zone map per block.
+
+    Rows are stored column by column and compressed with zlib or lzma (the
+    "block_codec" setting). The manifest, data/blocks/manifest.json, keeps
+    for every block its position and the smallest and largest date, amount
+    and ID date, plus a bitmap of the categories it holds, so a query
+    decompresses only the blocks whose zone map overlaps its filters, and
+    an ID lookup only those whose ID dates cover the ID's date.
+
+    New rows go to an uncompressed tail file until it holds a block's
+    worth, when the tail is sorted by date and sealed into blocks. An edit
+    or delete appends a rewritten copy of its block and leaves the old one
+    as garbage; compaction writes every row into fresh, date-clustered
+    blocks. Data files are named after the epoch that wrote them and are
+    never changed in place, except for appends, so readers holding an
+    older manifest either still find their file or retry.
+    """
+
+    def __init__(self):
+        self._checked = False
+
+    def _read_manifest(self) -> dict | None:
+        if not os.path.exists(MANIFEST_FILE):
+            return None
+        with open(MANIFEST_FILE, "r") as f:
+            data = f.read()
+        count("bytes_read", len(data))
+        try:
+            manifest = json.loads(data)
+        except json.JSONDecodeError:
+            return None
+        if manifest.get("version") != MANIFEST_VERSION:
+            return None
+        return manifest
+
+    def _write_manifest(self, manifest: dict):
+        data = json.dumps(manifest, separators=(",", ":"))
+        with atomic_open(MANIFEST_FILE, "w") as f:
+            f.write(data)
+        count("bytes_written", len(data))
+
+    def _path(self, name: str) -> str:
+        return os.path.join(BLOCK_DIR, name)
+
+    def _manifest(self) -> dict:
+        """
+        Read the manifest, creating it from the journal on first use.
+
+        Once per process the tail file is compared with the manifest, which
+        only falls behind it if a writer died between appending to the tail
+        and writing the manifest; the sequence counter and generation are
+        then brought up to date.
+
+        Args:
+            None
+
+        Returns:
+            dict: The manifest
+        """
+        manifest = self._read_manifest()
+        if manifest is not None and (self._checked or self._matches(manifest)):
+            self._checked = True
+            return manifest
+
+        with write_lock():
+            manifest = self._read_manifest()
+            if manifest is None:
+                manifest = self._seed()
+            elif not self._matches(manifest):
+                self._repair(manifest)
+        self._checked = True
+        return manifest
+
+    def _tail_size(self, manifest: dict) -> int:
+        try:
+            return os.path.getsize(self._path(manifest["tail_file"]))
+        except FileNotFoundError:
+            return 0
+
+    def _matches(self, manifest: dict) -> bool:
+        return self._tail_size(manifest) == manifest["tail_bytes"]
+
+    def _repair(self, manifest: dict):
+        tail = _read_tail(self._path(manifest["tail_file"]))
+        # rewritten without a torn final line
+        self._write_tail(manifest, tail)
+        self._committed(manifest, tail)
+
+    def _new_manifest(self) -> dict:
+        return {
+            "version": MANIFEST_VERSION,
+            "generation": 0,
+            "next_seq": 1,
+            "epoch": 1,
+            "blocks_file": "1.blocks",
+            "tail_file": "1.tail.jsonl",
+            "tail_bytes": 0,
+            "tail_rows": 0,
+            "garbage": 0,
+            "categories": [],
+            "blocks": [],
+        }
+
+    def _seed(self) -> dict:
+        """
+        Store the existing journal or legacy data as blocks.
+        """
+        from tracker.backends.journal import JournalStorage, JOURNAL_FILE
+
+        os.makedirs(BLOCK_DIR, exist_ok=True)
+        manifest = self._new_manifest()
+        if os.path.exists(JOURNAL_FILE) or os.path.exists(DATA_FILE):
+            journal = JournalStorage()
+            expenses = sorted(journal.load()["expenses"], key=_date_order)
+            self._write_blocks(manifest, expenses)
+            manifest["next_seq"] = journal.next_sequence()
+            # derived indexes remember the journal's generation
+            manifest["generation"] = journal.generation()
+        self._write_manifest(manifest)
+        return manifest
+
+    def _zone_map(self, manifest: dict, expenses: list[dict]) -> dict:
+        categories = manifest["categories"]
+        mask = 0
+        for key in {exp["category"].lower() for exp in expenses}:
+            if key not in categories:
+                categories.append(key)
+            mask |= 1 << categories.index(key)
+        dates = [exp["date"] for exp in expenses]
+        amounts = [exp["amount"] for exp in expenses]
+        id_dates = [_id_date_range(exp["id"]) for exp in expenses]
+        return {
+            "rows": len(expenses),
+            "min_date": min(dates),
+            "max_date": max(dates),
+            "min_amount": min(amounts),
+            "max_amount": max(amounts),
+            "min_id_date": min(first for first, _ in id_dates),
+            "max_id_date": max(last for _, last in id_dates),
+            "categories": mask,
+        }
+
+    def _append_block(self, manifest: dict, expenses: list[dict]) -> dict:
+        """
+        Compress expenses into a block at the end of the blocks file.
+
+        Args:
+            manifest: The manifest, whose category list may grow
+            expenses: Expense dictionaries
+
+        Returns:
+            dict: The block's manifest entry
+        """
+        codec = _codec()
+        raw = _encode_block(expenses, codec)
+        with open(self._path(manifest["blocks_file"]), "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        count("bytes_written", len(raw))
+        entry = {"offset": offset, "length": len(raw), "codec": codec}
+        entry.update(self._zone_map(manifest, expenses))
+        return entry
+
+    def _write_blocks(self, manifest: dict, expenses: list[dict]):
+        size = get_int("block_rows", BLOCK_ROWS) or BLOCK_ROWS
+        for start in range(0, len(expenses), size):
+            block = self._append_block(manifest, expenses[start : start + size])
+            manifest["blocks"].append(block)
+
+    def _write_tail(self, manifest: dict, expenses: list[dict]):
+        with atomic_open(self._path(manifest["tail_file"])) as f:
+            f.write(
+                "".join(
+                    json.dumps(exp, separators=(",", ":"), default=json_default) + "\n"
+                    for exp in expenses
+                ).encode("utf-8")
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        manifest["tail_bytes"] = self._tail_size(manifest)
+        manifest["tail_rows"] = len(expenses)
+        count("bytes_written", manifest["tail_bytes"])
+
+    def _committed(self, manifest: dict, expenses=()):
+        for exp in expenses:
+            no = parseExpenseNo(exp["id"])
+            if no is not None:
+                manifest["next_seq"] = max(manifest["next_seq"], no + 1)
+        manifest["generation"] += 1
+        self._write_manifest(manifest)
+
+    def _open_blocks(self, manifest: dict):
+        """
+        Open the blocks file, reading the manifest again if compaction has
+        replaced the file meanwhile.
+
+        Args:
+            manifest: The manifest the caller read
+
+        Returns:
+            tuple: The manifest that matches the open file, the file and the tail
+        """
+        for _ in range(READ_RETRIES):
+            try:
+                f = open(self._path(manifest["blocks_file"]), "rb")
+            except FileNotFoundError:
+                if not manifest["blocks"]:
+                    f = None
+                else:
+                    manifest = self._manifest()
+                    continue
+            # sealing removes the tail, whose rows are then in new blocks
+            try:
+                with open(self._path(manifest["tail_file"]), "rb") as tail_file:
+                    tail = _parse_tail(tail_file)
+            except FileNotFoundError:
+                if manifest["tail_bytes"]:
+                    if f:
+                        f.close()
+                    manifest = self._manifest()
+                    continue
+                tail = []
+            return manifest, f, tail
+        raise ValueError("The block storage is being compacted; please try again.")
+
+    def _read_block(self, f, entry: dict) -> dict[str, list]:
+        f.seek(entry["offset"])
+        count("bytes_read", entry["length"])
+        return _decode_block(f.read(entry["length"]), entry["codec"])
+
+    def _candidates(self, manifest: dict, validated) -> list[dict]:
+        """
+        Skip the blocks whose zone map rules out every row.
+
+        Args:
+            manifest: The manifest
+            validated: Validated filter object
+
+        Returns:
+            list[dict]: Manifest entries of the blocks to read
+        """
+        bounds = date_range(validated)
+        bit = None
+        if validated.category:
+            if validated.category not in manifest["categories"]:
+                count("blocks_skipped", len(manifest["blocks"]))
+                return []
+            bit = 1 << manifest["categories"].index(validated.category)
+
+        blocks = []
+        for entry in manifest["blocks"]:
+            if bounds and (
+                entry["max_date"] < bounds[0] or entry["min_date"] > bounds[1]
+            ):
+                continue
+            if bit is not None and not entry["categories"] & bit:
+                continue
+            if validated.min_amount and entry["max_amount"] < validated.min_amount:
+                continue
+            if validated.max_amount and entry["min_amount"] > validated.max_amount:
+                continue
+            blocks.append(entry)
+        count("blocks_scanned", len(blocks))
+        count("blocks_skipped", len(manifest["blocks"]) - len(blocks))
+        return blocks
+
+    def _scan(self, validated) -> list[dict]:
+        """
+        Get the expenses matching the filters, in no particular order.
+        """
+        manifest, f, tail = self._open_blocks(self._manifest())
+        matched = []
+        with phase("load"):
+            if f is not None:
+                with f:
+                    for entry in self._candidates(manifest, validated):
+                        columns = self._read_block(f, entry)
+                        count("rows_scanned", entry["rows"])
+                        matched.extend(_rows(columns, _select(columns, validated)))
+            count("rows_scanned", len(tail))
+            columns = {column: [exp[column] for exp in tail] for column in COLUMNS}
+            matched.extend(_rows(columns, _select(columns, validated)))
+        count("rows_matched", len(matched))
+        return matched
+
+    def _locate(self, manifest: dict, f, tail: list[dict], id: str):
+        """
+        Find the block or tail holding an expense.
+
+        Returns:
+            tuple: The block's manifest entry (None for the tail), its
+                expenses and the expense's position among them, or None
+        """
+        for n, exp in enumerate(tail):
+            if exp["id"] == id:
+                return None, tail, n
+        if f is None:
+            return None
+        first, last = _id_date_range(id)
+        for entry in manifest["blocks"]:
+            if entry["max_id_date"] < first or entry["min_id_date"] > last:
+                continue
+            count("blocks_scanned")
+            columns = self._read_block(f, entry)
+            if id in columns["id"]:
+                return entry, _rows(columns), columns["id"].index(id)
+        return None
+
+    def _rewrite(self, manifest: dict, entry: dict | None, expenses: list[dict]):
+        """
+        Store the new content of the tail or of a block.
+        """
+        if entry is None:
+            self._write_tail(manifest, expenses)
+            return
+        position = manifest["blocks"].index(entry)
+        manifest["garbage"] += entry["length"]
+        if expenses:
+            manifest["blocks"][position] = self._append_block(manifest, expenses)
+        else:
+            del manifest["blocks"][position]
+
+    def _change(self, id: str, change) -> bool:
+        with write_lock():
+            manifest, f, tail = self._open_blocks(self._manifest())
+            try:
+                found = self._locate(manifest, f, tail, id)
+            finally:
+                if f:
+                    f.close()
+            if found is not None:
+                entry, expenses, position = found
+                change(expenses, position)
+                self._rewrite(manifest, entry, expenses)
+            self._committed(manifest)
+        return found is not None
+
+    def save(self, expense_dict):
+        self.save_many([expense_dict])
+        return expense_dict
+
+    def save_many(self, expense_dicts):
+        with write_lock():
+            manifest = self._manifest()
+            tail_file = self._path(manifest["tail_file"])
+            tail_rows = manifest["tail_rows"]
+            if tail_rows + len(expense_dicts) >= (
+                get_int("block_rows", BLOCK_ROWS) or BLOCK_ROWS
+            ):
+                # seal the tail and the new rows into blocks, clustered by date
+                expenses = sorted(
+                    _read_tail(tail_file) + expense_dicts, key=_date_order
+                )
+                self._write_blocks(manifest, expenses)
+                manifest["epoch"] += 1
+                manifest["tail_file"] = f"{manifest['epoch']}.tail.jsonl"
+                manifest["tail_bytes"] = 0
+                manifest["tail_rows"] = 0
+                self._committed(manifest, expense_dicts)
+                if os.path.exists(tail_file):
+                    os.remove(tail_file)
+            else:
+                os.makedirs(BLOCK_DIR, exist_ok=True)
+                with open(tail_file, "ab") as f:
+                    f.truncate(manifest["tail_bytes"])
+                    f.write(
+                        "".join(
+                            json.dumps(exp, separators=(",", ":"), default=json_default)
+                            + "\n"
+                            for exp in expense_dicts
+                        ).encode("utf-8")
+                    )
+                    f.flush()
+                    os.fsync(f.fileno())
+                    count("bytes_written", f.tell() - manifest["tail_bytes"])
+                    manifest["tail_bytes"] = f.tell()
+                manifest["tail_rows"] = tail_rows + len(expense_dicts)
+                self._committed(manifest, expense_dicts)
+        return len(expense_dicts)
+
+    def update(self, expense_dict):
+        def change(expenses, position):
+            expenses[position] = expense_dict
+
+        self._change(expense_dict["id"], change)
+        return expense_dict
+
+    def delete(self, id):
+        def change(expenses, position):
+            del expenses[position]
+
+        self._change(id, change)
+        return id
+
+    def get_by_id(self, id):
+        manifest, f, tail = self._open_blocks(self._manifest())
+        try:
+            found = self._locate(manifest, f, tail, id)
+        finally:
+            if f:
+                f.close()
+        if found is None:
+            return None
+        _, expenses, position = found
+        return expenses[position]
+
+    def get_many(self, ids):
+        if any(parseExpenseDate(id) is None for id in ids):
+            return super().get_many(ids)
+        manifest, f, tail = self._open_blocks(self._manifest())
+        wanted = set(ids)
+        found = {exp["id"]: exp for exp in tail if exp["id"] in wanted}
+        if f is not None:
+            with f:
+                # each block is read once, and only if it may hold an ID
+                dates = sorted({parseExpenseDate(id) for id in wanted - found.keys()})
+                for entry in manifest["blocks"]:
+                    if len(found) == len(wanted):
+                        break
+                    i = bisect_left(dates, entry["min_id_date"])
+                    if i == len(dates) or dates[i] > entry["max_id_date"]:
+                        continue
+                    count("blocks_scanned")
+                    for exp in _rows(self._read_block(f, entry)):
+                        if exp["id"] in wanted and exp["id"] not in found:
+                            found[exp["id"]] = exp
+        return [found[id] for id in ids if id in found]
+
+    def next_sequence(self):
+        return self._manifest()["next_seq"]
+
+    def generation(self):
+        return self._manifest()["generation"]
+
+    def rebuild_indexes(self):
+        with write_lock():
+            manifest, f, tail = self._open_blocks(self._manifest())
+            manifest["categories"] = []
+            rows = len(tail)
+            if f is not None:
+                with f:
+                    for entry in manifest["blocks"]:
+                        expenses = _rows(self._read_block(f, entry))
+                        entry.update(self._zone_map(manifest, expenses))
+                        rows += len(expenses)
+                        for exp in expenses:
+                            no = parseExpenseNo(exp["id"])
+                            if no is not None:
+                                manifest["next_seq"] = max(manifest["next_seq"], no + 1)
+            manifest["tail_rows"] = len(tail)
+            self._committed(manifest, tail)
+        return rows
+
+    def _size(self, manifest: dict) -> int:
+        size = self._tail_size(manifest)
+        path = self._path(manifest["blocks_file"])
+        if os.path.exists(path):
+            size += os.path.getsize(path)
+        return size
+
+    @timed("compact")
+    def compact(self, if_needed=False):
+        with write_lock():
+            manifest = self._manifest()
+            live = sum(entry["length"] for entry in manifest["blocks"])
+            if if_needed and manifest["garbage"] <= live:
+                return None
+            before = self._size(manifest)
+            old_files = [manifest["blocks_file"], manifest["tail_file"]]
+
+            manifest, f, tail = self._open_blocks(manifest)
+            expenses = tail
+            if f is not None:
+                with f:
+                    for entry in manifest["blocks"]:
+                        expenses.extend(_rows(self._read_block(f, entry)))
+            expenses.sort(key=_date_order)
+
+            manifest["epoch"] += 1
+            manifest["blocks_file"] = f"{manifest['epoch']}.blocks"
+            manifest["tail_file"] = f"{manifest['epoch']}.tail.jsonl"
+            manifest["tail_bytes"] = manifest["tail_rows"] = 0
+            manifest["garbage"] = 0
+            manifest["categories"] = []
+            manifest["blocks"] = []
+            self._write_blocks(manifest, expenses)
+            # the rows are unchanged, so the generation stays the same and
+            # derived indexes and cached results remain valid
+            self._write_manifest(manifest)
+            # readers still holding the old files keep reading them
+            for name in old_files:
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+        return before, self._size(manifest)
+
+    @timed("load")
+    def load(self):
+        manifest, f, tail = self._open_blocks(self._manifest())
+        expenses = list(tail)
+        if f is not None:
+            with f:
+                for entry in manifest["blocks"]:
+                    expenses.extend(_rows(self._read_block(f, entry)))
+        expenses.sort(key=_insertion_order)
+        return {"version": DATA_VERSION, "expenses": expenses}
+
+    def iter_expenses(self, validated):
+        """
+        Lazily yield the expenses matching the filters in date order.
+
+        The matches of each block and of the tail are sorted on their own
+        and merged. Blocks are taken in order of their smallest date and
+        only decoded once the merge reaches that date, so with the
+        date-clustered blocks left by compaction only a block or two is
+        held at a time.
+        """
+        manifest, f, tail = self._open_blocks(self._manifest())
+        pending = sorted(
+            self._candidates(manifest, validated), key=itemgetter("min_date")
+        )
+        pending.reverse()
+        heap = []
+        runs = itertools.count()
+
+        def start(expenses):
+            count("rows_matched", len(expenses))
+            run = iter(sorted(expenses, key=_date_order))
+            first = next(run, None)
+            if first is not None:
+                heapq.heappush(heap, (_date_order(first), next(runs), first, run))
+
+        count("rows_scanned", len(tail))
+        columns = {column: [exp[column] for exp in tail] for column in COLUMNS}
+        start(_rows(columns, _select(columns, validated)))
+        try:
+            while heap or pending:
+                # a block only holds rows from its smallest date on
+                while pending and (
+                    not heap or pending[-1]["min_date"] <= heap[0][0][0]
+                ):
+                    entry = pending.pop()
+                    columns = self._read_block(f, entry)
+                    count("rows_scanned", entry["rows"])
+                    start(_rows(columns, _select(columns, validated)))
+                if not heap:
+                    continue
+                _, n, exp, run = heap[0]
+                yield exp
+                following = next(run, None)
+                if following is None:
+                    heapq.heappop(heap)
+                else:
+                    heapq.heapreplace(heap, (_date_order(following), n, following, run))
+        finally:
+            if f is not None:
+                f.close()
+
+    def query(self, validated):
+        # ties keep insertion order, as with the other engines
+        expenses = sorted(self._scan(validated), key=_insertion_order)
+        return sort_expenses(expenses, validated)
+
+    def aggregate(self, validated):
+        return aggregate_expenses(sorted(self._scan(validated), key=_date_order))
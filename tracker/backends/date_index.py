@@ -0,0 +1,225 @@
+import os
+import json
+import pickle
+import threading
+from bisect import bisect_left, bisect_right
+from tracker.backends.file_id import file_id
+from tracker.locking import atomic_open
+from tracker.timings import count, timed
+
+INDEX_VERSION = 4
+
+
+class DateIndex:
+    """
+    Persisted, date-sorted index over the journal.
+
+    For every live expense the index keeps its date, the byte offset of the
+    journal line holding its current state, and the offset of the line that
+    first added it (its insertion order). The index remembers how far into
+    the journal it has read, so after adds, edits and deletes only the new
+    journal lines are applied; adds themselves never touch the index.
+    The in-memory state is updated in place, so reads and refreshes from
+    the daemon's connection threads take turns.
+    """
+
+    def __init__(self, journal_file: str, index_file: str):
+        self.journal_file = journal_file
+        self.index_file = index_file
+        self.state = None
+        self._lock = threading.RLock()
+
+    def _empty_state(self, journal_id: int) -> dict:
+        return {
+            "version": INDEX_VERSION,
+            "file_id": journal_id,
+            "size": 0,
+            "dates": [],
+            "offsets": [],
+            "orders": [],
+            "ids": [],
+            "id_dates": {},
+        }
+
+    def _read_state(self) -> dict | None:
+        if not os.path.exists(self.index_file):
+            return None
+        try:
+            with open(self.index_file, "rb") as f:
+                state = pickle.load(f)
+                count("bytes_read", f.tell())
+        except (pickle.UnpicklingError, EOFError):
+            return None
+        if state.get("version") != INDEX_VERSION:
+            return None
+        return state
+
+    def _write_state(self):
+        data = pickle.dumps(self.state, protocol=pickle.HIGHEST_PROTOCOL)
+        with atomic_open(self.index_file) as f:
+            f.write(data)
+        count("bytes_written", len(data))
+
+    def _remove(self, id: str) -> int | None:
+        state = self.state
+        date = state["id_dates"].pop(id, None)
+        if date is None:
+            return None
+        lo = bisect_left(state["dates"], date)
+        hi = bisect_right(state["dates"], date)
+        pos = state["ids"].index(id, lo, hi)
+        for key in ("dates", "offsets", "ids"):
+            del state[key][pos]
+        return state["orders"].pop(pos)
+
+    def _insert(self, id: str, date: str, offset: int, order: int):
+        state = self.state
+        # rows of one date stay in insertion order, as after a rebuild
+        lo = bisect_left(state["dates"], date)
+        hi = bisect_right(state["dates"], date)
+        pos = bisect_right(state["orders"], order, lo, hi)
+        state["dates"].insert(pos, date)
+        state["offsets"].insert(pos, offset)
+        state["orders"].insert(pos, order)
+        state["ids"].insert(pos, id)
+        state["id_dates"][id] = date
+
+    def _rebuild(self, f, journal_id: int):
+        """
+        Build the index from the whole journal with a single sort.
+        """
+        entries = {}
+        offset = 0
+        f.seek(0)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            record = json.loads(line)
+            op = record["op"]
+            if op in ("add", "update"):
+                exp = record["expense"]
+                order = entries[exp["id"]][2] if exp["id"] in entries else offset
+                entries[exp["id"]] = (exp["date"], offset, order)
+            elif op == "delete":
+                entries.pop(record["id"], None)
+            offset += len(line)
+        count("bytes_read", offset)
+
+        ordered = sorted(entries.items(), key=lambda item: (item[1][0], item[1][2]))
+        self.state = self._empty_state(journal_id)
+        self.state["size"] = offset
+        self.state["ids"] = [id for id, _ in ordered]
+        self.state["dates"] = [entry[0] for _, entry in ordered]
+        self.state["offsets"] = [entry[1] for _, entry in ordered]
+        self.state["orders"] = [entry[2] for _, entry in ordered]
+        self.state["id_dates"] = {id: entry[0] for id, entry in ordered}
+
+    def _catch_up(self, f):
+        """
+        Apply journal lines written since the index was last saved.
+        """
+        offset = self.state["size"]
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            record = json.loads(line)
+            op = record["op"]
+            if op in ("add", "update"):
+                exp = record["expense"]
+                order = self._remove(exp["id"])
+                if order is None:
+                    order = offset
+                self._insert(exp["id"], exp["date"], offset, order)
+            elif op == "delete":
+                self._remove(record["id"])
+            offset += len(line)
+        count("bytes_read", offset - self.state["size"])
+        self.state["size"] = offset
+
+    @timed("index")
+    def refresh(self):
+        """
+        Bring the index up to date with the journal and persist it if it changed.
+
+        The index is rebuilt from scratch when it is missing, unreadable, or
+        was built from a journal file that has since been replaced (e.g. by
+        compaction) or truncated. The journal is read through one open file,
+        so the offsets and the file ID recorded always belong together.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock, open(self.journal_file, "rb") as f:
+            stat = os.fstat(f.fileno())
+            journal_id = file_id(f)
+            if self.state is None:
+                self.state = self._read_state()
+
+            if (
+                self.state is None
+                or self.state["file_id"] != journal_id
+                or self.state["size"] > stat.st_size
+            ):
+                self._rebuild(f, journal_id)
+            elif self.state["size"] < stat.st_size:
+                self._catch_up(f)
+            else:
+                return
+            self._write_state()
+
+    def rebuild(self):
+        """
+        Discard the index and rebuild it from the whole journal.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.state = None
+            if os.path.exists(self.index_file):
+                os.remove(self.index_file)
+            self.refresh()
+
+    def scan(self, first: str | None = None, last: str | None = None) -> list[int]:
+        """
+        Get the journal offsets of expenses in date order, optionally within a range.
+
+        Args:
+            first: First date of the range in YYYY-MM-DD format (inclusive, optional)
+            last: Last date of the range in YYYY-MM-DD format (inclusive, optional)
+
+        Returns:
+            list[int]: Journal offsets of the current records, sorted by date
+        """
+        with self._lock:
+            self.refresh()
+            state = self.state
+            lo = bisect_left(state["dates"], first) if first else 0
+            hi = bisect_right(state["dates"], last) if last else len(state["dates"])
+            return state["offsets"][lo:hi]
+
+    def lookup(self, first: str, last: str) -> list[int]:
+        """
+        Find the journal offsets of expenses dated within a range.
+
+        Args:
+            first: First date of the range in YYYY-MM-DD format (inclusive)
+            last: Last date of the range in YYYY-MM-DD format (inclusive)
+
+        Returns:
+            list[int]: Journal offsets of the current records, in insertion order
+        """
+        with self._lock:
+            self.refresh()
+            state = self.state
+            lo = bisect_left(state["dates"], first)
+            hi = bisect_right(state["dates"], last)
+            matched = sorted(zip(state["orders"][lo:hi], state["offsets"][lo:hi]))
+        return [offset for _, offset in matched]
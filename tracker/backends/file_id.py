@@ -0,0 +1,28 @@
+import os
+import hashlib
+
+# the header line is well within this
+HEAD_SIZE = 512
+
+
+def file_id(f) -> int:
+    """
+    Identify the journal file that is open as f.
+
+    The indexes and the ledger cache record which journal they describe by
+    this ID. The inode number alone is not enough: compaction replaces the
+    journal, and the inode of a deleted file is soon handed out again. The
+    ID therefore also covers the header line, which records the snapshot a
+    compacted journal starts from. The file position is left unchanged.
+
+    Args:
+        f: Journal opened in binary mode
+
+    Returns:
+        int: 64-bit file ID
+    """
+    head = os.pread(f.fileno(), HEAD_SIZE, 0)
+    header = head[: head.find(b"\n") + 1]
+    inode = os.fstat(f.fileno()).st_ino
+    digest = hashlib.blake2b(inode.to_bytes(8, "little") + header, digest_size=8)
+    return int.from_bytes(digest.digest(), "little")
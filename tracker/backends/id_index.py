@@ -0,0 +1,253 @@
+import os
+import json
+import struct
+from tracker.locking import atomic_open, write_lock
+from tracker.backends.file_id import file_id
+from tracker.utils import parseExpenseNo
+from tracker.timings import count, timed
+
+MAGIC = b"EXPIDX03"
+
+# magic, journal file ID, journal bytes covered, next sequence number, generation
+HEADER = struct.Struct("<8sQQQQ")
+SLOT = struct.Struct("<Q")
+
+
+class IdIndex:
+    """
+    Persisted ID to journal position index.
+
+    Expense IDs end in a unique sequence number, so the index is a flat
+    file of 8-byte slots addressed by that number, each holding the offset
+    of the journal line with the expense's current state (0 when the
+    expense is deleted). A lookup or update is a single seek.
+
+    The header stores the next sequence number, the generation (the number
+    of journal records applied, counted on from the generation in a
+    compacted journal's header, so it grows with every mutation) and how
+    far into the journal the slots are valid. Slots are flushed to disk
+    before the header, so after a crash the index simply replays the
+    journal lines past that point; an index built from another journal file
+    is rebuilt.
+    """
+
+    def __init__(self, journal_file: str, index_file: str):
+        self.journal_file = journal_file
+        self.index_file = index_file
+        self.journal_id = 0
+        self.size = 0
+        self.next_seq = 1
+        self.generation = 0
+
+    def _read_header(self, f) -> bool:
+        f.seek(0)
+        raw = f.read(HEADER.size)
+        count("bytes_read", len(raw))
+        if len(raw) != HEADER.size:
+            return False
+        magic, self.journal_id, self.size, self.next_seq, self.generation = (
+            HEADER.unpack(raw)
+        )
+        return magic == MAGIC
+
+    def _write_header(self, f):
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.write(
+            HEADER.pack(
+                MAGIC, self.journal_id, self.size, self.next_seq, self.generation
+            )
+        )
+        f.flush()
+        count("bytes_written", HEADER.size)
+
+    def _apply(self, f, start: int) -> int:
+        """
+        Write slots for the journal lines from start onwards.
+
+        Returns:
+            int: Offset just past the last complete journal line
+        """
+        offset = start
+        slots = 0
+        with open(self.journal_file, "rb") as journal:
+            journal.seek(start)
+            for line in journal:
+                if not line.endswith(b"\n"):
+                    break
+                record = json.loads(line)
+                op = record["op"]
+                if op == "header":
+                    # a compacted journal carries on from its old counters
+                    self.generation = record.get("generation", self.generation)
+                    self.next_seq = max(self.next_seq, record.get("next_seq", 1))
+                    offset += len(line)
+                    continue
+                self.generation += 1
+                id = (
+                    record["expense"]["id"]
+                    if op in ("add", "update")
+                    else record.get("id")
+                )
+                no = parseExpenseNo(id) if id else None
+                if no is not None:
+                    f.seek(HEADER.size + no * SLOT.size)
+                    f.write(SLOT.pack(offset if op != "delete" else 0))
+                    slots += 1
+                    self.next_seq = max(self.next_seq, no + 1)
+                offset += len(line)
+        count("bytes_read", offset - start)
+        count("bytes_written", slots * SLOT.size)
+        return offset
+
+    def _build(self, journal_id: int):
+        """
+        Build the index from the whole journal in a new file.
+
+        The old file is replaced only once the new one is complete, so
+        readers that have it open are unaffected.
+        """
+        self.journal_id, self.size, self.next_seq = journal_id, 0, 1
+        self.generation = 0
+        with atomic_open(self.index_file, "w+b") as f:
+            self.size = self._apply(f, 0)
+            self._write_header(f)
+
+    def _journal_state(self) -> tuple[int, int]:
+        with open(self.journal_file, "rb") as journal:
+            return file_id(journal), os.fstat(journal.fileno()).st_size
+
+    @timed("index")
+    def refresh(self):
+        """
+        Bring the index up to date with the journal.
+
+        The slots are updated in place, so this takes the write lock unless
+        the index already covers the whole journal.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        journal_id, size = self._journal_state()
+        if os.path.exists(self.index_file):
+            with open(self.index_file, "rb") as f:
+                if (
+                    self._read_header(f)
+                    and self.journal_id == journal_id
+                    and self.size == size
+                ):
+                    return
+
+        with write_lock():
+            # the journal may have grown while we waited for the lock
+            journal_id, size = self._journal_state()
+            if os.path.exists(self.index_file):
+                with open(self.index_file, "r+b") as f:
+                    if (
+                        self._read_header(f)
+                        and self.journal_id == journal_id
+                        and self.size <= size
+                    ):
+                        if self.size < size:
+                            self.size = self._apply(f, self.size)
+                            self._write_header(f)
+                        return
+
+            # missing, damaged or built from another journal file
+            self._build(journal_id)
+
+    def rebuild(self):
+        """
+        Discard the index and rebuild it from the whole journal.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with write_lock():
+            self._build(self._journal_state()[0])
+
+    def lookup(self, id: str) -> int | None:
+        """
+        Find the journal offset of an expense's current record.
+
+        Args:
+            id: Expense ID
+
+        Returns:
+            int | None: Journal offset, or None if the ID is unknown or deleted
+        """
+        self.refresh()
+        no = parseExpenseNo(id)
+        if no is None:
+            return None
+        with open(self.index_file, "rb") as f:
+            # the header tells which journal file the slot belongs to
+            self._read_header(f)
+            f.seek(HEADER.size + no * SLOT.size)
+            raw = f.read(SLOT.size)
+        count("bytes_read", len(raw))
+        if len(raw) != SLOT.size:
+            return None
+        offset = SLOT.unpack(raw)[0]
+        return offset or None
+
+    def lookup_many(self, ids: list[str]) -> list[int | None]:
+        """
+        Find the journal offsets of several expenses, reading the index once.
+
+        Args:
+            ids: Expense IDs
+
+        Returns:
+            list[int | None]: Journal offset of each ID, or None if it is unknown or deleted
+        """
+        self.refresh()
+        offsets = []
+        read = 0
+        with open(self.index_file, "rb") as f:
+            self._read_header(f)
+            for id in ids:
+                no = parseExpenseNo(id)
+                if no is None:
+                    offsets.append(None)
+                    continue
+                raw = os.pread(f.fileno(), SLOT.size, HEADER.size + no * SLOT.size)
+                read += len(raw)
+                offsets.append(
+                    SLOT.unpack(raw)[0] or None if len(raw) == SLOT.size else None
+                )
+        count("bytes_read", read)
+        return offsets
+
+    def next_sequence(self) -> int:
+        """
+        Get the next unused expense sequence number.
+
+        Args:
+            None
+
+        Returns:
+            int: Next sequence number
+        """
+        self.refresh()
+        return self.next_seq
+
+    def current_generation(self) -> int:
+        """
+        Get the number of journal records written so far.
+
+        Args:
+            None
+
+        Returns:
+            int: Generation of the journal
+        """
+        self.refresh()
+        return self.generation
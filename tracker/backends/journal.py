@@ -0,0 +1,513 @@
+import os
+import sys
+import json
+import subprocess
+from itertools import batched
+from tracker.storage import StorageEngine, DATA_DIR, DATA_FILE
+from tracker.backends.date_index import DateIndex
+from tracker.backends.id_index import IdIndex
+from tracker.backends.ledger_cache import LedgerCache
+from tracker.backends.file_id import file_id
+from tracker.config import get_flag, get_int, get_setting
+from tracker.models import Expense, json_default
+from tracker.locking import (
+    write_lock,
+    file_lock,
+    on_release,
+    atomic_open,
+    truncate_torn_tail,
+    sync_through,
+)
+from tracker.utils import parseExpenseNo
+from tracker.timings import count, phase, timed
+from tracker.query import (
+    date_range,
+    iter_matching,
+    sort_expenses,
+    aggregate_expenses,
+)
+
+JOURNAL_FILE = "./data/expenses.jsonl"
+DATE_INDEX_FILE = "./data/expenses.dateidx"
+ID_INDEX_FILE = "./data/expenses.idx"
+CACHE_FILE = "./data/.expenses.cache"
+COMPACT_LOCK_FILE = "./data/.compact.lock"
+
+JOURNAL_VERSION = "2.0"
+
+# times a read looks up its offsets again after the journal was swapped
+READ_RETRIES = 5
+
+# the write-ahead log (everything after the snapshot) is compacted once it
+# holds more records or bytes than this
+COMPACT_RECORDS = 100_000
+COMPACT_BYTES = 64 * 1024 * 1024
+
+# legacy expenses converted per write when migrating
+MIGRATE_BATCH = 10_000
+
+
+def _write_records(f, records, sync=True):
+    """
+    Write journal records as JSON lines and, by default, force them to disk.
+
+    Args:
+        f: Binary file object opened for appending
+        records: Iterable of journal record dictionaries
+        sync: Whether to fsync before returning
+
+    Returns:
+        None
+    """
+    payload = "".join(
+        json.dumps(record, separators=(",", ":"), default=json_default) + "\n"
+        for record in records
+    )
+    data = payload.encode("utf-8")
+    f.write(data)
+    count("bytes_written", len(data))
+    f.flush()
+    if sync:
+        os.fsync(f.fileno())
+
+
+def _commit_window() -> float:
+    """
+    Get the group commit window from the "group_commit_ms" setting.
+
+    Args:
+        None
+
+    Returns:
+        float: Window in seconds, 0 when group commit is off
+    """
+    value = get_setting("group_commit_ms", 0)
+    try:
+        window = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid group_commit_ms setting '{value}'.")
+    if window < 0:
+        raise ValueError("The group_commit_ms setting cannot be negative.")
+    return window / 1000
+
+
+def _migrate():
+    """
+    Create the journal, converting the legacy JSON document if one exists.
+
+    The journal is written to a temporary file and renamed into place, so a
+    crash during migration leaves the legacy document untouched and the
+    migration simply runs again on the next start. The legacy document is
+    streamed, so migrating it takes memory for one batch of expenses rather
+    than for the whole file.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    if os.path.exists(JOURNAL_FILE):
+        return
+
+    with write_lock():
+        # another process may have migrated while we waited for the lock
+        if os.path.exists(JOURNAL_FILE):
+            return
+
+        with atomic_open(JOURNAL_FILE) as f:
+            header = {"op": "header", "version": JOURNAL_VERSION}
+            _write_records(f, [header], sync=False)
+            if os.path.exists(DATA_FILE):
+                from tracker.importer import iter_json_array
+
+                with open(DATA_FILE, "r") as legacy:
+                    try:
+                        for batch in batched(iter_json_array(legacy), MIGRATE_BATCH):
+                            _write_records(
+                                f,
+                                ({"op": "add", "expense": exp} for _, exp in batch),
+                                sync=False,
+                            )
+                    except ValueError:
+                        raise ValueError("Expense data file is corrupted.")
+                    count("bytes_read", os.fstat(legacy.fileno()).st_size)
+            os.fsync(f.fileno())
+
+        if os.path.exists(DATA_FILE):
+            os.replace(DATA_FILE, DATA_FILE + ".bak")
+
+
+def _append(records):
+    """
+    Append records to the journal with a single write and fsync.
+
+    A torn final line left behind by a crash mid-append was never
+    acknowledged, so it is truncated before the new records are written.
+    With a group commit window configured, the fsync is deferred until the
+    write lock is released and shared with the writers that appended in
+    the meantime (see locking.sync_through).
+
+    Args:
+        records: Iterable of journal record dictionaries to append
+
+    Returns:
+        None
+    """
+    _migrate()
+
+    window = _commit_window()
+    with write_lock(), open(JOURNAL_FILE, "a+b") as f:
+        truncate_torn_tail(f)
+        _write_records(f, records, sync=not window)
+        if window:
+            end = f.tell()
+            on_release(lambda: sync_through(JOURNAL_FILE, end, window))
+
+
+def _read_header(f) -> tuple[dict, int]:
+    """
+    Read the header record at the start of the journal.
+
+    Returns:
+        tuple[dict, int]: The header (empty if there is none) and its length in bytes
+    """
+    f.seek(0)
+    line = f.readline()
+    count("bytes_read", len(line))
+    if line.endswith(b"\n"):
+        record = json.loads(line)
+        if record.get("op") == "header":
+            return record, len(line)
+    return {}, 0
+
+
+def _snapshot(size: int) -> tuple[dict, int, int, int]:
+    """
+    Replay the complete journal lines within the first size bytes.
+
+    Args:
+        size: Journal size to replay up to
+
+    Returns:
+        tuple[dict, int, int, int]: Live expenses by ID in insertion order,
+            bytes replayed, generation and next sequence number
+    """
+    expenses = {}
+    end = 0
+    generation = 0
+    next_seq = 1
+    with open(JOURNAL_FILE, "rb") as f:
+        for line in f:
+            if end + len(line) > size or not line.endswith(b"\n"):
+                break
+            record = json.loads(line)
+            op = record["op"]
+            if op == "header":
+                generation = record.get("generation", 0)
+                next_seq = max(next_seq, record.get("next_seq", 1))
+            else:
+                generation += 1
+                if op in ("add", "update"):
+                    id = record["expense"]["id"]
+                    expenses[id] = record["expense"]
+                else:
+                    id = record["id"]
+                    expenses.pop(id, None)
+                no = parseExpenseNo(id)
+                if no is not None:
+                    next_seq = max(next_seq, no + 1)
+            end += len(line)
+    count("bytes_read", end)
+    return expenses, end, generation, next_seq
+
+
+def _fsync_dir(path: str):
+    fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _compact_in_background():
+    """
+    Start 'tracker compact --if-needed' in a detached process, unless a
+    compaction is already running.
+    """
+    with file_lock(COMPACT_LOCK_FILE, blocking=False) as free:
+        if not free:
+            return
+    subprocess.Popen(
+        [sys.executable, "-m", "tracker", "compact", "--if-needed"],
+        env=dict(os.environ, TRACKER_DAEMON="0"),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def _iter_at(f, offsets):
+    """
+    Lazily read the expenses stored on the journal lines at the given offsets.
+
+    Args:
+        f: The journal, opened in binary mode; closed once exhausted
+        offsets: Byte offsets of add or update records
+
+    Returns:
+        Iterator[Expense]: Expense records in the order of the offsets
+    """
+    read = 0
+    try:
+        with f:
+            for offset in offsets:
+                f.seek(offset)
+                line = f.readline()
+                read += len(line)
+                yield Expense.from_dict(json.loads(line)["expense"])
+    finally:
+        count("bytes_read", read)
+
+
+class JournalStorage(StorageEngine):
+    """
+    Append-only JSON Lines journal.
+
+    Adds, edits and deletes are each a single appended line. Loading
+    replays the journal, starting from the ledger cache when it is still
+    valid so that only lines written since are parsed. Queries bounded by a month or a
+    from/to range read only the matching lines, located through the date
+    index, and single expenses are found through the ID index.
+
+    Compaction rewrites the journal as a snapshot, one add record per live
+    expense, after a header that carries the generation and sequence
+    counter; the lines appended after the snapshot are the write-ahead log.
+    It runs in the background once the log passes the "compact_records" or
+    "compact_bytes" threshold.
+    """
+
+    def __init__(self):
+        self.date_index = DateIndex(JOURNAL_FILE, DATE_INDEX_FILE)
+        self.id_index = IdIndex(JOURNAL_FILE, ID_INDEX_FILE)
+        self.cache = LedgerCache(JOURNAL_FILE, CACHE_FILE)
+
+    def _locate(self, lookup, index_id):
+        """
+        Open the journal and find offsets in it through one of its indexes.
+
+        A compaction may swap in a new journal file at any moment. The file
+        is opened before the lookup, and the lookup is repeated if the index
+        turns out to describe another file, so the offsets always belong to
+        the file that is open.
+
+        Args:
+            lookup: Function that refreshes the index and returns offsets
+            index_id: Function returning the file ID of the journal the index describes
+
+        Returns:
+            tuple: The open journal and the offsets
+        """
+        for _ in range(READ_RETRIES):
+            f = open(JOURNAL_FILE, "rb")
+            offsets = lookup()
+            if index_id() == file_id(f):
+                return f, offsets
+            f.close()
+        raise ValueError("The journal is being compacted; please try again.")
+
+    def _scan(self, validated):
+        """
+        Lazily yield the expenses matching the filters, in insertion order.
+        """
+        bounds = date_range(validated)
+        if bounds is None:
+            return iter_matching(self.load()["expenses"], validated)
+
+        _migrate()
+        f, offsets = self._locate(
+            lambda: self.date_index.lookup(*bounds),
+            lambda: self.date_index.state["file_id"],
+        )
+        return iter_matching(_iter_at(f, offsets), validated)
+
+    def iter_expenses(self, validated):
+        _migrate()
+        bounds = date_range(validated) or (None, None)
+        f, offsets = self._locate(
+            lambda: self.date_index.scan(*bounds),
+            lambda: self.date_index.state["file_id"],
+        )
+        yield from iter_matching(_iter_at(f, offsets), validated)
+
+    def query(self, validated):
+        return sort_expenses(self._scan(validated), validated)
+
+    def aggregate(self, validated):
+        if date_range(validated) is None:
+            expenses = sorted(self._scan(validated), key=lambda x: x.date)
+            return aggregate_expenses(expenses)
+        # the date index yields the range in date order, one line at a time
+        return aggregate_expenses(self.iter_expenses(validated))
+
+    def _written(self):
+        """
+        Index a write and schedule a compaction if the log has grown too long.
+        """
+        self.id_index.refresh()
+        if get_flag("auto_compact", True) and self._needs_compaction():
+            on_release(_compact_in_background)
+
+    def _log_size(self) -> tuple[int, int]:
+        """
+        Count the records and bytes written since the last snapshot.
+        """
+        with open(JOURNAL_FILE, "rb") as f:
+            header, header_size = _read_header(f)
+            size = os.fstat(f.fileno()).st_size
+        base = header.get("generation", 0) + header.get("records", 0)
+        records = self.id_index.current_generation() - base
+        return records, size - header_size - header.get("bytes", 0)
+
+    def _needs_compaction(self) -> bool:
+        records, size = self._log_size()
+        max_records = get_int("compact_records", COMPACT_RECORDS)
+        max_bytes = get_int("compact_bytes", COMPACT_BYTES)
+        return (max_records and records > max_records) or (
+            max_bytes and size > max_bytes
+        )
+
+    def save(self, expense_dict):
+        _append([{"op": "add", "expense": expense_dict}])
+        self._written()
+        return expense_dict
+
+    def save_many(self, expense_dicts):
+        _append({"op": "add", "expense": exp} for exp in expense_dicts)
+        self._written()
+        return len(expense_dicts)
+
+    def update(self, expense_dict):
+        _append([{"op": "update", "expense": expense_dict}])
+        self._written()
+        return expense_dict
+
+    def delete(self, id):
+        _append([{"op": "delete", "id": id}])
+        self._written()
+        return id
+
+    def get_by_id(self, id):
+        _migrate()
+        f, offset = self._locate(
+            lambda: self.id_index.lookup(id), lambda: self.id_index.journal_id
+        )
+        if offset is None:
+            f.close()
+            return super().get_by_id(id) if parseExpenseNo(id) is None else None
+        expense = next(_iter_at(f, [offset]))
+        f.close()
+        return expense if expense["id"] == id else None
+
+    def get_many(self, ids):
+        if any(parseExpenseNo(id) is None for id in ids):
+            # only found by scanning, one at a time
+            return super().get_many(ids)
+        _migrate()
+        f, offsets = self._locate(
+            lambda: self.id_index.lookup_many(ids), lambda: self.id_index.journal_id
+        )
+        found = [(id, offset) for id, offset in zip(ids, offsets) if offset is not None]
+        expenses = list(_iter_at(f, [offset for _, offset in found]))
+        return [exp for (id, _), exp in zip(found, expenses) if exp["id"] == id]
+
+    def next_sequence(self):
+        _migrate()
+        return self.id_index.next_sequence()
+
+    def generation(self):
+        _migrate()
+        return self.id_index.current_generation()
+
+    def rebuild_indexes(self):
+        _migrate()
+        with write_lock():
+            self.id_index.rebuild()
+            self.date_index.rebuild()
+            self.cache.invalidate()
+        return len(self.date_index.state["ids"])
+
+    @timed("compact")
+    def compact(self, if_needed=False):
+        _migrate()
+        with file_lock(COMPACT_LOCK_FILE):
+            if if_needed and not self._needs_compaction():
+                return None
+            before = os.path.getsize(JOURNAL_FILE)
+
+            # the snapshot is built and written without blocking writers
+            with open(JOURNAL_FILE, "rb") as journal:
+                journal_id = file_id(journal)
+            expenses, end, generation, next_seq = _snapshot(before)
+            body = "".join(
+                json.dumps({"op": "add", "expense": exp}, separators=(",", ":")) + "\n"
+                for exp in expenses.values()
+            ).encode("utf-8")
+            header = {
+                "op": "header",
+                "version": JOURNAL_VERSION,
+                # generation before the snapshot records, so that replaying
+                # them brings the journal back to its current generation
+                "generation": generation - len(expenses),
+                "next_seq": next_seq,
+                "records": len(expenses),
+                "bytes": len(body),
+            }
+
+            tmp_file = JOURNAL_FILE + ".compact"
+            try:
+                with open(tmp_file, "wb") as f:
+                    f.write(json.dumps(header, separators=(",", ":")).encode("utf-8"))
+                    f.write(b"\n")
+                    f.write(body)
+
+                    # then the lines appended meanwhile are copied over and
+                    # the files swapped while writers wait
+                    with write_lock():
+                        with open(JOURNAL_FILE, "rb") as journal:
+                            if (
+                                file_id(journal) != journal_id
+                                or os.fstat(journal.fileno()).st_size < end
+                            ):
+                                raise ValueError(
+                                    "The journal was replaced during compaction."
+                                )
+                            journal.seek(end)
+                            tail = journal.read()
+                        count("bytes_read", len(tail))
+                        f.write(tail[: tail.rfind(b"\n") + 1])
+                        count("bytes_written", f.tell())
+                        f.flush()
+                        os.fsync(f.fileno())
+                        os.replace(tmp_file, JOURNAL_FILE)
+                        _fsync_dir(JOURNAL_FILE)
+            finally:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+
+        # the indexes and the cache follow the journal's file ID, so they are
+        # rebuilt here rather than by the next command
+        with phase("index"):
+            self.id_index.refresh()
+            self.date_index.refresh()
+            self.cache.load(JOURNAL_VERSION)
+        return before, os.path.getsize(JOURNAL_FILE)
+
+    @timed("load")
+    def load(self):
+        _migrate()
+        version, expenses = self.cache.load(JOURNAL_VERSION)
+        return {"version": version, "expenses": expenses}
@@ -0,0 +1,156 @@
+import os
+import json
+import zlib
+import marshal
+from tracker.locking import atomic_open
+from tracker.backends.file_id import file_id
+from tracker.models import Expense
+from tracker.timings import count
+
+CACHE_VERSION = 3
+
+# bytes at the end of the covered journal prefix that are checksummed
+CHECKSUM_WINDOW = 4096
+
+
+class LedgerCache:
+    """
+    Persisted copy of the replayed journal, stored with marshal, which
+    reads and writes plain tuples of strings and floats far faster than
+    JSON or pickle.
+
+    The cache holds the expenses (keyed by ID, in insertion order, each a
+    tuple of values in FIELDS order) as they stand after the first size
+    bytes of the journal, with the journal's file ID and modification time
+    and a CRC32 of the last few KiB of that prefix. A cache whose file ID, size and mtime all still match is used as
+    is. When the journal has grown, the checksum confirms the prefix is
+    unchanged and just the new lines are replayed on top of the cache, so a
+    write never has to touch the cache itself: the next load catches up and
+    rewrites it atomically. Anything else (a replaced, truncated or
+    rewritten journal) replays the whole journal.
+    """
+
+    def __init__(self, journal_file: str, cache_file: str):
+        self.journal_file = journal_file
+        self.cache_file = cache_file
+
+    def _read_state(self) -> dict | None:
+        if not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file, "rb") as f:
+                data = f.read()
+            count("bytes_read", len(data))
+            state = marshal.loads(data)
+        except (EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(state, dict) or state.get("version") != CACHE_VERSION:
+            return None
+        return state
+
+    def _write_state(self, state: dict):
+        data = marshal.dumps(state)
+        with atomic_open(self.cache_file) as f:
+            f.write(data)
+        count("bytes_written", len(data))
+
+    def _checksum(self, f, size: int) -> int:
+        start = max(size - CHECKSUM_WINDOW, 0)
+        f.seek(start)
+        count("bytes_read", size - start)
+        return zlib.crc32(f.read(size - start))
+
+    def _replay(self, f, state: dict):
+        """
+        Apply the journal lines past the cached prefix to the state.
+        """
+        f.seek(state["size"])
+        lines = f.readlines()
+        count("bytes_read", sum(map(len, lines)))
+        for lineno, line in enumerate(lines, start=state["lines"] + 1):
+            if not line.endswith(b"\n"):
+                # a torn last line is an unacknowledged write
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                raise ValueError(f"Expense journal is corrupted at line {lineno}.")
+
+            op = record.get("op")
+            if op == "header":
+                state["journal_version"] = record["version"]
+            elif op in ("add", "update"):
+                expense = Expense.from_dict(record["expense"])
+                state["expenses"][expense.id] = expense.values()
+            elif op == "delete":
+                state["expenses"].pop(record["id"], None)
+            else:
+                raise ValueError(f"Unknown journal operation '{op}' at line {lineno}.")
+            state["size"] += len(line)
+            state["lines"] += 1
+
+    def _records(self, state: dict) -> list[Expense]:
+        return list(map(Expense.from_values, state["expenses"].values()))
+
+    def load(self, default_version: str) -> tuple[str, list[Expense]]:
+        """
+        Get the current expenses, replaying only what the cache does not cover.
+
+        Args:
+            default_version: Journal version to report if the journal has no header
+
+        Returns:
+            tuple[str, list[Expense]]: Journal version and the live expenses in insertion order
+        """
+        state = self._read_state()
+        with open(self.journal_file, "rb") as f:
+            # the open file, not the path, in case compaction swaps it meanwhile
+            stat = os.fstat(f.fileno())
+            journal_id = file_id(f)
+            if (
+                state is not None
+                and state["file_id"] == journal_id
+                and state["size"] == stat.st_size
+                and state["mtime"] == stat.st_mtime_ns
+            ):
+                return state["journal_version"], self._records(state)
+
+            # an append always grows the journal, so a modified journal of
+            # the same size (or smaller) has been rewritten
+            if (
+                state is None
+                or state["file_id"] != journal_id
+                or state["size"] >= stat.st_size
+                or state["checksum"] != self._checksum(f, state["size"])
+            ):
+                state = {
+                    "version": CACHE_VERSION,
+                    "mtime": None,
+                    "file_id": journal_id,
+                    "size": 0,
+                    "lines": 0,
+                    "journal_version": default_version,
+                    "expenses": {},
+                }
+
+            covered = (state["size"], state["mtime"])
+            self._replay(f, state)
+            state["mtime"] = stat.st_mtime_ns
+            state["checksum"] = self._checksum(f, state["size"])
+
+        if (state["size"], state["mtime"]) != covered:
+            self._write_state(state)
+        return state["journal_version"], self._records(state)
+
+    def invalidate(self):
+        """
+        Discard the cache so that the next load replays the whole journal.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if os.path.exists(self.cache_file):
+            os.remove(self.cache_file)
@@ -0,0 +1,526 @@
+import os
+import re
+import json
+from tracker.storage import StorageEngine, DATA_DIR, DATA_FILE
+from tracker.locking import atomic_open, truncate_torn_tail, write_lock
+from tracker.models import Expense, json_default
+from tracker.parallel import run_parallel, use_workers
+from tracker.query import (
+    date_range,
+    iter_matching,
+    sort_expenses,
+    aggregate_expenses,
+    merge_aggregates,
+    merge_sorted,
+)
+from tracker.timings import count, timed
+from tracker.utils import parseExpenseDate, parseExpenseNo
+
+MANIFEST_FILE = "./data/partitions.json"
+
+MANIFEST_VERSION = 1
+
+# version reported by load, as for the other engines
+DATA_VERSION = "2.0"
+
+PARTITION_NAME = re.compile(r"^(\d{4}-\d{2})\.jsonl$")
+
+
+def _partition_file(month: str) -> str:
+    return os.path.join(DATA_DIR, month[:4], f"{month}.jsonl")
+
+
+def _encode(expenses) -> bytes:
+    return "".join(
+        json.dumps(exp, separators=(",", ":"), default=json_default) + "\n"
+        for exp in expenses
+    ).encode("utf-8")
+
+
+def _read_partition(month: str) -> list[Expense]:
+    """
+    Read every expense stored in a month's partition, in insertion order.
+
+    A missing partition is empty, and a torn final line (a crash in the
+    middle of an append) is ignored.
+
+    Args:
+        month: Month in YYYY-MM format
+
+    Returns:
+        list[Expense]: Expense records
+    """
+    try:
+        with open(_partition_file(month), "rb") as f:
+            expenses = [
+                Expense.from_dict(json.loads(line))
+                for line in f
+                if line.endswith(b"\n")
+            ]
+            count("bytes_read", f.tell())
+            return expenses
+    except FileNotFoundError:
+        return []
+
+
+def _partition_files() -> dict[str, int]:
+    """
+    Find the partition files on disk.
+
+    Returns:
+        dict[str, int]: Size in bytes of every partition, keyed by month
+    """
+    sizes = {}
+    if not os.path.isdir(DATA_DIR):
+        return sizes
+    for year in os.scandir(DATA_DIR):
+        if not (year.is_dir() and year.name.isdigit() and len(year.name) == 4):
+            continue
+        for entry in os.scandir(year.path):
+            match = PARTITION_NAME.match(entry.name)
+            if match and match.group(1).startswith(year.name):
+                sizes[match.group(1)] = entry.stat().st_size
+    return sizes
+
+
+def _stats(expenses: list[Expense], size: int) -> dict:
+    amounts = [exp["amount"] for exp in expenses]
+    return {
+        "rows": len(expenses),
+        "bytes": size,
+        "min_amount": min(amounts),
+        "max_amount": max(amounts),
+    }
+
+
+def _insertion_order(exp: Expense) -> int:
+    # sequence numbers are handed out in insertion order
+    return parseExpenseNo(exp.id) or 0
+
+
+def _date_order(exp: Expense) -> tuple[str, int]:
+    return exp.date, _insertion_order(exp)
+
+
+def _match_partition(month: str, validated, key) -> list[Expense]:
+    matched = iter_matching(_read_partition(month), validated)
+    return sorted(matched, key=key)
+
+
+def _query_partition(task: tuple) -> list[Expense]:
+    """
+    Filter, sort and limit one partition, in a worker process.
+
+    Args:
+        task: Month and validated filter object
+
+    Returns:
+        list[Expense]: A sorted run for merge_sorted
+    """
+    month, validated = task
+    return sort_expenses(
+        _match_partition(month, validated, _insertion_order), validated
+    )
+
+
+def _aggregate_partition(task: tuple) -> dict:
+    """
+    Compute the totals of one partition, in a worker process.
+
+    Args:
+        task: Month and validated filter object
+
+    Returns:
+        dict: Partial totals for merge_aggregates
+    """
+    month, validated = task
+    return aggregate_expenses(_match_partition(month, validated, _date_order))
+
+
+def _id_month(id: str) -> str | None:
+    date = parseExpenseDate(id)
+    return date[:7] if date else None
+
+
+class PartitionedStorage(StorageEngine):
+    """
+    One JSON Lines file per month, e.g. data/2026/2026-01.jsonl.
+
+    The manifest, data/partitions.json, lists every partition with its row
+    count, size and smallest and largest amount, together with the
+    generation and sequence counter. Queries bounded by dates open only the
+    partitions of the months they overlap, and amount filters skip the
+    partitions whose amount range lies outside them. When the partitions
+    to read hold enough rows, they are filtered and sorted or totalled in
+    a process pool, and the per-partition results are merged.
+
+    An expense is stored in the partition of its date. Its ID encodes the
+    date it was added with, so edits and deletes go straight to that one
+    partition; the few expenses whose date was later edited into another
+    month are listed in the manifest's "moved" table. Adds are appended to
+    the partition, while edits and deletes rewrite it. The manifest is
+    written last, and a manifest that does not match the partition files
+    after a crash is rebuilt from them.
+    """
+
+    def __init__(self):
+        self._checked = False
+
+    def _read_manifest(self) -> dict | None:
+        if not os.path.exists(MANIFEST_FILE):
+            return None
+        with open(MANIFEST_FILE, "r") as f:
+            data = f.read()
+        count("bytes_read", len(data))
+        try:
+            manifest = json.loads(data)
+        except json.JSONDecodeError:
+            return None
+        if manifest.get("version") != MANIFEST_VERSION:
+            return None
+        return manifest
+
+    def _write_manifest(self, manifest: dict):
+        data = json.dumps(manifest, separators=(",", ":"))
+        with atomic_open(MANIFEST_FILE, "w") as f:
+            f.write(data)
+        count("bytes_written", len(data))
+
+    def _manifest(self) -> dict:
+        """
+        Read the manifest, creating or repairing it first if needed.
+
+        Once per process the partition files are compared with the
+        manifest, which only falls behind them if a writer died between
+        writing a partition and writing the manifest.
+
+        Args:
+            None
+
+        Returns:
+            dict: The manifest
+        """
+        manifest = self._read_manifest()
+        if manifest is not None and (self._checked or self._matches(manifest)):
+            self._checked = True
+            return manifest
+
+        with write_lock():
+            # a writer may have been between its two writes, so look again
+            manifest = self._read_manifest()
+            if manifest is None:
+                manifest = self._rebuild({}) if _partition_files() else self._seed()
+            elif not self._matches(manifest):
+                manifest = self._rebuild(manifest)
+        self._checked = True
+        return manifest
+
+    def _matches(self, manifest: dict) -> bool:
+        sizes = {
+            month: entry["bytes"] for month, entry in manifest["partitions"].items()
+        }
+        return sizes == _partition_files()
+
+    def _seed(self) -> dict:
+        """
+        Partition the existing journal or legacy data into a new layout.
+
+        The partitions are written whole, so an interrupted seed is simply
+        repeated, and the manifest is written last.
+        """
+        from tracker.backends.journal import JournalStorage, JOURNAL_FILE
+
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "generation": 0,
+            "next_seq": 1,
+            "partitions": {},
+            "moved": {},
+        }
+        if os.path.exists(JOURNAL_FILE) or os.path.exists(DATA_FILE):
+            journal = JournalStorage()
+            months = {}
+            for exp in journal.load()["expenses"]:
+                months.setdefault(exp["date"][:7], []).append(exp)
+                if _id_month(exp["id"]) != exp["date"][:7]:
+                    manifest["moved"][exp["id"]] = exp["date"][:7]
+            for month, expenses in sorted(months.items()):
+                self._rewrite(manifest, month, expenses)
+            manifest["next_seq"] = journal.next_sequence()
+            # derived indexes remember the journal's generation
+            manifest["generation"] = journal.generation()
+        self._write_manifest(manifest)
+        return manifest
+
+    def _rebuild(self, old: dict) -> dict:
+        """
+        Recompute the manifest from the partition files.
+
+        An expense found in two partitions was being moved to another month
+        by an edit that did not finish; the copy the old manifest does not
+        point to is the edited one and is kept.
+
+        Args:
+            old: The previous manifest, or an empty dict
+
+        Returns:
+            dict: The new manifest, already written
+        """
+        moved = old.get("moved", {})
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "generation": old.get("generation", 0) + 1,
+            "next_seq": old.get("next_seq", 1),
+            "partitions": {},
+            "moved": {},
+        }
+
+        months = sorted(_partition_files())
+        found = {}
+        for month in months:
+            for exp in _read_partition(month):
+                found.setdefault(exp["id"], []).append(month)
+
+        stale = {}
+        for id, copies in found.items():
+            if len(copies) > 1:
+                home = moved.get(id) or _id_month(id)
+                keep = next((m for m in copies if m != home), copies[-1])
+                for month in copies:
+                    if month != keep:
+                        stale.setdefault(month, set()).add(id)
+
+        for month in months:
+            expenses = [
+                exp
+                for exp in _read_partition(month)
+                if exp["id"] not in stale.get(month, ())
+            ]
+            # rewritten, dropping any torn final line
+            self._rewrite(manifest, month, expenses)
+            for exp in expenses:
+                if _id_month(exp["id"]) != month:
+                    manifest["moved"][exp["id"]] = month
+                no = parseExpenseNo(exp["id"])
+                if no is not None:
+                    manifest["next_seq"] = max(manifest["next_seq"], no + 1)
+        self._write_manifest(manifest)
+        return manifest
+
+    def _rewrite(self, manifest: dict, month: str, expenses: list[Expense]):
+        """
+        Replace a partition's content, removing the partition when empty.
+        """
+        path = _partition_file(month)
+        if not expenses:
+            if os.path.exists(path):
+                os.remove(path)
+            manifest["partitions"].pop(month, None)
+            return
+        payload = _encode(expenses)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_open(path) as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        count("bytes_written", len(payload))
+        manifest["partitions"][month] = _stats(expenses, len(payload))
+
+    def _append(self, manifest: dict, month: str, expenses: list[Expense]):
+        """
+        Append expenses to a partition with a single write and fsync.
+        """
+        path = _partition_file(month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a+b") as f:
+            truncate_torn_tail(f)
+            payload = _encode(expenses)
+            f.write(payload)
+            count("bytes_written", len(payload))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+
+        entry = manifest["partitions"].get(month)
+        stats = _stats(expenses, size)
+        if entry is not None:
+            stats["rows"] += entry["rows"]
+            stats["min_amount"] = min(stats["min_amount"], entry["min_amount"])
+            stats["max_amount"] = max(stats["max_amount"], entry["max_amount"])
+        manifest["partitions"][month] = stats
+
+    def _home(self, manifest: dict, id: str) -> str | None:
+        """
+        Get the month of the partition holding an expense.
+
+        Args:
+            manifest: The manifest
+            id: Expense ID
+
+        Returns:
+            str | None: Month in YYYY-MM format, or None if the ID has no date
+        """
+        return manifest["moved"].get(id) or _id_month(id)
+
+    def _committed(self, manifest: dict, ids=()):
+        for id in ids:
+            no = parseExpenseNo(id)
+            if no is not None:
+                manifest["next_seq"] = max(manifest["next_seq"], no + 1)
+        manifest["generation"] += 1
+        self._write_manifest(manifest)
+
+    def save(self, expense_dict):
+        self.save_many([expense_dict])
+        return expense_dict
+
+    def save_many(self, expense_dicts):
+        with write_lock():
+            manifest = self._manifest()
+            months = {}
+            for exp in expense_dicts:
+                months.setdefault(exp["date"][:7], []).append(exp)
+                if _id_month(exp["id"]) != exp["date"][:7]:
+                    manifest["moved"][exp["id"]] = exp["date"][:7]
+            for month, expenses in months.items():
+                self._append(manifest, month, expenses)
+            self._committed(manifest, [exp["id"] for exp in expense_dicts])
+        return len(expense_dicts)
+
+    def update(self, expense_dict):
+        id = expense_dict["id"]
+        new_month = expense_dict["date"][:7]
+        with write_lock():
+            manifest = self._manifest()
+            old_month = self._home(manifest, id)
+            expenses = _read_partition(old_month) if old_month else []
+            if old_month == new_month:
+                expenses = [
+                    expense_dict if exp["id"] == id else exp for exp in expenses
+                ]
+                self._rewrite(manifest, old_month, expenses)
+            else:
+                # the new copy is written first, so a crash in between
+                # leaves two copies, which the manifest rebuild resolves
+                self._append(manifest, new_month, [expense_dict])
+                if old_month:
+                    expenses = [exp for exp in expenses if exp["id"] != id]
+                    self._rewrite(manifest, old_month, expenses)
+            if new_month == _id_month(id):
+                manifest["moved"].pop(id, None)
+            else:
+                manifest["moved"][id] = new_month
+            self._committed(manifest)
+        return expense_dict
+
+    def delete(self, id):
+        with write_lock():
+            manifest = self._manifest()
+            month = self._home(manifest, id)
+            if month:
+                expenses = [exp for exp in _read_partition(month) if exp["id"] != id]
+                self._rewrite(manifest, month, expenses)
+            manifest["moved"].pop(id, None)
+            self._committed(manifest)
+        return id
+
+    def get_by_id(self, id):
+        month = self._home(self._manifest(), id)
+        if month is None:
+            return super().get_by_id(id)
+        count("partitions_scanned")
+        for exp in _read_partition(month):
+            if exp["id"] == id:
+                return exp
+        return None
+
+    def get_many(self, ids):
+        manifest = self._manifest()
+        months = {}
+        for id in ids:
+            months.setdefault(self._home(manifest, id), set()).add(id)
+        if None in months:
+            return super().get_many(ids)
+        # each partition is read once, however many of the IDs it holds
+        found = {}
+        for month, wanted in months.items():
+            count("partitions_scanned")
+            for exp in _read_partition(month):
+                if exp["id"] in wanted:
+                    found[exp["id"]] = exp
+        return [found[id] for id in ids if id in found]
+
+    def next_sequence(self):
+        return self._manifest()["next_seq"]
+
+    def generation(self):
+        return self._manifest()["generation"]
+
+    def rebuild_indexes(self):
+        with write_lock():
+            manifest = self._rebuild(self._manifest())
+        return sum(entry["rows"] for entry in manifest["partitions"].values())
+
+    def _months(self, validated) -> tuple[list[str], int]:
+        """
+        Prune the partitions that cannot hold a match.
+
+        Args:
+            validated: Validated filter object
+
+        Returns:
+            tuple[list[str], int]: Months of the partitions to read, in
+                chronological order, and the number of rows they hold
+        """
+        partitions = self._manifest()["partitions"]
+        bounds = date_range(validated)
+        months = []
+        rows = 0
+        for month, entry in sorted(partitions.items()):
+            if bounds and not bounds[0][:7] <= month <= bounds[1][:7]:
+                continue
+            if validated.min_amount and entry["max_amount"] < validated.min_amount:
+                continue
+            if validated.max_amount and entry["min_amount"] > validated.max_amount:
+                continue
+            months.append(month)
+            rows += entry["rows"]
+        count("partitions_scanned", len(months))
+        return months, rows
+
+    def _scan(self, validated, key):
+        """
+        Lazily yield the expenses matching the filters, one partition at a
+        time, each partition's matches sorted by key.
+        """
+        for month in self._months(validated)[0]:
+            yield from _match_partition(month, validated, key)
+
+    @timed("load")
+    def load(self):
+        expenses = []
+        for month in sorted(self._manifest()["partitions"]):
+            expenses.extend(_read_partition(month))
+        expenses.sort(key=_insertion_order)
+        return {"version": DATA_VERSION, "expenses": expenses}
+
+    def iter_expenses(self, validated):
+        yield from self._scan(validated, _date_order)
+
+    def query(self, validated):
+        months, rows = self._months(validated)
+        if use_workers(rows, len(months)):
+            runs = run_parallel(_query_partition, [(m, validated) for m in months])
+            return merge_sorted(runs, validated, _insertion_order)
+        # ties keep insertion order, as with the other engines
+        expenses = sorted(self._scan(validated, _insertion_order), key=_insertion_order)
+        return sort_expenses(expenses, validated)
+
+    def aggregate(self, validated):
+        months, rows = self._months(validated)
+        if use_workers(rows, len(months)):
+            partials = run_parallel(
+                _aggregate_partition, [(m, validated) for m in months]
+            )
+            return merge_aggregates(partials)
+        return aggregate_expenses(self._scan(validated, _date_order))
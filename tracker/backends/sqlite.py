@@ -0,0 +1,339 @@
+import os
+import sqlite3
+import threading
+from itertools import batched
+from tracker.storage import StorageEngine, DATA_DIR, DATA_FILE
+from tracker.locking import write_lock
+from tracker.models import FIELDS, Expense
+from tracker.query import month_bounds
+from tracker.sketch import add_amount, new_sketch
+from tracker.timings import timed, timed_chunks
+from tracker.types import ValidatedFilters
+from tracker.utils import parseExpenseNo
+
+DB_FILE = "./data/expenses.db"
+
+SCHEMA_VERSION = "2.0"
+
+COLUMNS = FIELDS
+SELECT_COLUMNS = ", ".join(COLUMNS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    id TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    category TEXT NOT NULL,
+    category_key TEXT NOT NULL,
+    amount REAL NOT NULL,
+    note TEXT,
+    currency TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date);
+CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses(category_key, date);
+CREATE INDEX IF NOT EXISTS idx_expenses_amount ON expenses(amount);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _row_params(expense_dict: dict) -> dict:
+    """
+    Build named query parameters for an expense row.
+
+    Args:
+        expense_dict: Expense dictionary
+
+    Returns:
+        dict: Column values including the case-folded category key
+    """
+    params = {column: expense_dict[column] for column in COLUMNS}
+    params["category_key"] = expense_dict["category"].lower()
+    return params
+
+
+def _where(validated: ValidatedFilters) -> tuple[str, list]:
+    """
+    Translate validated filters into a WHERE clause.
+
+    Month filters are turned into a date range so the date index is used.
+
+    Args:
+        validated: Validated filter object
+
+    Returns:
+        tuple[str, list]: The WHERE clause (or an empty string) and its parameters
+    """
+    clauses = []
+    params = []
+    if validated.month:
+        clauses.append("date BETWEEN ? AND ?")
+        params.extend(month_bounds(validated.month))
+    if validated.from_date:
+        clauses.append("date >= ?")
+        params.append(validated.from_date)
+    if validated.to_date:
+        clauses.append("date <= ?")
+        params.append(validated.to_date)
+    if validated.category:
+        clauses.append("category_key = ?")
+        params.append(validated.category)
+    if validated.min_amount:
+        clauses.append("amount >= ?")
+        params.append(validated.min_amount)
+    if validated.max_amount:
+        clauses.append("amount <= ?")
+        params.append(validated.max_amount)
+
+    if not clauses:
+        return "", params
+    return "WHERE " + " AND ".join(clauses), params
+
+
+class SqliteStorage(StorageEngine):
+    """
+    SQLite database with indexes on date, category and amount.
+
+    Filters, sorting, limits and category totals are evaluated by SQLite,
+    so a query reads only the rows it needs.
+    """
+
+    def __init__(self):
+        # a connection may only be used on the thread that opened it, and
+        # the daemon runs commands on several
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            conn = sqlite3.connect(DB_FILE)
+            conn.executescript(SCHEMA)
+            # seeding reads the journal, which must not change meanwhile
+            with write_lock(), conn:
+                if (
+                    conn.execute("SELECT 1 FROM meta WHERE key = 'version'").fetchone()
+                    is None
+                ):
+                    self._seed(conn)
+            self._local.conn = conn
+        return conn
+
+    def _seed(self, conn: sqlite3.Connection):
+        """
+        Import existing journal or legacy data into a new database.
+
+        Runs inside the caller's transaction together with writing the
+        schema version, so an interrupted import is rolled back and retried.
+        """
+        from tracker.backends.journal import JournalStorage, JOURNAL_FILE
+
+        next_seq = 1
+        if os.path.exists(JOURNAL_FILE) or os.path.exists(DATA_FILE):
+            journal = JournalStorage()
+            conn.executemany(
+                f"INSERT INTO expenses ({SELECT_COLUMNS}, category_key) "
+                f"VALUES ({', '.join(':' + c for c in COLUMNS)}, :category_key)",
+                (_row_params(exp) for exp in journal.load()["expenses"]),
+            )
+            next_seq = journal.next_sequence()
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('version', ?)", (SCHEMA_VERSION,)
+        )
+        self._set_next_sequence(conn, next_seq)
+
+    def _bump_generation(self, conn: sqlite3.Connection):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('generation', 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def _set_next_sequence(self, conn: sqlite3.Connection, next_seq: int):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('next_seq', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = "
+            "MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))",
+            (next_seq,),
+        )
+
+    def save(self, expense_dict):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                f"INSERT INTO expenses ({SELECT_COLUMNS}, category_key) "
+                f"VALUES ({', '.join(':' + c for c in COLUMNS)}, :category_key)",
+                _row_params(expense_dict),
+            )
+            no = parseExpenseNo(expense_dict["id"])
+            if no is not None:
+                self._set_next_sequence(conn, no + 1)
+            self._bump_generation(conn)
+        return expense_dict
+
+    def save_many(self, expense_dicts):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                f"INSERT INTO expenses ({SELECT_COLUMNS}, category_key) "
+                f"VALUES ({', '.join(':' + c for c in COLUMNS)}, :category_key)",
+                (_row_params(exp) for exp in expense_dicts),
+            )
+            numbers = [parseExpenseNo(exp["id"]) for exp in expense_dicts]
+            numbers = [no for no in numbers if no is not None]
+            if numbers:
+                self._set_next_sequence(conn, max(numbers) + 1)
+            self._bump_generation(conn)
+        return len(expense_dicts)
+
+    def update(self, expense_dict):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE expenses SET "
+                + ", ".join(f"{c} = :{c}" for c in COLUMNS[1:])
+                + ", category_key = :category_key WHERE id = :id",
+                _row_params(expense_dict),
+            )
+            self._bump_generation(conn)
+        return expense_dict
+
+    def delete(self, id):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM expenses WHERE id = ?", (id,))
+            self._bump_generation(conn)
+        return id
+
+    def get_by_id(self, id):
+        row = (
+            self._connect()
+            .execute(f"SELECT {SELECT_COLUMNS} FROM expenses WHERE id = ?", (id,))
+            .fetchone()
+        )
+        return Expense.from_values(row) if row else None
+
+    def get_many(self, ids):
+        conn = self._connect()
+        found = {}
+        # within SQLite's default limit on bound parameters
+        for chunk in batched(ids, 500):
+            rows = conn.execute(
+                f"SELECT {SELECT_COLUMNS} FROM expenses "
+                f"WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            for row in rows:
+                found[row[0]] = Expense.from_values(row)
+        return [found[id] for id in ids if id in found]
+
+    def next_sequence(self):
+        row = (
+            self._connect()
+            .execute("SELECT value FROM meta WHERE key = 'next_seq'")
+            .fetchone()
+        )
+        return int(row[0]) if row else 1
+
+    def generation(self):
+        row = (
+            self._connect()
+            .execute("SELECT value FROM meta WHERE key = 'generation'")
+            .fetchone()
+        )
+        return int(row[0]) if row else 0
+
+    def rebuild_indexes(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("REINDEX expenses")
+            for (id,) in conn.execute("SELECT id FROM expenses").fetchall():
+                no = parseExpenseNo(id)
+                if no is not None:
+                    self._set_next_sequence(conn, no + 1)
+        return conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+
+    def compact(self, if_needed=False):
+        # SQLite has no log of its own to fold; VACUUM reclaims freed pages
+        if if_needed:
+            return None
+        conn = self._connect()
+        before = os.path.getsize(DB_FILE)
+        conn.execute("VACUUM")
+        return before, os.path.getsize(DB_FILE)
+
+    @timed("load")
+    def load(self):
+        conn = self._connect()
+        rows = conn.execute(f"SELECT {SELECT_COLUMNS} FROM expenses ORDER BY rowid")
+        return {
+            "version": SCHEMA_VERSION,
+            "expenses": list(map(Expense.from_values, rows)),
+        }
+
+    def iter_expenses(self, validated):
+        where, params = _where(validated)
+        cursor = self._connect().execute(
+            f"SELECT {SELECT_COLUMNS} FROM expenses {where} ORDER BY date, rowid",
+            params,
+        )
+        for row in timed_chunks(cursor, "sql", "rows_scanned"):
+            yield Expense.from_values(row)
+
+    @timed("sql")
+    def query(self, validated):
+        where, params = _where(validated)
+        direction = "DESC" if validated.sort_direction == -1 else "ASC"
+        sql = (
+            f"SELECT {SELECT_COLUMNS} FROM expenses {where} "
+            f"ORDER BY {validated.sort} {direction}, rowid"
+        )
+        if validated.limit:
+            sql += " LIMIT ?"
+            params.append(validated.limit)
+        return list(map(Expense.from_values, self._connect().execute(sql, params)))
+
+    @timed("sql")
+    def aggregate(self, validated):
+        conn = self._connect()
+        where, params = _where(validated)
+
+        category_totals = {}
+        total_amount = 0
+        count = 0
+        rows = conn.execute(
+            f"SELECT category, SUM(amount), COUNT(*) FROM expenses {where} "
+            "GROUP BY category ORDER BY MIN(date || printf('%012d', rowid))",
+            params,
+        )
+        for category, total, cat_count in rows:
+            category_totals[category] = total
+            total_amount += total
+            count += cat_count
+
+        # one row per distinct amount, which adds up to far fewer than the expenses
+        category_sketches = {category: new_sketch() for category in category_totals}
+        rows = conn.execute(
+            f"SELECT category, amount, COUNT(*) FROM expenses {where} "
+            "GROUP BY category, amount",
+            params,
+        )
+        for category, amount, n in rows:
+            add_amount(category_sketches[category], amount, n)
+
+        highest = conn.execute(
+            f"SELECT {SELECT_COLUMNS} FROM expenses {where} "
+            "ORDER BY amount DESC, date, rowid LIMIT 1",
+            params,
+        ).fetchone()
+        highest_expense = Expense.from_values(highest) if highest else None
+
+        return {
+            "grand_total": total_amount,
+            "total_expenses": count,
+            "category_totals": category_totals,
+            "category_sketches": category_sketches,
+            "highest_expense": highest_expense,
+            "currency": highest_expense["currency"] if highest_expense else None,
+        }
@@ -0,0 +1,98 @@
+from dataclasses import replace
+from tracker.models import Expense
+from tracker.postings import PostingIndex
+from tracker.timings import timed
+from tracker.types import ValidatedFilters
+
+CATEGORIES_FILE = "./data/categories.json"
+
+# a category query reading more than this share of all rows through the
+# index is left to a storage scan
+MAX_SHARE = 8
+
+
+class CategoryIndex(PostingIndex):
+    """
+    Dictionary of the case-folded categories, with a posting list per category.
+
+    The segment's category dictionary holds every stored spelling of a
+    category with the number and total of its expenses, and the posting
+    list of a case-folded category holds every one of its expenses, so
+    'tracker categories' and --category queries read neither the expenses
+    nor their category strings. Stored as data/categories.json and
+    data/categories-<build>.idx and .log; see PostingIndex.
+    """
+
+    name = "categories"
+    path = CATEGORIES_FILE
+
+    def terms(self, exp):
+        return (exp.category.lower(),)
+
+    @timed("categories")
+    def query(self, validated: ValidatedFilters) -> list[Expense] | None:
+        """
+        Answer a list query with a category filter from the posting list.
+
+        Args:
+            validated: Validated filter object
+
+        Returns:
+            list[Expense] | None: The expenses, sorted and limited like list, or None if the query has no category filter or would read too much of the ledger
+        """
+        if not validated.category:
+            return None
+        self.current()
+        matched = self._matches([(validated.category, False)])
+        # every row of the posting list is in the category already
+        return self._select(
+            matched,
+            replace(validated, category=None),
+            max_rows=(self._segment.rows + len(self._delta.docs)) // MAX_SHARE,
+        )
+
+    @timed("categories")
+    def totals(self) -> list[tuple[str, int, float]]:
+        """
+        Get the number and total of the expenses in every category.
+
+        Categories differing only in case are counted together, under
+        their most used spelling.
+
+        Args:
+            None
+
+        Returns:
+            list[tuple[str, int, float]]: Category, count and total, largest total first
+        """
+        self.current()
+        segment, delta = self._segment, self._delta
+        # count and total of every spelling
+        spellings = {
+            category: [n, amount]
+            for category, n, amount in zip(
+                segment.categories, segment.category_counts, segment.category_totals
+            )
+        }
+
+        def tally(category: str, n: int, amount: float):
+            stats = spellings.setdefault(category, [0, 0])
+            stats[0] += n
+            stats[1] += amount
+
+        for no in delta.removed:
+            if segment.has(no):
+                tally(segment.categories[segment.codes[no]], -1, -segment.amounts[no])
+        for _, _, category, amount, _ in delta.docs.values():
+            tally(category, 1, amount)
+
+        categories = {}
+        for category, (n, amount) in spellings.items():
+            if n:
+                name, total_n, total = categories.get(
+                    category.lower(), (category, 0, 0)
+                )
+                if n > spellings[name][0]:
+                    name = category
+                categories[category.lower()] = (name, total_n + n, total + amount)
+        return sorted(categories.values(), key=lambda row: (-row[2], row[0]))
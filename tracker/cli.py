@@ -6,16 +6,16 @@ from tracker.utils import (
     format_summary_csv,
     format_table,
     format_list_csv,
+    write_lines,
 )
-from tracker.logger import logger
 
 
-def main():
+def main(argv=None):
     """
     Parse command line arguments and route to appropriate command handler.
 
     Args:
-        None (uses sys.argv from command line)
+        argv: Command line arguments (defaults to sys.argv)
 
     Returns:
         None
@@ -75,6 +75,38 @@ def main():
         help="view in descending order; default is ascending",
     )
 
+    # search subcommand
+    parser_search = subparsers.add_parser(
+        "search", help="find expenses by words in their note or category"
+    )
+    parser_search.add_argument(
+        "query",
+        nargs="+",
+        help="words that must all match; OR between alternatives, word* for a prefix",
+    )
+    parser_search.add_argument(
+        "--month", type=str, help="filter by that month - format: YYYY-MM"
+    )
+    parser_search.add_argument(
+        "--from", type=str, help="from the day of the month - format: YYYY-MM-DD"
+    )
+    parser_search.add_argument(
+        "--to", type=str, help="to the day of the month - format: YYYY-MM-DD"
+    )
+    parser_search.add_argument("--category", type=str, help="filter by category name")
+    parser_search.add_argument("--min", type=float, help="filter by min amount")
+    parser_search.add_argument("--max", type=float, help="filter by max amount")
+    parser_search.add_argument(
+        "--sort", type=str, help="one of: date, amount, category (default: date)"
+    )
+    parser_search.add_argument("--limit", type=int, help="integer limit")
+    parser_search.add_argument("--format", type=str, help="view in table or csv format")
+    parser_search.add_argument(
+        "--desc",
+        action="store_true",
+        help="view in descending order; default is ascending",
+    )
+
     # summary subcommand
     parser_summary = subparsers.add_parser("summary", help="show summary with filters")
     parser_summary.add_argument(
@@ -91,7 +123,89 @@ def main():
         "--format", type=str, help="view in table or csv format"
     )
 
-    args = parser.parse_args()
+    # export subcommand
+    parser_export = subparsers.add_parser(
+        "export", help="stream expenses to a CSV or JSONL file"
+    )
+    parser_export.add_argument(
+        "--file", type=str, help="output file (default: standard output)"
+    )
+    parser_export.add_argument("--format", type=str, help="csv or jsonl (default: csv)")
+    parser_export.add_argument(
+        "--month", type=str, help="filter by that month - format: YYYY-MM"
+    )
+    parser_export.add_argument(
+        "--from", type=str, help="from the day of the month - format: YYYY-MM-DD"
+    )
+    parser_export.add_argument(
+        "--to", type=str, help="to the day of the month - format: YYYY-MM-DD"
+    )
+    parser_export.add_argument("--category", type=str, help="filter by category name")
+    parser_export.add_argument("--min", type=float, help="filter by min amount")
+    parser_export.add_argument("--max", type=float, help="filter by max amount")
+
+    # import subcommand
+    parser_import = subparsers.add_parser(
+        "import", help="bulk import expenses from a CSV, JSONL or JSON file"
+    )
+    parser_import.add_argument(
+        "--file", type=str, help="path of the file to import", required=True
+    )
+    parser_import.add_argument(
+        "--format", type=str, help="csv, jsonl or json (default: from file extension)"
+    )
+    parser_import.add_argument(
+        "--batch-size",
+        type=int,
+        help="commit every N rows to bound memory use (default: one commit)",
+    )
+    parser_import.add_argument(
+        "--errors", type=str, help="write rejected rows to this CSV file"
+    )
+
+    # rollup subcommand
+    parser_rollup = subparsers.add_parser(
+        "rollup", help="show, rebuild or check the monthly category totals"
+    )
+    parser_rollup.add_argument(
+        "--rebuild", action="store_true", help="recompute from the stored expenses"
+    )
+    parser_rollup.add_argument(
+        "--check", action="store_true", help="compare against the stored expenses"
+    )
+
+    # categories subcommand
+    subparsers.add_parser(
+        "categories", help="show the number and total of expenses per category"
+    )
+
+    # reindex subcommand
+    subparsers.add_parser("reindex", help="rebuild the storage indexes")
+
+    # compact subcommand
+    parser_compact = subparsers.add_parser(
+        "compact", help="fold the write-ahead log into a new snapshot"
+    )
+    parser_compact.add_argument(
+        "--if-needed",
+        action="store_true",
+        help="only compact if the log has passed its size thresholds",
+    )
+
+    # serve subcommand
+    subparsers.add_parser(
+        "serve", help="keep the tracker loaded and answer commands on a local socket"
+    )
+
+    # every subcommand accepts --timings
+    for subparser in subparsers.choices.values():
+        subparser.add_argument(
+            "--timings",
+            action="store_true",
+            help="print per-phase timings and counters to stderr",
+        )
+
+    args = parser.parse_args(argv)
 
     try:
         if args.command == "add":
@@ -100,6 +214,9 @@ def main():
         elif args.command == "list":
             list_parser(args)
 
+        elif args.command == "search":
+            search_parser(args)
+
         elif args.command == "edit":
             edit_parser(args)
 
@@ -109,6 +226,27 @@ def main():
         elif args.command == "summary":
             summary_parser(args)
 
+        elif args.command == "export":
+            export_parser(args)
+
+        elif args.command == "import":
+            import_parser(args)
+
+        elif args.command == "rollup":
+            rollup_parser(args)
+
+        elif args.command == "categories":
+            categories_parser(args)
+
+        elif args.command == "reindex":
+            reindex_parser(args)
+
+        elif args.command == "compact":
+            compact_parser(args)
+
+        elif args.command == "serve":
+            serve_parser(args)
+
     except ValueError as e:
         parser.error(str(e))
 
@@ -173,14 +311,48 @@ def list_parser(args):
         print("No expenses found.")
         return
 
-    lines = []
     if args.format and args.format.lower() == "csv":
         lines = format_list_csv(expenses)
     else:
         # default: terminal table
         lines = format_table(expenses)
-    for line in lines:
-        print(line)
+    write_lines(lines)
+
+
+@log_command("search")
+def search_parser(args):
+    """
+    Search expenses by the words in their note and category.
+
+    Args:
+        args: Parsed command line arguments with the query and the filter options of list
+
+    Returns:
+        None (prints results to stdout)
+    """
+    from .service import ExpenseService
+
+    filters = {
+        "month": args.month,
+        "from": args.__dict__.get("from"),
+        "to": args.to,
+        "category": args.category,
+        "min": args.min,
+        "max": args.max,
+        "sort": args.sort or "date",
+        "limit": args.limit,
+        "desc": args.desc,
+    }
+    expenses = ExpenseService.search_expenses(" ".join(args.query), filters)
+    if len(expenses) == 0:
+        print("No expenses found.")
+        return
+
+    if args.format and args.format.lower() == "csv":
+        lines = format_list_csv(expenses)
+    else:
+        lines = format_table(expenses)
+    write_lines(lines)
 
 
 @log_command("summary")
@@ -209,14 +381,12 @@ def summary_parser(args):
         return
 
     # Decide output format
-    lines = []
     if args.format and args.format.lower() == "csv":
         lines = format_summary_csv(summary)
     else:
         # default: terminal table
         lines = print_summary(summary)
-    for line in lines:
-        print(line)
+    write_lines(lines)
 
 
 @log_command("edit")
@@ -267,3 +437,215 @@ def delete_parser(args):
         )
     else:
         print("Failed to delete expense.")
+
+
+@log_command("export")
+def export_parser(args):
+    """
+    Stream expenses to a file without holding them all in memory.
+
+    Args:
+        args: Parsed command line arguments with filter options (month, from, to, category, min, max), file and format
+
+    Returns:
+        None
+    """
+    import json
+    import sys
+    from .models import json_default
+    from .service import ExpenseService
+
+    fmt = (args.format or "csv").lower()
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError("Invalid export format. Must be one of: csv, jsonl.")
+
+    filters = {
+        "month": args.month,
+        "from": args.__dict__.get("from"),
+        "to": args.to,
+        "category": args.category,
+        "min": args.min,
+        "max": args.max,
+    }
+    expenses = ExpenseService.export_expenses(filters)
+
+    if fmt == "csv":
+        lines = format_list_csv(expenses)
+    else:
+        lines = (json.dumps(exp, default=json_default) for exp in expenses)
+
+    if args.file:
+        with open(args.file, "w", buffering=1024 * 1024) as f:
+            write_lines(lines, f)
+    else:
+        write_lines(lines, sys.stdout)
+
+
+@log_command("import")
+def import_parser(args):
+    """
+    Bulk import expenses from a CSV, JSONL or JSON file.
+
+    Args:
+        args: Parsed command line arguments containing file, format, batch_size and errors
+
+    Returns:
+        None
+    """
+    import csv
+    import sys
+    from .service import ExpenseService
+    from .importer import detect_format, read_rows
+
+    fmt = detect_format(args.file, args.format)
+    rejected = 0
+
+    if args.errors:
+        report_file = open(args.errors, "w", newline="")
+        report = csv.writer(report_file)
+        report.writerow(["Line", "Error"])
+    else:
+        report_file = None
+
+    def on_error(lineno, message):
+        nonlocal rejected
+        rejected += 1
+        if report_file:
+            report.writerow([lineno, message])
+        else:
+            print(f"Line {lineno}: {message}", file=sys.stderr)
+
+    try:
+        imported = ExpenseService.import_expenses(
+            read_rows(args.file, fmt), on_error, batch_size=args.batch_size
+        )
+    finally:
+        if report_file:
+            report_file.close()
+
+    print(f"Imported {imported} expenses from {args.file}.")
+    if rejected:
+        print(f"Rejected {rejected} invalid rows.")
+
+
+@log_command("rollup")
+def rollup_parser(args):
+    """
+    Show, rebuild or check the monthly per-category rollup.
+
+    Args:
+        args: Parsed command line arguments containing the rebuild and check flags
+
+    Returns:
+        None
+    """
+    import sys
+    from .service import ExpenseService
+
+    if args.rebuild:
+        buckets = ExpenseService.rebuild_rollup()
+        print(f"Rebuilt rollup with {buckets} month/category buckets.")
+
+    if args.check:
+        problems = ExpenseService.check_rollup()
+        if problems:
+            write_lines(problems)
+            print(f"Rollup check failed: {len(problems)} problems found.")
+            sys.exit(1)
+        print("Rollup is consistent with the stored expenses.")
+
+    if args.rebuild or args.check:
+        return
+
+    rows = ExpenseService.rollup_rows()
+    if len(rows) == 0:
+        print("No expenses found.")
+        return
+
+    header = f"{'Month':<8} | {'Category':<15} | {'Count':>7} | {'Total':>15} | Highest"
+    lines = ["-" * len(header), header, "-" * len(header)]
+    lines.extend(
+        f"{month:<8} | {cat:<15} | {count:>7} | {total:>15.2f} | {highest}"
+        for month, cat, count, total, highest in rows
+    )
+    write_lines(lines)
+
+
+@log_command("categories")
+def categories_parser(args):
+    """
+    Show every category with the number and total of its expenses.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        None
+    """
+    from .service import ExpenseService
+
+    rows = ExpenseService.category_totals()
+    if len(rows) == 0:
+        print("No expenses found.")
+        return
+
+    header = f"{'Category':<15} | {'Count':>7} | {'Total':>15}"
+    lines = ["-" * len(header), header, "-" * len(header)]
+    lines.extend(
+        f"{cat:<15} | {count:>7} | {total:>15.2f}" for cat, count, total in rows
+    )
+    write_lines(lines)
+
+
+@log_command("reindex")
+def reindex_parser(args):
+    """
+    Rebuild the storage indexes from the stored expenses.
+
+    Args:
+        args: Parsed command line arguments (no options)
+
+    Returns:
+        None
+    """
+    from .service import ExpenseService
+
+    count = ExpenseService.rebuild_indexes()
+    print(f"Rebuilt indexes for {count} expenses.")
+
+
+@log_command("compact")
+def compact_parser(args):
+    """
+    Compact the storage into a snapshot, folding in the write-ahead log.
+
+    Args:
+        args: Parsed command line arguments containing the if_needed flag
+
+    Returns:
+        None
+    """
+    from .service import ExpenseService
+
+    sizes = ExpenseService.compact(args.if_needed)
+    if sizes is None:
+        print("Nothing to compact.")
+        return
+    before, after = sizes
+    print(f"Compacted storage from {before:,} to {after:,} bytes.")
+
+
+@log_command("serve")
+def serve_parser(args):
+    """
+    Run the tracker daemon in the foreground.
+
+    Args:
+        args: Parsed command line arguments (no options)
+
+    Returns:
+        None
+    """
+    from .daemon import serve
+
+    serve()
@@ -0,0 +1,86 @@
+import os
+import sys
+from tracker.config import get_flag, get_setting
+
+SOCKET_FILE = "./data/tracker.sock"
+
+
+def socket_path() -> str:
+    """
+    Get the path of the daemon's Unix socket.
+
+    Args:
+        None
+
+    Returns:
+        str: Socket path from the "socket" setting, or the default under data/
+    """
+    return get_setting("socket", SOCKET_FILE)
+
+
+def tracker_env() -> dict[str, str]:
+    """
+    Get the TRACKER_* environment variables, which override data/config.json.
+
+    Args:
+        None
+
+    Returns:
+        dict[str, str]: Variable names mapped to their values
+    """
+    return {k: v for k, v in os.environ.items() if k.startswith("TRACKER_")}
+
+
+def forward(argv: list[str]) -> int | None:
+    """
+    Run a command through a running 'tracker serve' daemon.
+
+    The command line is sent as one JSON line along with the working
+    directory and the TRACKER_* environment variables, and the daemon
+    answers with JSON lines carrying the command's stdout and stderr text
+    followed by its exit code. When no daemon is listening (or the "daemon"
+    setting is switched off) nothing is sent, and when the daemon runs in
+    another directory or with other settings it declines the command; either
+    way the caller can run the command itself.
+
+    Args:
+        argv: Command line arguments, without the program name
+
+    Returns:
+        int | None: Exit code of the forwarded command, or None if no daemon handled it
+    """
+    if argv[:1] == ["serve"] or not get_flag("daemon", True):
+        return None
+    path = socket_path()
+    if not os.path.exists(path):
+        return None
+
+    # only paid when a daemon may be listening
+    import json
+    import socket
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except OSError:
+        # stale socket file left behind by a daemon that is no longer running
+        conn.close()
+        return None
+
+    with conn, conn.makefile("rb") as responses:
+        request = {"argv": argv, "cwd": os.getcwd(), "env": tracker_env()}
+        conn.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        for line in responses:
+            frame = json.loads(line)
+            if "direct" in frame:
+                return None
+            if "exit" in frame:
+                sys.stdout.flush()
+                return frame["exit"]
+            if "stdout" in frame:
+                sys.stdout.write(frame["stdout"])
+            else:
+                sys.stderr.write(frame["stderr"])
+
+    print("Error: the tracker daemon closed the connection.", file=sys.stderr)
+    return 1
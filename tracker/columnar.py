@@ -0,0 +1,315 @@
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Iterable
+from tracker.models import Expense
+from tracker.query import date_range
+from tracker.sketch import add_amount, new_sketch
+from tracker.storage import StorageEngine
+from tracker.timings import phase, timed
+from tracker.types import ValidatedFilters
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _day(dateStr: str) -> int:
+    return date.fromisoformat(dateStr).toordinal()
+
+
+class ColumnarLedger:
+    """
+    In-memory column store of expenses.
+
+    Rows are sorted by date (ties in insertion order) and split into
+    columns: day numbers and amounts in typed arrays, categories as integer
+    codes into a dictionary of display names plus codes of the case-folded
+    names for filtering. A date range is a bisect on the day column, and the
+    remaining filters and per-category sums run over whole columns as NumPy
+    masks and bincounts, or as tight loops over the arrays without NumPy.
+    """
+
+    @timed("load")
+    def __init__(self, expenses: Iterable[Expense]):
+        rows = list(expenses)
+        rows_by_date = sorted(range(len(rows)), key=lambda i: rows[i].date)
+
+        self.categories = []
+        self.folded = {}
+        category_codes = {}
+        folded_codes = []
+
+        self.ids = []
+        self.dates = []
+        self.notes = []
+        self.currencies = []
+        self.created_at = []
+        self.positions = array("l")
+        self.days = array("l")
+        self.amounts = array("d")
+        self.codes = array("l")
+        self.folded_codes = array("l")
+
+        for pos in rows_by_date:
+            exp = rows[pos]
+            category = exp.category
+            code = category_codes.get(category)
+            if code is None:
+                code = category_codes[category] = len(self.categories)
+                self.categories.append(category)
+                folded_codes.append(
+                    self.folded.setdefault(category.lower(), len(self.folded))
+                )
+            self.positions.append(pos)
+            self.days.append(_day(exp.date))
+            self.amounts.append(exp.amount)
+            self.codes.append(code)
+            self.folded_codes.append(folded_codes[code])
+            self.ids.append(exp.id)
+            self.dates.append(exp.date)
+            self.notes.append(exp.note)
+            self.currencies.append(exp.currency)
+            self.created_at.append(exp.created_at)
+
+        if np is not None:
+            self.amounts = np.frombuffer(self.amounts, dtype=np.float64)
+            self.codes = np.frombuffer(self.codes, dtype=f"i{self.codes.itemsize}")
+            self.folded_codes = np.frombuffer(
+                self.folded_codes, dtype=f"i{self.folded_codes.itemsize}"
+            )
+
+    def row(self, i: int) -> Expense:
+        """
+        Materialize one row as an expense record.
+
+        Args:
+            i: Row index in date order
+
+        Returns:
+            Expense: Expense record
+        """
+        return Expense.from_values(
+            (
+                self.ids[i],
+                self.dates[i],
+                self.categories[self.codes[i]],
+                float(self.amounts[i]),
+                self.notes[i],
+                self.currencies[i],
+                self.created_at[i],
+            )
+        )
+
+    @timed("filter")
+    def select(self, validated: ValidatedFilters) -> list[int]:
+        """
+        Find the rows matching the filters.
+
+        Args:
+            validated: Validated filter object
+
+        Returns:
+            list[int]: Matching row indexes in date order
+        """
+        lo, hi = 0, len(self.ids)
+        bounds = date_range(validated)
+        if bounds is not None:
+            lo = bisect_left(self.days, _day(bounds[0]))
+            hi = bisect_right(self.days, _day(bounds[1]))
+
+        code = None
+        if validated.category:
+            code = self.folded.get(validated.category)
+            if code is None:
+                return []
+        min_amount = validated.min_amount
+        max_amount = validated.max_amount
+
+        if np is not None:
+            mask = np.ones(max(hi - lo, 0), dtype=bool)
+            if code is not None:
+                mask &= self.folded_codes[lo:hi] == code
+            if min_amount:
+                mask &= self.amounts[lo:hi] >= min_amount
+            if max_amount:
+                mask &= self.amounts[lo:hi] <= max_amount
+            return (np.nonzero(mask)[0] + lo).tolist()
+
+        selected = range(lo, hi)
+        if code is not None:
+            folded_codes = self.folded_codes
+            selected = [i for i in selected if folded_codes[i] == code]
+        if min_amount or max_amount:
+            amounts = self.amounts
+            low = min_amount or float("-inf")
+            high = max_amount or float("inf")
+            selected = [i for i in selected if low <= amounts[i] <= high]
+        return list(selected)
+
+    def query(self, validated: ValidatedFilters) -> list[Expense]:
+        """
+        Get the filtered, sorted and limited expenses.
+
+        Rows are sorted and limited by their column values, with ties in
+        insertion order as in query.sort_expenses, and only the rows that
+        are returned are materialized.
+
+        Args:
+            validated: Validated filter object
+
+        Returns:
+            list[Expense]: Matching expense records
+        """
+        selected = self.select(validated)
+        with phase("sort"):
+            return self._sort(selected, validated)
+
+    def _sort(self, selected: list[int], validated: ValidatedFilters) -> list[Expense]:
+        selected.sort(key=self.positions.__getitem__)
+        if validated.sort == "amount":
+            key = self.amounts.__getitem__
+        elif validated.sort == "category":
+            key = lambda i: self.categories[self.codes[i]]
+        else:
+            key = self.dates.__getitem__
+        descending = validated.sort_direction == -1
+        if validated.limit:
+            top_k = heapq.nlargest if descending else heapq.nsmallest
+            selected = top_k(validated.limit, selected, key=key)
+        else:
+            selected.sort(key=key, reverse=descending)
+        return [self.row(i) for i in selected]
+
+    @timed("aggregate")
+    def aggregate(self, validated: ValidatedFilters) -> dict:
+        """
+        Compute totals with grouped sums over the matching rows.
+
+        Args:
+            validated: Validated filter object
+
+        Returns:
+            dict: grand_total, total_expenses, category_totals, category_sketches, highest_expense and currency
+        """
+        selected = self.select(validated)
+        if not selected:
+            return {
+                "grand_total": 0,
+                "total_expenses": 0,
+                "category_totals": {},
+                "category_sketches": {},
+                "highest_expense": None,
+                "currency": None,
+            }
+
+        if np is not None:
+            idx = np.asarray(selected)
+            codes = self.codes[idx]
+            amounts = self.amounts[idx]
+            sums = np.bincount(codes, weights=amounts)
+            unique, first = np.unique(codes, return_index=True)
+            category_totals = {
+                self.categories[c]: float(sums[c]) for c in unique[np.argsort(first)]
+            }
+            # each category's sketch is built from its distinct amounts
+            category_sketches = {}
+            for c in unique.tolist():
+                sketch = category_sketches[self.categories[c]] = new_sketch()
+                values, counts = np.unique(amounts[codes == c], return_counts=True)
+                for amount, n in zip(values.tolist(), counts.tolist()):
+                    add_amount(sketch, amount, n)
+            highest = selected[int(np.argmax(amounts))]
+            total_amount = float(amounts.sum())
+        else:
+            sums = {}
+            sketches = {}
+            codes = self.codes
+            amounts = self.amounts
+            for i in selected:
+                sums[codes[i]] = sums.get(codes[i], 0) + amounts[i]
+                if codes[i] not in sketches:
+                    sketches[codes[i]] = new_sketch()
+                add_amount(sketches[codes[i]], amounts[i])
+            category_totals = {self.categories[c]: total for c, total in sums.items()}
+            category_sketches = {
+                self.categories[c]: sketch for c, sketch in sketches.items()
+            }
+            highest = max(selected, key=amounts.__getitem__)
+            total_amount = sum(sums.values())
+
+        highest_expense = self.row(highest)
+        return {
+            "grand_total": total_amount,
+            "total_expenses": len(selected),
+            "category_totals": category_totals,
+            "category_sketches": category_sketches,
+            "highest_expense": highest_expense,
+            "currency": highest_expense["currency"],
+        }
+
+
+class ColumnarStorage(StorageEngine):
+    """
+    Serve queries and aggregates from a ColumnarLedger over another engine.
+
+    Writes go straight to the wrapped engine. The ledger is built from the
+    engine on first read and rebuilt whenever the data generation changes,
+    so it pays off in long-running processes that answer many queries.
+    """
+
+    def __init__(self, engine: StorageEngine):
+        self.engine = engine
+        self.ledger = None
+        self.ledger_generation = None
+
+    def _ledger(self) -> ColumnarLedger:
+        current = self.engine.generation()
+        if self.ledger is None or self.ledger_generation != current:
+            self.ledger = ColumnarLedger(self.engine.load()["expenses"])
+            self.ledger_generation = current
+        return self.ledger
+
+    def load(self):
+        return self.engine.load()
+
+    def save(self, expense_dict):
+        return self.engine.save(expense_dict)
+
+    def save_many(self, expense_dicts):
+        return self.engine.save_many(expense_dicts)
+
+    def update(self, expense_dict):
+        return self.engine.update(expense_dict)
+
+    def delete(self, id):
+        return self.engine.delete(id)
+
+    def get_by_id(self, id):
+        return self.engine.get_by_id(id)
+
+    def get_many(self, ids):
+        return self.engine.get_many(ids)
+
+    def next_sequence(self):
+        return self.engine.next_sequence()
+
+    def generation(self):
+        return self.engine.generation()
+
+    def rebuild_indexes(self):
+        return self.engine.rebuild_indexes()
+
+    def compact(self, if_needed=False):
+        return self.engine.compact(if_needed)
+
+    def iter_expenses(self, validated):
+        return self.engine.iter_expenses(validated)
+
+    def query(self, validated):
+        return self._ledger().query(validated)
+
+    def aggregate(self, validated):
+        return self._ledger().aggregate(validated)
@@ -0,0 +1,98 @@
+import os
+
+CONFIG_FILE = "./data/config.json"
+
+# (modification time, size, inode) of the file and the settings read from it
+_cached = (None, {})
+
+
+def _load_config() -> dict:
+    """
+    Read the optional JSON configuration file.
+
+    The settings are kept until the file is modified or replaced, so a
+    long-running daemon picks up edits without rereading the file on
+    every lookup.
+
+    Args:
+        None
+
+    Returns:
+        dict: Settings from the config file, or an empty dict if there is none
+    """
+    global _cached
+    try:
+        stat = os.stat(CONFIG_FILE)
+    except FileNotFoundError:
+        return {}
+    key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    if _cached[0] == key:
+        return _cached[1]
+
+    import json
+
+    with open(CONFIG_FILE, "r") as f:
+        try:
+            config = json.load(f)
+        except json.JSONDecodeError:
+            raise ValueError(f"Config file {CONFIG_FILE} is corrupted.")
+    _cached = (key, config)
+    return config
+
+
+def get_setting(name: str, default=None):
+    """
+    Look up a setting, preferring the environment over the config file.
+
+    Args:
+        name: Setting name; the environment variable is TRACKER_<NAME>
+        default: Value returned when the setting is not configured
+
+    Returns:
+        The configured value, or default
+    """
+    value = os.environ.get(f"TRACKER_{name.upper()}")
+    if value is not None:
+        return value
+    return _load_config().get(name, default)
+
+
+def get_flag(name: str, default: bool = False) -> bool:
+    """
+    Look up an on/off setting.
+
+    Environment values of 1, true, yes or on (in any case) switch it on;
+    the config file may use a JSON boolean.
+
+    Args:
+        name: Setting name; the environment variable is TRACKER_<NAME>
+        default: Value returned when the setting is not configured
+
+    Returns:
+        bool: Whether the setting is switched on
+    """
+    value = get_setting(name, default)
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def get_int(name: str, default: int) -> int:
+    """
+    Look up a non-negative whole-number setting.
+
+    Args:
+        name: Setting name; the environment variable is TRACKER_<NAME>
+        default: Value returned when the setting is not configured
+
+    Returns:
+        int: The configured number
+    """
+    value = get_setting(name, default)
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name} setting '{value}'.")
+    if number < 0:
+        raise ValueError(f"The {name} setting cannot be negative.")
+    return number
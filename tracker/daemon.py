@@ -0,0 +1,243 @@
+import io
+import os
+import sys
+import json
+import signal
+import socket
+import threading
+import socketserver
+from contextlib import contextmanager
+from tracker.client import socket_path, tracker_env
+from tracker.logger import get_logger
+
+_local = threading.local()
+
+# commands that change the data; the rest only read it
+_MUTATING = {"add", "edit", "delete", "import", "compact", "reindex"}
+
+# working directory and TRACKER_* variables the daemon was started with;
+# paths and settings of a command only mean the same thing in the daemon
+# when the client's match these
+_context = None
+
+
+class _ThreadOutput(io.TextIOBase):
+    """
+    Stand-in for sys.stdout or sys.stderr inside the daemon.
+
+    Text written on a connection's thread is sent to that client; text
+    written anywhere else goes to the daemon's own stream.
+    """
+
+    def __init__(self, name: str, fallback):
+        self.name = name
+        self.fallback = fallback
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        send = getattr(_local, "send", None)
+        if send is None:
+            return self.fallback.write(text)
+        send(self.name, text)
+        return len(text)
+
+    def flush(self):
+        if getattr(_local, "send", None) is None:
+            self.fallback.flush()
+
+
+class _ReadWriteLock:
+    """
+    Lets any number of readers in at once, or one writer alone.
+
+    A waiting writer keeps new readers out, so a steady stream of reads
+    cannot hold a write back indefinitely.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writing or self._waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+# the storage engine and its in-memory indexes are shared by every
+# connection: writes run alone, reads alongside each other
+_command_lock = _ReadWriteLock()
+
+
+def _mutates(argv: list[str]) -> bool:
+    """
+    Tell whether a command line changes the data.
+    """
+    if not argv:
+        return False
+    if argv[0] == "rollup":
+        # argparse also accepts an abbreviation such as --reb
+        return any(len(arg) > 2 and "--rebuild".startswith(arg) for arg in argv)
+    return argv[0] in _MUTATING
+
+
+def _run(argv: list[str]) -> int:
+    """
+    Run one command line with the regular CLI and return its exit code.
+    """
+    from tracker.cli import main
+
+    try:
+        main(argv)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception as e:
+        get_logger().exception("Unexpected error in daemon command %s", argv)
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    wbufsize = 64 * 1024
+
+    def _send(self, stream: str, text: str):
+        frame = json.dumps({stream: text}) + "\n"
+        self.wfile.write(frame.encode("utf-8"))
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            argv = [str(arg) for arg in request["argv"]]
+            context = (os.path.realpath(request["cwd"]), request["env"])
+        except (ValueError, KeyError, TypeError):
+            self._send("stderr", "Error: malformed request.\n")
+            self._send("exit", 2)
+            return
+
+        if context != _context:
+            # relative file arguments, the data directory and the settings
+            # would resolve differently here, so the client runs it itself
+            self._send("direct", True)
+            return
+
+        _local.send = self._send
+        lock = _command_lock.write if _mutates(argv) else _command_lock.read
+        try:
+            with lock():
+                code = _run(argv)
+        finally:
+            _local.send = None
+        self._send("exit", code)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _warm_up():
+    """
+    Load the engine, its indexes and the derived indexes once at startup.
+    """
+    from tracker.storage import get_storage, generation, next_sequence, set_resident
+    from tracker.indexes import derived_indexes
+
+    set_resident()
+    get_storage()
+    generation()
+    next_sequence()
+    for index in derived_indexes():
+        index.current()
+
+
+def serve():
+    """
+    Serve tracker commands on a Unix socket until interrupted.
+
+    Each connection carries one command line, which runs through the same
+    handlers as the regular CLI, so output and errors are identical. The
+    storage engine, its indexes and the configuration stay loaded between
+    commands; the configuration is re-read when data/config.json changes.
+    Connections are handled on their own threads. Commands that change the
+    data run one at a time, so writes from concurrent clients are never
+    interleaved, while reads run alongside each other and only wait for
+    writes. Commands from another working directory or with
+    other TRACKER_* variables are handed back to the client to run
+    directly.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    from tracker.storage import DATA_DIR
+
+    if not hasattr(socket, "AF_UNIX"):
+        raise ValueError("The daemon needs Unix domain sockets.")
+
+    path = socket_path()
+    os.makedirs(DATA_DIR, exist_ok=True)
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.remove(path)
+        else:
+            raise ValueError(f"A tracker daemon is already listening on {path}.")
+        finally:
+            probe.close()
+
+    global _context
+    _context = (os.path.realpath(os.getcwd()), tracker_env())
+    _warm_up()
+    server = _Server(path, _RequestHandler)
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = _ThreadOutput("stdout", stdout)
+    sys.stderr = _ThreadOutput("stderr", stderr)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    print(f"Serving on {path} (Ctrl+C to stop)", flush=True)
+    get_logger().info("Daemon listening on %s", path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sys.stdout, sys.stderr = stdout, stderr
+        if os.path.exists(path):
+            os.remove(path)
+        get_logger().info("Daemon on %s stopped", path)
@@ -0,0 +1,280 @@
+import os
+import re
+import math
+import csv
+import json
+from typing import Callable, Iterator
+from tracker.utils import validateDate
+
+IMPORT_FORMATS = ("csv", "jsonl", "json")
+
+# characters read from a JSON document at a time
+JSON_CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+
+
+class _JsonCursor:
+    """
+    Read position in a JSON document that is read one chunk at a time.
+
+    Only the unread part of the document is buffered. A value is parsed
+    with JSONDecoder.raw_decode; if it fails, or a number runs up to the end
+    of the buffer and may continue, the next chunk is read and the value is
+    parsed again.
+    """
+
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        # line number at buffer position self.counted
+        self.line = 1
+        self.counted = 0
+
+    def _fill(self) -> bool:
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.lineno()
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = self.counted = 0
+        return True
+
+    def lineno(self) -> int:
+        self.line += self.buf.count("\n", self.counted, self.pos)
+        self.counted = self.pos
+        return self.line
+
+    def peek(self) -> str:
+        """
+        Skip whitespace and get the next character, or "" at the end.
+        """
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            found = repr(char) if char else "the end of the document"
+            raise ValueError(
+                f"Expected {' or '.join(map(repr, chars))} but found {found} at line {self.lineno()}."
+            )
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise ValueError(f"Invalid JSON value at line {self.lineno()}.")
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(
+    f, key: str = "expenses", chunk_size: int = JSON_CHUNK_SIZE
+) -> Iterator[tuple[int, object]]:
+    """
+    Stream the elements of a JSON array without loading the whole document.
+
+    The document is either the array itself or an object holding it under
+    key, such as the legacy data/expenses.json. Memory use is bounded by
+    the chunk size and the largest single element, not the file size.
+
+    Args:
+        f: Text file object positioned at the start of the document
+        key: Name of the array when the document is an object
+        chunk_size: Characters to read at a time
+
+    Returns:
+        Iterator[tuple[int, object]]: Line number and parsed value of every element
+    """
+    cursor = _JsonCursor(f, chunk_size)
+    if cursor.expect("{[") == "[":
+        yield from _array_elements(cursor)
+    else:
+        found = False
+        if cursor.peek() == "}":
+            cursor.pos += 1
+        else:
+            while True:
+                name = cursor.value()
+                if not isinstance(name, str):
+                    raise ValueError(f"Expected a key at line {cursor.lineno()}.")
+                cursor.expect(":")
+                if name == key and not found:
+                    cursor.expect("[")
+                    yield from _array_elements(cursor)
+                    found = True
+                else:
+                    cursor.value()
+                if cursor.expect(",}") == "}":
+                    break
+        if not found:
+            raise ValueError(f"The document has no '{key}' array.")
+    if cursor.peek():
+        raise ValueError(
+            f"Unexpected data after the document at line {cursor.lineno()}."
+        )
+
+
+def _array_elements(cursor: _JsonCursor) -> Iterator[tuple[int, object]]:
+    # the opening bracket has been read
+    if cursor.peek() == "]":
+        cursor.pos += 1
+        return
+    while True:
+        cursor.peek()
+        yield cursor.lineno(), cursor.value()
+        if cursor.expect(",]") == "]":
+            return
+
+
+def detect_format(path: str, fmt: str | None = None) -> str:
+    """
+    Work out the format of an import file.
+
+    Args:
+        path: Path of the file to import
+        fmt: Explicit format, if given on the command line
+
+    Returns:
+        str: One of the supported import formats
+    """
+    if not fmt:
+        ext = os.path.splitext(path)[1].lower()
+        fmt = {
+            ".csv": "csv",
+            ".jsonl": "jsonl",
+            ".ndjson": "jsonl",
+            ".json": "json",
+        }.get(ext)
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(
+            f"Cannot import '{path}'. Use --format with one of: {', '.join(IMPORT_FORMATS)}."
+        )
+    return fmt
+
+
+def read_rows(path: str, fmt: str) -> Iterator[tuple[int, dict | str]]:
+    """
+    Stream the raw rows of a CSV, JSONL or JSON file.
+
+    CSV headers are matched case-insensitively, so files written by
+    'tracker list --format csv' can be imported back. A JSON file holds an
+    array of rows, or an object with an "expenses" array, and is read
+    incrementally; unlike a bad JSONL line, invalid JSON stops the import.
+
+    Args:
+        path: Path of the file to import
+        fmt: File format, csv, jsonl or json
+
+    Returns:
+        Iterator[tuple[int, dict | str]]: Line number and row; unparsable JSONL lines are yielded as the raw text
+    """
+    if not os.path.exists(path):
+        raise ValueError(f"Import file '{path}' does not exist.")
+
+    with open(path, "r", newline="") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            reader.fieldnames = [
+                name.strip().lower() for name in reader.fieldnames or []
+            ]
+            for row in reader:
+                yield reader.line_num, row
+        elif fmt == "json":
+            try:
+                yield from iter_json_array(f)
+            except ValueError as e:
+                raise ValueError(f"Cannot import '{path}': {e}")
+        else:
+            for lineno, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield lineno, json.loads(line)
+                except json.JSONDecodeError:
+                    yield lineno, line
+
+
+def parse_row(row: dict | str) -> dict:
+    """
+    Validate one raw row and normalize it into expense fields.
+
+    Args:
+        row: Raw row from read_rows
+
+    Returns:
+        dict: date, category, amount, note and currency of the expense
+    """
+    if not isinstance(row, dict):
+        raise ValueError("Line is not a valid JSON object.")
+
+    date = str(row.get("date") or "").strip()
+    if not validateDate(date):
+        raise ValueError(f"Invalid date '{date}'. Please use YYYY-MM-DD.")
+
+    category = str(row.get("category") or "").strip()
+    if not category:
+        raise ValueError("Category is required.")
+
+    currency = str(row.get("currency") or "").strip() or "BDT"
+    amount = row.get("amount")
+    if isinstance(amount, str):
+        # amounts exported by 'tracker list --format csv' carry the currency
+        parts = amount.split()
+        if len(parts) == 2:
+            amount, currency = parts
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid amount '{row.get('amount')}'.")
+    # float() also accepts "nan" and "inf"
+    if not math.isfinite(amount):
+        raise ValueError(f"Invalid amount '{row.get('amount')}'.")
+    if amount < 0:
+        raise ValueError("Amount cannot be negative.")
+
+    note = str(row.get("note") or "").strip() or "N/A"
+    return {
+        "date": date,
+        "category": category,
+        "amount": amount,
+        "note": note,
+        "currency": currency,
+    }
+
+
+def validate_rows(
+    rows: Iterator[tuple[int, dict | str]],
+    on_error: Callable[[int, str], None],
+) -> Iterator[dict]:
+    """
+    Yield the valid rows and report the invalid ones without stopping.
+
+    Args:
+        rows: Line numbers and raw rows from read_rows
+        on_error: Called with the line number and message of each invalid row
+
+    Returns:
+        Iterator[dict]: Normalized expense fields of the valid rows
+    """
+    for lineno, row in rows:
+        try:
+            yield parse_row(row)
+        except ValueError as e:
+            on_error(lineno, str(e))
@@ -0,0 +1,272 @@
+import os
+import json
+import importlib
+from tracker.models import Expense
+from tracker.storage import generation, iter_expenses
+from tracker.query import ALL_EXPENSES
+from tracker.locking import atomic_open, write_lock
+from tracker.timings import count, timed
+
+DERIVED_INDEXES = {
+    "rollup": "tracker.rollup.Rollup",
+    "search": "tracker.search.SearchIndex",
+    "categories": "tracker.categories.CategoryIndex",
+    "amounts": "tracker.amounts.AmountIndex",
+}
+
+# a logged index folds its log into the index file once the log is
+# larger than both this and the file
+LOG_BYTES = 64 * 1024
+
+_instances = {}
+
+
+class DerivedIndex:
+    """
+    Base class for sidecar files computed from the stored expenses.
+
+    The service reports every add, edit and delete to the derived indexes
+    after the storage write. Each index file records the data generation it
+    reflects, and is only updated in place when that matches the generation
+    before the write; otherwise it is discarded and rebuilt from the stored
+    expenses on its next read. Subclasses implement empty, add and remove.
+
+    A logged index does not rewrite its file on every write: the added and
+    removed expenses are appended to a log next to it, along with the
+    generations before and after the write, and replayed onto the file on
+    every read. Once the log outgrows the file it is folded into it. Only
+    indexes whose add and remove depend on nothing but the state can be
+    logged, since replaying happens after later writes.
+    """
+
+    path = None
+    version = 1
+    logged = False
+
+    def empty(self) -> dict:
+        raise NotImplementedError
+
+    def add(self, state: dict, exp: Expense):
+        raise NotImplementedError
+
+    def remove(self, state: dict, exp: Expense):
+        raise NotImplementedError
+
+    def _read(self) -> dict | None:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r") as f:
+            data = f.read()
+        count("bytes_read", len(data))
+        try:
+            state = json.loads(data)
+        except json.JSONDecodeError:
+            return None
+        if state.get("version") != self.version:
+            return None
+        if self.logged:
+            self._replay(state)
+        return state
+
+    def _log_path(self) -> str:
+        return os.path.splitext(self.path)[0] + ".log"
+
+    def _replay(self, state: dict):
+        """
+        Apply the logged writes that follow on from the state's generation.
+
+        Writes already folded into the file are skipped. A gap in the
+        generations, or a write cut short, ends the replay and leaves the
+        state behind the data, so that current rebuilds it.
+        """
+        try:
+            f = open(self._log_path(), "r")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                count("bytes_read", len(line))
+                try:
+                    before, after, removed, added = json.loads(line)
+                except ValueError:
+                    break
+                if after <= state["generation"]:
+                    continue
+                if before != state["generation"]:
+                    break
+                for values in removed:
+                    self.remove(state, Expense.from_values(values))
+                for values in added:
+                    self.add(state, Expense.from_values(values))
+                state["generation"] = after
+
+    def _write(self, state: dict):
+        # json.dump would go through the pure-Python encoder
+        data = json.dumps(state, separators=(",", ":"))
+        with atomic_open(self.path, "w") as f:
+            f.write(data)
+        count("bytes_written", len(data))
+        if self.logged and os.path.exists(self._log_path()):
+            os.remove(self._log_path())
+
+    def invalidate(self):
+        """
+        Discard the index file so that it is rebuilt on its next read.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        for path in (self.path, self._log_path()):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def rebuild(self) -> dict:
+        """
+        Recompute the index from every stored expense and persist it.
+
+        Runs under the write lock, so that no write lands between reading
+        the generation and scanning the expenses.
+
+        Args:
+            None
+
+        Returns:
+            dict: The rebuilt index state
+        """
+        return rebuild_together([self])[0]
+
+    @timed("index")
+    def current(self) -> dict:
+        """
+        Get the index state, rebuilding it first if it is missing or stale.
+
+        Args:
+            None
+
+        Returns:
+            dict: The up-to-date index state
+        """
+        state = self._read()
+        if state is None or state["generation"] != generation():
+            # a write may have landed while the files were read
+            with write_lock():
+                state = self._read()
+                if state is None or state["generation"] != generation():
+                    state = self.rebuild()
+        return state
+
+    @timed("index")
+    def record(self, before: int, added=(), removed=()):
+        """
+        Apply a storage write to the index.
+
+        Args:
+            before: Data generation before the write
+            added: Expenses added by the write (including the new state of edited ones)
+            removed: Expenses removed by the write (including the old state of edited ones)
+
+        Returns:
+            None
+        """
+        if self.logged:
+            self._append(before, added, removed)
+            return
+
+        state = self._read()
+        if state is None or state["generation"] != before:
+            self.invalidate()
+            return
+        for exp in removed:
+            self.remove(state, exp)
+        for exp in added:
+            self.add(state, exp)
+        state["generation"] = generation()
+        self._write(state)
+
+    def _append(self, before: int, added, removed):
+        """
+        Log a write, folding the log into the index file once it is large.
+
+        The log is checked on read rather than here: a write that does not
+        follow on from the state is never replayed.
+        """
+        if not os.path.exists(self.path):
+            self.invalidate()
+            return
+        entry = [
+            before,
+            generation(),
+            [exp.values() for exp in removed],
+            [exp.values() for exp in added],
+        ]
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with open(self._log_path(), "a") as f:
+            f.write(line)
+            size = f.tell()
+        count("bytes_written", len(line))
+        if size > max(LOG_BYTES, os.path.getsize(self.path)):
+            state = self._read()
+            if state is None or state["generation"] != generation():
+                self.invalidate()
+            else:
+                self._write(state)
+
+
+@timed("index")
+def rebuild_together(indexes: list[DerivedIndex]) -> list[dict]:
+    """
+    Recompute several derived indexes from one scan of the stored expenses.
+
+    Runs under the write lock, so every index reflects the same generation.
+
+    Args:
+        indexes: Derived indexes to rebuild
+
+    Returns:
+        list[dict]: The rebuilt state of each index, in the same order
+    """
+    with write_lock():
+        states = []
+        for index in indexes:
+            state = index.empty()
+            state["version"] = index.version
+            state["generation"] = generation()
+            states.append(state)
+        for exp in iter_expenses(ALL_EXPENSES):
+            for index, state in zip(indexes, states):
+                index.add(state, exp)
+        for index, state in zip(indexes, states):
+            index._write(state)
+    return states
+
+
+def get_index(name: str) -> DerivedIndex:
+    """
+    Get a derived index by name, creating it on first use.
+
+    Args:
+        name: Key of the index in DERIVED_INDEXES
+
+    Returns:
+        DerivedIndex: The derived index
+    """
+    if name not in _instances:
+        module_name, class_name = DERIVED_INDEXES[name].rsplit(".", 1)
+        _instances[name] = getattr(importlib.import_module(module_name), class_name)()
+    return _instances[name]
+
+
+def derived_indexes() -> list[DerivedIndex]:
+    """
+    Get every derived index maintained alongside storage.
+
+    Args:
+        None
+
+    Returns:
+        list[DerivedIndex]: Every derived index
+    """
+    return [get_index(name) for name in DERIVED_INDEXES]
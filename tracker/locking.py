@@ -0,0 +1,223 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from tracker.timings import count, phase
+from tracker.backends.file_id import file_id
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single-writer only
+    fcntl = None
+
+LOCK_FILE = "./data/.lock"
+
+# bytes read at a time when looking for the end of the last complete line
+TAIL_BLOCK = 4096
+
+_local = threading.local()
+
+
+def _lock(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+
+def _unlock(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextmanager
+def write_lock():
+    """
+    Hold the exclusive lock on the data directory.
+
+    Every storage mutation, and every in-place update of an index file,
+    runs under this lock, so read-modify-write sequences from concurrent
+    processes (allocate an ID then append, read an expense then store its
+    new state) never interleave. The lock is an fcntl.flock on data/.lock,
+    which the kernel releases if the holder dies. It is reentrant within a
+    thread; callbacks registered with on_release run after the outermost
+    holder has let go of it.
+
+    Args:
+        None
+    """
+    if getattr(_local, "depth", 0):
+        _local.depth += 1
+        try:
+            yield
+        finally:
+            _local.depth -= 1
+        return
+
+    os.makedirs(os.path.dirname(LOCK_FILE), exist_ok=True)
+    fd = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    callbacks = _local.callbacks = []
+    try:
+        with phase("lock"):
+            _lock(fd)
+        _local.depth = 1
+        try:
+            yield
+        finally:
+            _local.depth = 0
+            _unlock(fd)
+    finally:
+        os.close(fd)
+        _local.callbacks = None
+        for callback in callbacks:
+            callback()
+
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True):
+    """
+    Hold an exclusive lock on a file other than the data lock.
+
+    Used for jobs that must not run twice at once, such as compaction. The
+    with statement's target is whether the lock is held, which is only ever
+    False without blocking.
+
+    Args:
+        path: Lock file, created if missing
+        blocking: Wait for the lock instead of giving up when it is held
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(
+                fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            )
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def on_release(callback):
+    """
+    Run a function once the write lock is released.
+
+    Called without the lock held, the function runs immediately.
+
+    Args:
+        callback: Function taking no arguments
+
+    Returns:
+        None
+    """
+    callbacks = getattr(_local, "callbacks", None)
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+
+@contextmanager
+def atomic_open(path: str, mode: str = "wb"):
+    """
+    Open a file for writing that replaces path only once it is complete.
+
+    The content goes to a temporary file next to path, named after the
+    process and thread so that concurrent writers never share one, and is
+    renamed over path when the block exits normally. Readers therefore
+    always see either the old or the new file.
+
+    Args:
+        path: File to replace
+        mode: "wb" or "w"
+    """
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_file, mode) as f:
+            yield f
+        os.replace(tmp_file, path)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def truncate_torn_tail(f):
+    """
+    Cut a torn final line off a JSON Lines file.
+
+    The file is read backwards from its end, a block at a time, up to the
+    last newline, so the repair costs the length of the torn line rather
+    than of the file.
+
+    Args:
+        f: Binary file object opened for appending and reading
+
+    Returns:
+        None
+    """
+    end = f.seek(0, os.SEEK_END)
+    if end == 0:
+        return
+    f.seek(end - 1)
+    if f.read(1) == b"\n":
+        return
+    pos = end
+    while pos > 0:
+        start = max(pos - TAIL_BLOCK, 0)
+        f.seek(start)
+        block = f.read(pos - start)
+        count("bytes_read", len(block))
+        newline = block.rfind(b"\n")
+        if newline >= 0:
+            f.truncate(start + newline + 1)
+            return
+        pos = start
+    f.truncate(0)
+
+
+def sync_through(path: str, offset: int, window: float):
+    """
+    Make the first offset bytes of an append-only file durable, sharing the
+    fsync with other writers (group commit).
+
+    The caller has already written its data without syncing. After waiting
+    for the commit window, so that concurrent writers can append theirs,
+    the first writer to get the sync lock fsyncs the file once and records
+    how far it is now durable, along with the file's ID (see
+    backends.file_id); writers whose data lies below that mark in the same
+    file return without another fsync. A journal swapped in by compaction
+    was synced as a whole before the swap.
+
+    Args:
+        path: Append-only file that was written to
+        offset: End of the caller's data
+        window: Seconds to wait for other writers before syncing
+
+    Returns:
+        None
+    """
+    with phase("sync"):
+        if window > 0:
+            time.sleep(window)
+        fd = os.open(path + ".sync", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            _lock(fd)
+            with open(path, "rb") as f:
+                # not the inode, which a file replaced by compaction may
+                # hand on to its successor
+                ident = file_id(f)
+                mark = os.pread(fd, 64, 0).split()
+                if len(mark) == 2 and int(mark[0]) == ident and int(mark[1]) >= offset:
+                    return
+                size = os.fstat(f.fileno()).st_size
+                os.fsync(f.fileno())
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, f"{ident} {size}".encode("ascii"), 0)
+        finally:
+            os.close(fd)
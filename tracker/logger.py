@@ -1,24 +1,44 @@
 import logging
-from logging.handlers import RotatingFileHandler
 import os
 
-# Ensure logs directory exists
-os.makedirs("./logs", exist_ok=True)
+LOG_DIR = "./logs"
+LOG_FILE = "./logs/tracker.log"
 
-# Configure a reusable logger
+# Reusable logger; its file handler is attached by get_logger on first use
 logger = logging.getLogger("tracker")
 logger.setLevel(logging.INFO)  # default level
 
-# Rotating file handler: prevents log file from growing indefinitely
-file_handler = RotatingFileHandler(
-    "./logs/tracker.log",
-    maxBytes=5 * 1024 * 1024,  # 5 MB
-    backupCount=3,  # keep 3 old logs
-)
 
-formatter = logging.Formatter(
-    "%(asctime)s | %(levelname)s | %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-)
+def get_logger() -> logging.Logger:
+    """
+    Get the tracker logger, configuring it on first use.
 
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+    The logs directory and the rotating file handler are only created when
+    something is actually logged, so commands like --help leave no trace.
+
+    Args:
+        None
+
+    Returns:
+        logging.Logger: The configured tracker logger
+    """
+    if not logger.handlers:
+        from logging.handlers import RotatingFileHandler
+
+        # Ensure logs directory exists
+        os.makedirs(LOG_DIR, exist_ok=True)
+
+        # Rotating file handler: prevents log file from growing indefinitely
+        file_handler = RotatingFileHandler(
+            LOG_FILE,
+            maxBytes=5 * 1024 * 1024,  # 5 MB
+            backupCount=3,  # keep 3 old logs
+        )
+
+        formatter = logging.Formatter(
+            "%(asctime)s | %(levelname)s | %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+        )
+
+        file_handler.setFormatter(formatter)
+        logger.addHandler(file_handler)
+    return logger
@@ -1,7 +1,27 @@
+import sys
 from datetime import datetime
 
+# field order of stored rows, e.g. in SQLite and in the ledger cache
+FIELDS = ("id", "date", "category", "amount", "note", "currency", "created_at")
+
+_intern = sys.intern
+
 
 class Expense:
+    """
+    One expense.
+
+    Records use __slots__ instead of a per-row dict, and their date,
+    category and currency strings are interned, so a ledger of a million
+    rows holds each distinct value once. Dict-style access (exp["amount"])
+    is kept for code that treats expenses as mappings; dicts themselves are
+    only built at the JSON boundary, by to_dict.
+    """
+
+    __slots__ = FIELDS
+    # mutable, so not hashable
+    __hash__ = None
+
     def __init__(
         self,
         id: str,
@@ -10,14 +30,69 @@ class Expense:
         currency: str = "BDT",
         amount: float = 0.0,
         note: str = "",
+        created_at: str = None,
     ):
         self.id = id
-        self.date = date or datetime.today().date().isoformat()
-        self.category = category
+        self.date = _intern(date or datetime.today().date().isoformat())
+        self.category = _intern(category)
         self.amount = amount
         self.note = note
-        self.currency = currency
-        self.created_at = datetime.now().isoformat()
+        self.currency = _intern(currency)
+        self.created_at = created_at or datetime.now().isoformat()
+
+    @classmethod
+    def from_values(cls, values) -> "Expense":
+        """
+        Build a record from stored values.
+
+        Args:
+            values: Sequence of values in FIELDS order
+
+        Returns:
+            Expense: The record
+        """
+        exp = cls.__new__(cls)
+        id, date, category, amount, note, currency, created_at = values
+        exp.id = id
+        exp.date = _intern(date)
+        exp.category = _intern(category)
+        exp.amount = amount
+        exp.note = note
+        exp.currency = _intern(currency)
+        exp.created_at = created_at
+        return exp
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Expense":
+        """
+        Build a record from a parsed JSON object.
+
+        Args:
+            data: Expense dictionary
+
+        Returns:
+            Expense: The record
+        """
+        exp = cls.__new__(cls)
+        exp.id = data["id"]
+        exp.date = _intern(data["date"])
+        exp.category = _intern(data["category"])
+        exp.amount = data["amount"]
+        exp.note = data.get("note", "")
+        exp.currency = _intern(data.get("currency", "BDT"))
+        exp.created_at = data.get("created_at", "")
+        return exp
+
+    def values(self) -> tuple:
+        return (
+            self.id,
+            self.date,
+            self.category,
+            self.amount,
+            self.note,
+            self.currency,
+            self.created_at,
+        )
 
     def to_dict(self) -> dict:
         return {
@@ -29,3 +104,72 @@ class Expense:
             "currency": self.currency,
             "created_at": self.created_at,
         }
+
+    def copy(self) -> "Expense":
+        return Expense.from_values(self.values())
+
+    def edit(self, date=None, category=None, amount=None, note=None, currency=None):
+        """
+        Change the given fields, interning new strings like the constructors.
+
+        Args:
+            date: New date (optional)
+            category: New category (optional)
+            amount: New amount (optional)
+            note: New note (optional)
+            currency: New currency (optional)
+
+        Returns:
+            None
+        """
+        if date:
+            self.date = _intern(date)
+        if category:
+            self.category = _intern(category)
+        if amount:
+            self.amount = amount
+        if note:
+            self.note = note
+        if currency:
+            self.currency = _intern(currency)
+
+    def keys(self) -> tuple:
+        return FIELDS
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default) if key in FIELDS else default
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Expense):
+            return self.values() == other.values()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Expense({self.to_dict()!r})"
+
+    def __reduce__(self):
+        # pickled as a plain tuple, e.g. for worker processes
+        return Expense.from_values, (self.values(),)
+
+
+def json_default(obj):
+    """
+    Serialize expense records for json.dumps(..., default=json_default).
+
+    Args:
+        obj: Object the json module cannot serialize itself
+
+    Returns:
+        dict: The expense as a dictionary
+    """
+    if isinstance(obj, Expense):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
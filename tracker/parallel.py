@@ -0,0 +1,88 @@
+import os
+import threading
+from tracker.config import get_int
+from tracker.timings import count, phase
+
+# below this many rows, starting worker processes costs more than it saves
+PARALLEL_MIN_ROWS = 200_000
+
+_pool = None
+_pool_workers = 0
+# daemon connection threads may start or resize the pool at the same time
+_pool_lock = threading.Lock()
+
+
+def worker_count() -> int:
+    """
+    Get the number of worker processes from the "workers" setting.
+
+    Args:
+        None
+
+    Returns:
+        int: Worker processes to use, 1 meaning no parallelism (default: one per usable CPU)
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    return get_int("workers", cpus) or 1
+
+
+def use_workers(rows: int, tasks: int) -> bool:
+    """
+    Decide whether a job is big enough to be split across processes.
+
+    Args:
+        rows: Number of rows the job will read
+        tasks: Number of independent pieces the job splits into
+
+    Returns:
+        bool: True if the job should run in the process pool
+    """
+    if tasks < 2 or worker_count() < 2:
+        return False
+    return rows >= get_int("parallel_min_rows", PARALLEL_MIN_ROWS)
+
+
+def _get_pool():
+    """
+    Get the process pool, starting it on first use.
+
+    The pool is kept for the life of the process, so the daemon starts its
+    workers once. Worker processes are forked from a single-threaded
+    process; the daemon runs connection threads, and forking next to them
+    is unsafe, so it uses a fork server instead.
+    """
+    global _pool, _pool_workers
+    workers = worker_count()
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            if _pool is not None:
+                _pool.shutdown()
+            method = "fork" if threading.active_count() == 1 else "forkserver"
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context(method)
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def run_parallel(func, tasks: list) -> list:
+    """
+    Call a function on every task in worker processes.
+
+    Args:
+        func: Module-level function taking one task
+        tasks: Picklable arguments, one per call
+
+    Returns:
+        list: The results, in the order of the tasks
+    """
+    with phase("workers"):
+        pool = _get_pool()
+        count("worker_tasks", len(tasks))
+        return list(pool.map(func, tasks))
@@ -0,0 +1,523 @@
+import os
+import re
+import json
+import heapq
+import mmap
+import struct
+import marshal
+from array import array
+from bisect import bisect_left
+from tracker.config import get_int
+from tracker.indexes import DerivedIndex
+from tracker.locking import atomic_open
+from tracker.models import Expense
+from tracker.query import date_range, sort_expenses
+from tracker.storage import DATA_DIR, generation, get_many
+from tracker.timings import count, timed
+from tracker.types import ValidatedFilters
+
+SEGMENT_MAGIC = b"EXPPOST1"
+
+# rows the log may hold before it is folded into a new segment; the limit
+# grows with the segment, to a quarter of its rows
+LOG_ROWS = 10_000
+
+# times a read opens the metadata again after a rebuild removed its files
+READ_RETRIES = 5
+
+# a candidate set this many times smaller than a posting list is checked by
+# binary search in the list instead of by walking the whole list
+PROBE_RATIO = 16
+
+
+def _day(date: str) -> int:
+    # YYYYMMDD, which orders like the date itself
+    return int(date.replace("-", ""))
+
+
+def _key(exp: Expense) -> tuple[int, int] | None:
+    # sequence number and ID date, from which the ID is rebuilt; the checks
+    # of parseExpenseNo and parseExpenseDate, splitting the ID once
+    parts = exp.id.split("-")
+    if len(parts) != 3 or parts[0] != "EXP" or len(parts[1]) != 8:
+        return None
+    if not (parts[1].isdigit() and parts[2].isdigit()):
+        return None
+    return int(parts[2]), int(parts[1])
+
+
+def _contains(postings, no: int) -> bool:
+    i = bisect_left(postings, no)
+    return i < len(postings) and postings[i] == no
+
+
+def _padded(size: int) -> int:
+    return size + -size % 8
+
+
+class Segment:
+    """
+    Memory-mapped segment file.
+
+    The file holds a header (the sorted terms, where each term's posting
+    list starts, the category dictionary with the number and total of the
+    expenses of each category, and the number of rows), the posting lists
+    as sorted sequence numbers, and one column per field, indexed by
+    sequence number, for the amount, the date of the ID, the date and the
+    category code. Rows that do not exist have date 0.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:8] != SEGMENT_MAGIC:
+            raise ValueError(f"Index segment '{path}' is corrupted.")
+        (header_size,) = struct.unpack_from("<Q", self.map, 8)
+        # the rest is paged in by lookups as they touch it
+        count("bytes_read", 16 + header_size)
+        header = marshal.loads(self.map[16 : 16 + header_size])
+        self.terms = header["terms"]
+        self.starts = array("Q")
+        self.starts.frombytes(header["starts"])
+        # category names as stored, and case-folded for filtering
+        self.categories = header["categories"]
+        self.folded = [category.lower() for category in self.categories]
+        self.category_counts = header["category_counts"]
+        self.category_totals = header["category_totals"]
+        self.rows = header["rows"]
+        size = header["size"]
+
+        view = memoryview(self.map)
+        offset = 16 + header_size
+        postings = self.starts[-1] if self.starts else 0
+        self.postings = view[offset : offset + 4 * postings].cast("I")
+        offset += _padded(4 * postings)
+        self.amounts = view[offset : offset + 8 * size].cast("d")
+        offset += 8 * size
+        self.id_dates = view[offset : offset + 4 * size].cast("I")
+        offset += 4 * size
+        self.dates = view[offset : offset + 4 * size].cast("I")
+        offset += 4 * size
+        self.codes = view[offset : offset + 4 * size].cast("I")
+        self.columns = (self.id_dates, self.dates, self.codes, self.amounts)
+
+    def lookup(self, term: str, prefix: bool = False) -> list:
+        """
+        Get the posting list of a term, or those of every term it prefixes.
+        """
+        i = bisect_left(self.terms, term)
+        lists = []
+        while i < len(self.terms) and (
+            self.terms[i] == term or (prefix and self.terms[i].startswith(term))
+        ):
+            lists.append(self.postings[self.starts[i] : self.starts[i + 1]])
+            if not prefix:
+                break
+            i += 1
+        return lists
+
+    def has(self, no: int) -> bool:
+        return no < len(self.dates) and self.dates[no] != 0
+
+
+class Delta:
+    """
+    The changes recorded in the log since the segment was written.
+    """
+
+    def __init__(self):
+        # sequence number -> (ID date, date, category, amount, terms)
+        self.docs = {}
+        self.postings = {}
+        # rows whose segment entry no longer counts
+        self.removed = set()
+        self.offset = 0
+
+    def apply(self, removed: list, added: list):
+        for no in removed:
+            doc = self.docs.pop(no, None)
+            if doc is not None:
+                for term in doc[4]:
+                    self.postings[term].discard(no)
+            self.removed.add(no)
+        for no, *doc in added:
+            self.docs[no] = doc
+            for term in doc[4]:
+                self.postings.setdefault(term, set()).add(no)
+
+    def lookup(self, term: str, prefix: bool = False) -> set:
+        if not prefix:
+            return self.postings.get(term, set())
+        matched = set()
+        for other, nos in self.postings.items():
+            if other.startswith(term):
+                matched |= nos
+        return matched
+
+
+class PostingIndex(DerivedIndex):
+    """
+    Base class for inverted indexes from terms to the expenses holding them.
+
+    The index is an immutable segment, data/<name>-<build>.idx, plus a log
+    of the adds and deletes recorded since, data/<name>-<build>.log, both
+    named by the metadata file at path, which also holds the data
+    generation the index reflects and how much of the log is valid. Reads
+    map the segment and touch only the posting lists of their terms, so
+    their cost depends on the lists, not on the number of expenses; the log
+    is replayed on top. Once the log outgrows its limit (the
+    "<name>_log_rows" setting, or a quarter of the segment), the next write
+    folds it into a new segment.
+
+    Alongside the posting lists the segment keeps each row's dates, amount
+    and category code, so filters, sorting and limits run on the index and
+    only the rows returned are read from storage. Rows are keyed by the
+    sequence number in their ID; expenses whose ID is not in the
+    EXP-YYYYMMDD-NNNN format are not indexed. Subclasses set name and
+    path and implement terms.
+    """
+
+    name = None
+
+    def __init__(self):
+        self._build = None
+        self._segment = None
+        self._delta = None
+
+    def terms(self, exp: Expense) -> tuple:
+        raise NotImplementedError
+
+    def empty(self):
+        return {"docs": {}, "postings": {}}
+
+    def add(self, state, exp):
+        key = _key(exp)
+        if key is None:
+            return
+        no, id_date = key
+        state["docs"][no] = (id_date, _day(exp.date), exp.category, exp.amount)
+        for term in self.terms(exp):
+            state["postings"].setdefault(term, []).append(no)
+
+    def remove(self, state, exp):
+        key = _key(exp)
+        if key is not None and state["docs"].pop(key[0], None) is not None:
+            for term in self.terms(exp):
+                state["postings"][term].remove(key[0])
+
+    def _file(self, build: int, ext: str) -> str:
+        return os.path.join(DATA_DIR, f"{self.name}-{build}.{ext}")
+
+    def _read_meta(self) -> dict | None:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r") as f:
+            data = f.read()
+        count("bytes_read", len(data))
+        try:
+            meta = json.loads(data)
+        except json.JSONDecodeError:
+            return None
+        if meta.get("version") != self.version:
+            return None
+        return meta
+
+    def _write_meta(self, meta: dict):
+        data = json.dumps(meta, separators=(",", ":"))
+        with atomic_open(self.path, "w") as f:
+            f.write(data)
+        count("bytes_written", len(data))
+
+    def _write(self, state):
+        """
+        Write a rebuilt index as a new segment with an empty log.
+        """
+        # build numbers are never reused, even after the metadata was
+        # discarded, since a process may still hold an older build open
+        pattern = re.compile(rf"^{self.name}-(\d+)\.(idx|log)$")
+        names = [pattern.match(name) for name in os.listdir(DATA_DIR)]
+        build = max((int(name[1]) for name in names if name), default=0) + 1
+
+        docs = state["docs"]
+        size = max(docs, default=0) + 1
+        terms = sorted(state["postings"])
+        starts = array("Q", [0])
+        postings = array("I")
+        for term in terms:
+            postings.extend(sorted(state["postings"][term]))
+            starts.append(len(postings))
+
+        categories = []
+        category_codes = {}
+        category_counts = []
+        category_totals = []
+        amounts = array("d", bytes(8 * size))
+        id_dates = array("I", bytes(4 * size))
+        dates = array("I", bytes(4 * size))
+        codes = array("I", bytes(4 * size))
+        for no, (id_date, date, category, amount) in docs.items():
+            code = category_codes.get(category)
+            if code is None:
+                code = category_codes[category] = len(categories)
+                categories.append(category)
+                category_counts.append(0)
+                category_totals.append(0)
+            category_counts[code] += 1
+            category_totals[code] += amount
+            id_dates[no] = id_date
+            dates[no] = date
+            codes[no] = code
+            amounts[no] = amount
+
+        header = marshal.dumps(
+            {
+                "terms": terms,
+                "starts": starts.tobytes(),
+                "categories": categories,
+                "category_counts": category_counts,
+                "category_totals": category_totals,
+                "rows": len(docs),
+                "size": size,
+            }
+        )
+        header += bytes(-len(header) % 8)
+        with atomic_open(self._file(build, "idx")) as f:
+            f.write(SEGMENT_MAGIC + struct.pack("<Q", len(header)) + header)
+            f.write(postings.tobytes() + bytes(-4 * len(postings) % 8))
+            for column in (amounts, id_dates, dates, codes):
+                f.write(column.tobytes())
+            count("bytes_written", f.tell())
+        open(self._file(build, "log"), "wb").close()
+        self._write_meta(
+            {
+                "version": self.version,
+                "generation": state["generation"],
+                "build": build,
+                "rows": len(docs),
+                "log_rows": 0,
+                "log_bytes": 0,
+            }
+        )
+
+        # readers that already opened the old files keep reading them
+        for name in names:
+            if name:
+                os.remove(os.path.join(DATA_DIR, name[0]))
+
+    def _read(self):
+        """
+        Open the current segment and replay the valid part of its log.
+
+        The segment and the replayed log are kept between calls, so a
+        long-running process only reads the log records added since.
+        """
+        for _ in range(READ_RETRIES):
+            meta = self._read_meta()
+            if meta is None:
+                return None
+            try:
+                if self._build != meta["build"]:
+                    self._segment = Segment(self._file(meta["build"], "idx"))
+                    self._delta = Delta()
+                    self._build = meta["build"]
+                if not self._replay(meta["log_bytes"]):
+                    return None
+            except FileNotFoundError:
+                self._build = None
+                continue
+            except ValueError:
+                self._build = None
+                return None
+            return {"generation": meta["generation"], "meta": meta}
+        return None
+
+    def _replay(self, end: int) -> bool:
+        delta = self._delta
+        if end < delta.offset:
+            # the log never shrinks within a build
+            self._build = None
+            return False
+        if end == delta.offset:
+            return True
+        with open(self._file(self._build, "log"), "rb") as f:
+            f.seek(delta.offset)
+            data = f.read(end - delta.offset)
+        count("bytes_read", len(data))
+        if len(data) < end - delta.offset:
+            return False
+        pos = 0
+        while pos < len(data):
+            (size,) = struct.unpack_from("<I", data, pos)
+            try:
+                removed, added = marshal.loads(data[pos + 4 : pos + 4 + size])
+            except (EOFError, ValueError, TypeError):
+                self._build = None
+                return False
+            delta.apply(removed, added)
+            pos += 4 + size
+        delta.offset = end
+        return True
+
+    @timed("index")
+    def current(self) -> dict:
+        state = self._read()
+        if state is None or state["generation"] != generation():
+            self.rebuild()
+            state = self._read()
+        return state
+
+    @timed("index")
+    def record(self, before: int, added=(), removed=()):
+        meta = self._read_meta()
+        if meta is None or meta["generation"] != before:
+            self.invalidate()
+            return
+
+        log_rows = meta["log_rows"] + len(added) + len(removed)
+        limit = get_int(f"{self.name}_log_rows", LOG_ROWS)
+        if log_rows > max(limit, meta["rows"] // 4):
+            self.rebuild()
+            return
+
+        removed_keys = [_key(exp) for exp in removed]
+        added_docs = []
+        for exp in added:
+            key = _key(exp)
+            if key is not None:
+                added_docs.append(
+                    (
+                        *key,
+                        _day(exp.date),
+                        exp.category,
+                        exp.amount,
+                        self.terms(exp),
+                    )
+                )
+        frame = marshal.dumps(
+            ([key[0] for key in removed_keys if key is not None], added_docs)
+        )
+        with open(self._file(meta["build"], "log"), "r+b") as f:
+            # anything past the valid length is from a writer that died
+            f.truncate(meta["log_bytes"])
+            f.seek(meta["log_bytes"])
+            f.write(struct.pack("<I", len(frame)) + frame)
+            count("bytes_written", 4 + len(frame))
+            meta["log_bytes"] = f.tell()
+        meta["log_rows"] = log_rows
+        meta["generation"] = generation()
+        self._write_meta(meta)
+
+    def invalidate(self):
+        super().invalidate()
+        self._build = None
+
+    def _matches(self, group: list[tuple[str, bool]]) -> set:
+        """
+        Find the rows holding every one of a list of terms.
+
+        The terms are taken from the smallest to the largest posting list;
+        the rows still in the running are checked against a long list by
+        binary search, and against a short one by set intersection.
+        """
+        segment, delta = self._segment, self._delta
+        terms = []
+        for term, prefix in group:
+            lists = segment.lookup(term, prefix)
+            extra = delta.lookup(term, prefix)
+            terms.append((sum(map(len, lists)) + len(extra), lists, extra))
+        terms.sort(key=lambda term: term[0])
+
+        size, lists, extra = terms[0]
+        count("postings_read", size)
+        candidates = set().union(*lists)
+        candidates -= delta.removed
+        candidates |= extra
+        for size, lists, extra in terms[1:]:
+            if not candidates:
+                break
+            if len(candidates) * PROBE_RATIO < size:
+                count("postings_probed", len(candidates) * len(lists))
+                candidates = {
+                    no
+                    for no in candidates
+                    if no in extra
+                    or (
+                        no not in delta.removed
+                        and any(_contains(postings, no) for postings in lists)
+                    )
+                }
+            else:
+                count("postings_read", size)
+                matched = set()
+                for postings in lists:
+                    # walks the list without building a set of it
+                    matched |= candidates.intersection(postings)
+                matched -= delta.removed
+                candidates = matched | (candidates & extra)
+        return candidates
+
+    def _column(self, field: int):
+        """
+        Get a function reading one field of a row: 0 the ID date, 1 the
+        date, 2 the case-folded category and 3 the amount.
+        """
+        segment, docs = self._segment, self._delta.docs
+        if field == 2:
+            folded, codes = segment.folded, segment.codes
+            column = lambda no: folded[codes[no]]
+        else:
+            column = segment.columns[field].__getitem__
+        if not docs:
+            return column
+        if field == 2:
+            return lambda no: docs[no][2].lower() if no in docs else column(no)
+        return lambda no: docs[no][field] if no in docs else column(no)
+
+    def _select(
+        self, matched: set, validated: ValidatedFilters, max_rows: int | None = None
+    ) -> list[Expense] | None:
+        """
+        Filter, sort and limit matched rows on the index, then read them.
+
+        Args:
+            matched: Sequence numbers of the candidate rows
+            validated: Validated filter object
+            max_rows: Give up, returning None, rather than read more rows than this (optional)
+
+        Returns:
+            list[Expense] | None: The expenses, sorted and limited like list
+        """
+        # in insertion order, which sorting keeps for ties, as in list
+        nos = sorted(matched)
+        bounds = date_range(validated)
+        if bounds:
+            first, last = _day(bounds[0]), _day(bounds[1])
+            date = self._column(1)
+            nos = [no for no in nos if first <= date(no) <= last]
+        if validated.category:
+            category = self._column(2)
+            nos = [no for no in nos if category(no) == validated.category]
+        amount = self._column(3)
+        if validated.min_amount:
+            nos = [no for no in nos if amount(no) >= validated.min_amount]
+        if validated.max_amount:
+            nos = [no for no in nos if amount(no) <= validated.max_amount]
+        count("rows_matched", len(nos))
+
+        if validated.sort != "category":
+            key = self._column(1) if validated.sort == "date" else amount
+            descending = validated.sort_direction == -1
+            if validated.limit:
+                top_k = heapq.nlargest if descending else heapq.nsmallest
+                nos = top_k(validated.limit, nos, key=key)
+            else:
+                nos.sort(key=key, reverse=descending)
+        if max_rows is not None and len(nos) > max_rows:
+            return None
+
+        id_date = self._column(0)
+        # the format of generateExpenseId
+        expenses = get_many([f"EXP-{id_date(no)}-{no:04d}" for no in nos])
+        if validated.sort == "category":
+            expenses = sort_expenses(expenses, validated)
+        return expenses
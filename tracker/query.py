@@ -0,0 +1,276 @@
+import calendar
+import heapq
+from itertools import islice
+from operator import attrgetter
+from typing import Iterable, Iterator
+from tracker.models import Expense
+from tracker.sketch import add_amount, merge_sketches, new_sketch
+from tracker.timings import count, phase, timed, timed_chunks
+from tracker.types import ValidatedFilters
+
+# filters that match every expense
+ALL_EXPENSES = ValidatedFilters(
+    month=None,
+    sort="date",
+    from_date=None,
+    to_date=None,
+    category=None,
+    min_amount=None,
+    max_amount=None,
+    limit=None,
+    sort_direction=1,
+)
+
+
+def month_bounds(month: str) -> tuple[str, str]:
+    """
+    Get the first and last day of a month.
+
+    Args:
+        month: Month in YYYY-MM format
+
+    Returns:
+        tuple[str, str]: First and last date of the month in YYYY-MM-DD format
+    """
+    year, mon = map(int, month.split("-"))
+    days_in_month = calendar.monthrange(year, mon)[1]
+    return f"{month}-01", f"{month}-{days_in_month:02d}"
+
+
+def months_between(first: str, last: str) -> list[str]:
+    """
+    List the months touched by an inclusive date range.
+
+    Args:
+        first: First date in YYYY-MM-DD format
+        last: Last date in YYYY-MM-DD format
+
+    Returns:
+        list[str]: Months in YYYY-MM format, in chronological order
+    """
+    year, mon = int(first[:4]), int(first[5:7])
+    months = []
+    while f"{year:04d}-{mon:02d}" <= last[:7]:
+        months.append(f"{year:04d}-{mon:02d}")
+        year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return months
+
+
+def date_range(validated: ValidatedFilters) -> tuple[str, str] | None:
+    """
+    Get the inclusive date range covered by the month and from/to filters.
+
+    Args:
+        validated: Validated filter object
+
+    Returns:
+        tuple[str, str] | None: First and last date in YYYY-MM-DD format, or None if the dates are unbounded
+    """
+    if not (validated.month or validated.from_date or validated.to_date):
+        return None
+
+    first, last = "0000-00-00", "9999-99-99"
+    if validated.month:
+        first, last = month_bounds(validated.month)
+    if validated.from_date:
+        first = max(first, validated.from_date)
+    if validated.to_date:
+        last = min(last, validated.to_date)
+    return first, last
+
+
+def matches(exp: Expense, validated: ValidatedFilters) -> bool:
+    """
+    Check whether an expense passes every filter.
+
+    Args:
+        exp: Expense record to test
+        validated: Validated filter object
+
+    Returns:
+        bool: True if the expense matches all filters
+    """
+    if validated.month and not exp.date.startswith(validated.month):
+        return False
+    if validated.from_date and exp.date < validated.from_date:
+        return False
+    if validated.to_date and exp.date > validated.to_date:
+        return False
+    if validated.category and exp.category.lower() != validated.category:
+        return False
+    if validated.min_amount and exp.amount < validated.min_amount:
+        return False
+    if validated.max_amount and exp.amount > validated.max_amount:
+        return False
+    return True
+
+
+def filter_expenses(expenses, validated: ValidatedFilters) -> list[Expense]:
+    """
+    Keep only the expenses that match the filters.
+
+    Args:
+        expenses: Iterable of expense records
+        validated: Validated filter object
+
+    Returns:
+        list[Expense]: Matching expenses in their original order
+    """
+    expenses = timed_chunks(expenses, "load", "rows_scanned")
+    with phase("filter"):
+        matched = [exp for exp in expenses if matches(exp, validated)]
+    count("rows_matched", len(matched))
+    return matched
+
+
+def iter_matching(expenses, validated: ValidatedFilters) -> Iterator[Expense]:
+    """
+    Lazily yield the expenses that match the filters.
+
+    Args:
+        expenses: Iterable of expense records
+        validated: Validated filter object
+
+    Returns:
+        Iterator[Expense]: Matching expenses in their original order
+    """
+    expenses = timed_chunks(expenses, "load", "rows_scanned")
+    matched = (exp for exp in expenses if matches(exp, validated))
+    return timed_chunks(matched, "filter", "rows_matched")
+
+
+@timed("sort")
+def sort_expenses(expenses, validated: ValidatedFilters) -> list[Expense]:
+    """
+    Sort expenses by the requested key and apply the limit.
+
+    With a limit only the top k rows are kept, in a heap of size k, so the
+    input can be a generator straight out of the filter loop and memory
+    stays O(k). heapq.nsmallest and nlargest are defined to return the same
+    rows in the same order as sorted(...)[:k], ties included.
+
+    Args:
+        expenses: Iterable of expense records, in insertion order
+        validated: Validated filter object with sort key, direction and limit
+
+    Returns:
+        list[Expense]: Sorted and limited expenses
+    """
+    key = attrgetter(validated.sort)
+    descending = validated.sort_direction == -1
+    if validated.limit:
+        top_k = heapq.nlargest if descending else heapq.nsmallest
+        return top_k(validated.limit, expenses, key=key)
+    return sorted(expenses, key=key, reverse=descending)
+
+
+@timed("aggregate")
+def aggregate_expenses(expenses: Iterable[Expense]) -> dict:
+    """
+    Compute totals over expenses in a single pass.
+
+    Args:
+        expenses: Iterable of expense records in date order, e.g. a generator
+            straight out of the filter loop
+
+    Returns:
+        dict: grand_total, total_expenses, category_totals, category_sketches, highest_expense and currency
+    """
+    total_amount = 0
+    total_expenses = 0
+    category_totals = {}
+    category_sketches = {}
+    highest_expense = None
+    for exp in expenses:
+        total_expenses += 1
+        amount = exp.amount
+        total_amount += amount
+        cat = exp.category
+        category_totals[cat] = category_totals.get(cat, 0) + amount
+        sketch = category_sketches.get(cat)
+        if sketch is None:
+            sketch = category_sketches[cat] = new_sketch()
+        add_amount(sketch, amount)
+        if highest_expense is None or amount > highest_expense.amount:
+            highest_expense = exp
+
+    return {
+        "grand_total": total_amount,
+        "total_expenses": total_expenses,
+        "category_totals": category_totals,
+        "category_sketches": category_sketches,
+        "highest_expense": highest_expense,
+        "currency": highest_expense.currency if highest_expense else None,
+    }
+
+
+@timed("aggregate")
+def merge_aggregates(partials: list[dict]) -> dict:
+    """
+    Combine totals computed over consecutive date ranges.
+
+    The result is the same as aggregate_expenses over all the expenses:
+    categories keep the order in which they first appear and the highest
+    expense is the earliest of the largest.
+
+    Args:
+        partials: Results of aggregate_expenses, in date order
+
+    Returns:
+        dict: grand_total, total_expenses, category_totals, category_sketches, highest_expense and currency
+    """
+    total_amount = 0
+    total_expenses = 0
+    category_totals = {}
+    category_sketches = {}
+    highest_expense = None
+    for partial in partials:
+        total_amount += partial["grand_total"]
+        total_expenses += partial["total_expenses"]
+        for cat, total in partial["category_totals"].items():
+            category_totals[cat] = category_totals.get(cat, 0) + total
+        for cat, sketch in partial["category_sketches"].items():
+            merge_sketches(category_sketches.setdefault(cat, new_sketch()), sketch)
+        highest = partial["highest_expense"]
+        if highest is not None and (
+            highest_expense is None or highest["amount"] > highest_expense["amount"]
+        ):
+            highest_expense = highest
+
+    return {
+        "grand_total": total_amount,
+        "total_expenses": total_expenses,
+        "category_totals": category_totals,
+        "category_sketches": category_sketches,
+        "highest_expense": highest_expense,
+        "currency": highest_expense["currency"] if highest_expense else None,
+    }
+
+
+@timed("sort")
+def merge_sorted(
+    runs: list[list[Expense]], validated: ValidatedFilters, order
+) -> list[Expense]:
+    """
+    Merge runs sorted by sort_expenses into one sorted, limited list.
+
+    Each run must have been sorted from expenses in insertion order, so
+    that rows with equal sort keys are in insertion order within it; order
+    gives that position, and ties between runs are broken by it as well.
+
+    Args:
+        runs: Outputs of sort_expenses over disjoint sets of expenses
+        validated: Validated filter object with sort key, direction and limit
+        order: Function returning an expense's insertion position as an int
+
+    Returns:
+        list[Expense]: The same rows as sort_expenses over all the expenses
+    """
+    value = attrgetter(validated.sort)
+    if validated.sort_direction == -1:
+        # descending keys, but ascending insertion order among ties
+        key = lambda exp: (value(exp), -order(exp))
+        merged = heapq.merge(*runs, key=key, reverse=True)
+    else:
+        merged = heapq.merge(*runs, key=lambda exp: (value(exp), order(exp)))
+    return list(islice(merged, validated.limit))
@@ -0,0 +1,135 @@
+import os
+import marshal
+import hashlib
+from datetime import datetime
+from tracker.config import get_int, get_setting
+from tracker.locking import atomic_open
+from tracker.models import Expense
+from tracker.storage import DEFAULT_ENGINE, generation
+from tracker.timings import count, timed
+from tracker.types import ValidatedFilters
+
+RESULTS_DIR = "./data/results"
+
+# total size of the cached results; the least recently used are evicted
+# beyond it, and 0 switches the cache off
+RESULT_CACHE_BYTES = 16 * 1024 * 1024
+
+# a result larger than this share of the cache is not stored
+MAX_SHARE = 4
+
+# part of every key, bumped when the fields of a result change so that
+# results stored by an older version are not served
+FORMAT = 2
+
+
+def _pack(kind: str, result):
+    # expense records are stored as their values, which marshal can write
+    if kind == "list":
+        return [exp.values() for exp in result]
+    if result and result["highest_expense"] is not None:
+        highest = result["highest_expense"]
+        if not isinstance(highest, Expense):
+            highest = Expense.from_dict(highest)
+        return {**result, "highest_expense": highest.values()}
+    return result
+
+
+def _unpack(kind: str, payload):
+    if kind == "list":
+        return [Expense.from_values(values) for values in payload]
+    if payload and payload["highest_expense"] is not None:
+        payload["highest_expense"] = Expense.from_values(payload["highest_expense"])
+    return payload
+
+
+def _evict(limit: int):
+    """
+    Remove the least recently used results until the cache fits its limit.
+    """
+    entries = []
+    with os.scandir(RESULTS_DIR) as it:
+        for entry in it:
+            # skips files still being written
+            if not entry.name.endswith(".res"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    size = sum(entry[1] for entry in entries)
+    for _, entry_size, path in sorted(entries):
+        if size <= limit:
+            break
+        try:
+            os.remove(path)
+            count("result_cache_evictions")
+        except FileNotFoundError:
+            pass
+        size -= entry_size
+
+
+@timed("cache")
+def cached(kind: str, validated: ValidatedFilters, compute):
+    """
+    Get a query result from the result cache, computing and storing it on a miss.
+
+    Results live in data/results, one file per query, named by a hash of
+    the result format, the storage engine, the kind of query and the
+    validated filters, and hold the data generation they were computed
+    at. Every write bumps the generation, so a result is only served while
+    the data is unchanged. Each hit marks its file as recently used; once
+    the files outgrow the "result_cache_bytes" setting, the least recently
+    used are deleted. Hits and misses are counted in the command's timings
+    and log line.
+
+    Args:
+        kind: Query kind, "list" or "summary"
+        validated: Validated filter object
+        compute: Function computing the result on a miss
+
+    Returns:
+        The result, a list of expenses or a summary dict
+    """
+    limit = get_int("result_cache_bytes", RESULT_CACHE_BYTES)
+    if limit <= 0:
+        return compute()
+
+    # summary titles and averages fall back to the current month
+    key = repr(
+        (
+            FORMAT,
+            get_setting("storage", DEFAULT_ENGINE),
+            kind,
+            validated,
+            datetime.today().date().isoformat()[:7],
+        )
+    )
+    name = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    path = os.path.join(RESULTS_DIR, f"{name}.res")
+    # read before the query runs, so a write that lands meanwhile makes
+    # the stored result stale rather than wrong
+    current = generation()
+
+    try:
+        with open(path, "rb") as f:
+            stored_key, stored_generation, payload = marshal.load(f)
+            count("bytes_read", f.tell())
+        if stored_key == key and stored_generation == current:
+            os.utime(path)
+            count("result_cache_hits")
+            return _unpack(kind, payload)
+    except (FileNotFoundError, EOFError, ValueError, TypeError):
+        pass
+
+    count("result_cache_misses")
+    result = compute()
+    data = marshal.dumps((key, current, _pack(kind, result)))
+    if len(data) <= limit // MAX_SHARE:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with atomic_open(path) as f:
+            f.write(data)
+        count("bytes_written", len(data))
+        _evict(limit)
+    return result
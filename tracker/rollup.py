@@ -0,0 +1,272 @@
+from dataclasses import replace
+from tracker.indexes import DerivedIndex, get_index
+from tracker.locking import write_lock
+from tracker.models import Expense
+from tracker.query import ALL_EXPENSES, month_bounds, months_between, date_range
+from tracker.sketch import merge_sketches, new_sketch
+from tracker.storage import aggregate, generation, get_by_id, iter_expenses
+from tracker.timings import timed
+from tracker.types import ValidatedFilters
+from tracker.utils import parseExpenseNo
+
+ROLLUP_FILE = "./data/rollup.json"
+
+
+def _highest_key(exp: Expense) -> tuple:
+    # highest amount wins, ties go to the earliest expense
+    return (-exp.amount, exp.date, parseExpenseNo(exp.id) or 0)
+
+
+def _bucket_highest_key(highest: list) -> tuple:
+    amount, date, no, _ = highest
+    return (-amount, date, no)
+
+
+def _first_key(exp: Expense) -> list:
+    return [exp.date, parseExpenseNo(exp.id) or 0]
+
+
+class Rollup(DerivedIndex):
+    """
+    Materialized totals per (month, category).
+
+    Each bucket stores the sum and count of its expenses, the highest
+    expense (amount, date, sequence number and ID) and the date and
+    sequence number of its first expense, which orders categories the same
+    way a scan in date order would. Adds, edits and deletes update one
+    bucket in constant time and are logged to data/rollup.log. Removing a
+    bucket's highest or first expense only marks the bucket stale, so that
+    replaying the log never reads storage; stale buckets are rescanned,
+    for their month and category only, the next time the rollup is read.
+    The sketches of the amounts in each bucket are kept apart, by
+    AmountIndex.
+    """
+
+    path = ROLLUP_FILE
+    version = 2
+    logged = True
+
+    def empty(self):
+        return {"buckets": {}, "stale": []}
+
+    def add(self, state, exp):
+        month = state["buckets"].setdefault(exp.date[:7], {})
+        bucket = month.get(exp.category)
+        if bucket is None:
+            bucket = {"sum": 0, "count": 0, "highest": None, "first": None}
+            month[exp.category] = bucket
+
+        bucket["sum"] += exp.amount
+        bucket["count"] += 1
+        if bucket["highest"] is None or _highest_key(exp) < _bucket_highest_key(
+            bucket["highest"]
+        ):
+            bucket["highest"] = [
+                exp.amount,
+                exp.date,
+                parseExpenseNo(exp.id) or 0,
+                exp.id,
+            ]
+        if bucket["first"] is None or _first_key(exp) < bucket["first"]:
+            bucket["first"] = _first_key(exp)
+
+    def remove(self, state, exp):
+        month_key = exp.date[:7]
+        month = state["buckets"].get(month_key, {})
+        bucket = month.get(exp.category)
+        if bucket is None:
+            return
+
+        bucket["count"] -= 1
+        bucket["sum"] -= exp.amount
+        key = [month_key, exp.category]
+        if bucket["count"] <= 0:
+            del month[exp.category]
+            if not month:
+                del state["buckets"][month_key]
+            if key in state["stale"]:
+                state["stale"].remove(key)
+        elif bucket["highest"][3] == exp.id or bucket["first"] == _first_key(exp):
+            if key not in state["stale"]:
+                state["stale"].append(key)
+
+    def _settle(self, state: dict):
+        """
+        Recompute the stale buckets from the stored expenses of their month.
+
+        Only valid while storage is at the state's generation, i.e. under
+        the write lock.
+        """
+        for month, category in state["stale"]:
+            del state["buckets"][month][category]
+            validated = replace(ALL_EXPENSES, month=month, category=category.lower())
+            for exp in iter_expenses(validated):
+                if exp.category == category:
+                    self.add(state, exp)
+            if not state["buckets"][month]:
+                del state["buckets"][month]
+        state["stale"] = []
+
+    def current(self):
+        state = super().current()
+        if state["stale"]:
+            # rescanning reads storage, which must not move meanwhile
+            with write_lock():
+                state = super().current()
+                if state["stale"]:
+                    self._settle(state)
+                    self._write(state)
+        return state
+
+    @timed("aggregate")
+    def totals(self, validated: ValidatedFilters) -> dict | None:
+        """
+        Compute summary totals from the rollup.
+
+        Whole months come straight from their buckets. The partial months at
+        either end of a from/to range are aggregated from storage.
+
+        Args:
+            validated: Validated filter object
+
+        Returns:
+            dict | None: Totals in the same shape as storage.aggregate, or None if the filters need row-level amounts
+        """
+        if validated.min_amount or validated.max_amount:
+            return None
+
+        state = self.current()
+        bounds = date_range(validated)
+        if bounds is None:
+            months = sorted(state["buckets"])
+            bounds = ("0000-00-00", "9999-99-99")
+        else:
+            months = months_between(*bounds)
+        sketches = None
+
+        total_amount = 0
+        count = 0
+        category_totals = {}
+        category_sketches = {}
+        highest_expense = None
+        highest_key = None
+        highest_id = None
+
+        for month in months:
+            first, last = month_bounds(month)
+            if first < bounds[0] or last > bounds[1]:
+                part = aggregate(
+                    replace(
+                        ALL_EXPENSES,
+                        from_date=max(first, bounds[0]),
+                        to_date=min(last, bounds[1]),
+                        category=validated.category,
+                    )
+                )
+                if part["total_expenses"] == 0:
+                    continue
+                total_amount += part["grand_total"]
+                count += part["total_expenses"]
+                for cat, total in part["category_totals"].items():
+                    category_totals[cat] = category_totals.get(cat, 0) + total
+                for cat, sketch in part["category_sketches"].items():
+                    merge_sketches(
+                        category_sketches.setdefault(cat, new_sketch()), sketch
+                    )
+                key = _highest_key(part["highest_expense"])
+                if highest_key is None or key < highest_key:
+                    highest_key, highest_id = key, None
+                    highest_expense = part["highest_expense"]
+                continue
+
+            buckets = state["buckets"].get(month, {})
+            if buckets and sketches is None:
+                sketches = get_index("amounts").current()["buckets"]
+            matching = [
+                (bucket["first"], cat, bucket)
+                for cat, bucket in buckets.items()
+                if not validated.category or cat.lower() == validated.category
+            ]
+            for _, cat, bucket in sorted(matching):
+                total_amount += bucket["sum"]
+                count += bucket["count"]
+                category_totals[cat] = category_totals.get(cat, 0) + bucket["sum"]
+                sketch = category_sketches.setdefault(cat, new_sketch())
+                # missing only if a write landed between reading the two indexes
+                merge_sketches(sketch, sketches.get(month, {}).get(cat, new_sketch()))
+                key = _bucket_highest_key(bucket["highest"])
+                if highest_key is None or key < highest_key:
+                    highest_key, highest_id = key, bucket["highest"][3]
+
+        if highest_id is not None:
+            highest_expense = get_by_id(highest_id)
+
+        return {
+            "grand_total": total_amount,
+            "total_expenses": count,
+            "category_totals": category_totals,
+            "category_sketches": category_sketches,
+            "highest_expense": highest_expense,
+            "currency": highest_expense["currency"] if highest_expense else None,
+        }
+
+    def check(self) -> list[str]:
+        """
+        Compare the stored rollup with one computed from the raw expenses.
+
+        Args:
+            None
+
+        Returns:
+            list[str]: A description of every bucket that differs
+        """
+        with write_lock():
+            stored = self._read() or self.empty()
+            if stored.get("generation") == generation():
+                self._settle(stored)
+            actual = self.empty()
+            for exp in iter_expenses(ALL_EXPENSES):
+                self.add(actual, exp)
+
+        problems = []
+        if stored.get("generation") != generation():
+            problems.append(
+                f"rollup reflects generation {stored.get('generation')}, data is at generation {generation()}"
+            )
+        for month in sorted(set(stored["buckets"]) | set(actual["buckets"])):
+            stored_month = stored["buckets"].get(month, {})
+            actual_month = actual["buckets"].get(month, {})
+            for cat in sorted(set(stored_month) | set(actual_month)):
+                have = stored_month.get(cat)
+                want = actual_month.get(cat)
+                if have is None or want is None:
+                    problems.append(
+                        f"{month} {cat}: bucket is {'missing' if have is None else 'not in the data'}"
+                    )
+                elif (
+                    have["count"] != want["count"]
+                    or abs(have["sum"] - want["sum"]) > 1e-6
+                    or have["highest"][3] != want["highest"][3]
+                ):
+                    problems.append(
+                        f"{month} {cat}: stored {have['count']} expenses totalling {have['sum']:.2f}, "
+                        f"actual {want['count']} totalling {want['sum']:.2f}"
+                    )
+        return problems
+
+    def rows(self) -> list[tuple[str, str, int, float, str]]:
+        """
+        List every bucket of the rollup.
+
+        Args:
+            None
+
+        Returns:
+            list[tuple[str, str, int, float, str]]: Month, category, count, total and highest expense ID
+        """
+        state = self.current()
+        return [
+            (month, cat, bucket["count"], bucket["sum"], bucket["highest"][3])
+            for month in sorted(state["buckets"])
+            for cat, bucket in sorted(state["buckets"][month].items())
+        ]
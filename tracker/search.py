@@ -0,0 +1,86 @@
+import re
+from tracker.models import Expense
+from tracker.postings import PostingIndex
+from tracker.timings import timed
+from tracker.types import ValidatedFilters
+
+SEARCH_FILE = "./data/search.json"
+
+_word = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Split text into lowercase word tokens.
+
+    Args:
+        text: Note, category or search query
+
+    Returns:
+        list[str]: Tokens in the order they appear
+    """
+    return _word.findall(text.lower())
+
+
+def parse_query(text: str) -> list[list[tuple[str, bool]]]:
+    """
+    Parse a search query into alternatives of required terms.
+
+    Words are all required, OR (in capitals) separates alternatives, and a
+    word ending in * matches every token it is a prefix of.
+
+    Args:
+        text: Search query, e.g. 'uber air*' or 'taxi OR uber'
+
+    Returns:
+        list[list[tuple[str, bool]]]: For each alternative, its tokens and whether each is a prefix
+    """
+    groups = [[]]
+    for word in text.split():
+        if word == "OR":
+            groups.append([])
+            continue
+        prefix = word.endswith("*")
+        tokens = tokenize(word.rstrip("*"))
+        for n, token in enumerate(tokens):
+            groups[-1].append((token, prefix and n == len(tokens) - 1))
+    if not all(groups):
+        raise ValueError(
+            "Invalid search query. Give at least one word, and words on both sides of OR."
+        )
+    return groups
+
+
+class SearchIndex(PostingIndex):
+    """
+    Inverted index of the words in every expense's note and category.
+
+    Stored as data/search.json and data/search-<build>.idx and .log; see
+    PostingIndex.
+    """
+
+    name = "search"
+    path = SEARCH_FILE
+    version = 2
+
+    def terms(self, exp):
+        return tuple(set(tokenize(f"{exp.note or ''} {exp.category}")))
+
+    @timed("search")
+    def search(self, text: str, validated: ValidatedFilters) -> list[Expense]:
+        """
+        Find the expenses matching a query and the filters.
+
+        Args:
+            text: Search query, see parse_query
+            validated: Validated filter object
+
+        Returns:
+            list[Expense]: Matching expenses, sorted and limited like list
+        """
+        groups = parse_query(text)
+        self.current()
+        matched = set()
+        for group in groups:
+            matched |= self._matches(group)
+        return self._select(matched, validated)
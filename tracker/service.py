@@ -1,10 +1,136 @@
+import math
 import calendar
 from datetime import datetime
-import json
+from itertools import batched
+from typing import Callable, Iterator
 from tracker.models import Expense
-from tracker.storage import save, load
+from tracker.storage import (
+    save,
+    save_many,
+    update,
+    delete,
+    get_by_id,
+    next_sequence,
+    generation,
+    rebuild_indexes,
+    compact,
+    iter_expenses,
+    query,
+    aggregate,
+)
 from tracker.utils import generateExpenseId, validateDate, validateFilters
-from tracker.types import ExpenseFilters, ExpenseSummary
+from tracker.importer import validate_rows
+from tracker.indexes import derived_indexes, get_index, rebuild_together
+from tracker.locking import write_lock
+from tracker.result_cache import cached
+from tracker.sketch import histogram, merge_sketches, new_sketch, quantile
+from tracker.timings import count, phase, timed_chunks
+from tracker.types import ExpenseFilters, ExpenseSummary, ValidatedFilters
+
+
+def _record_change(before: int, added=(), removed=()):
+    """
+    Report a storage write to every derived index.
+
+    Args:
+        before: Data generation before the write
+        added: Expenses added by the write
+        removed: Expenses removed by the write
+
+    Returns:
+        None
+    """
+    for index in derived_indexes():
+        index.record(before, added, removed)
+
+
+def _list(validated: ValidatedFilters) -> list[Expense]:
+    """
+    Run a list query, without the result cache.
+
+    Args:
+        validated: Validated filter object
+
+    Returns:
+        list[Expense]: Filtered and sorted expenses
+    """
+    # a category filter is answered from the category index; anything
+    # else, or a category too large for it, is pushed down to storage
+    expenses = get_index("categories").query(validated)
+    if expenses is None:
+        expenses = query(validated)
+    return expenses
+
+
+def _summarize(filters: ExpenseFilters, validated: ValidatedFilters) -> ExpenseSummary:
+    """
+    Compute a summary, without the result cache.
+
+    Args:
+        filters: ExpenseFilters dict as given to summarize_expenses
+        validated: The same filters, validated
+
+    Returns:
+        ExpenseSummary: The summary, or an empty list if no expense matches
+    """
+    # whole months are answered from the rollup, anything else from storage
+    totals = get_index("rollup").totals(validated)
+    if totals is None:
+        totals = aggregate(validated)
+
+    if totals["total_expenses"] == 0:
+        return []
+
+    total_amount = totals["grand_total"]
+    count = totals["total_expenses"]
+    category_totals = totals["category_totals"]
+    highest_expense = totals["highest_expense"]
+
+    summary_title = ""
+    if filters.get("from") and filters.get("to"):
+        summary_title = f"Summary ({filters.get("from")} to {filters.get("to")})"
+    else:
+        summary_title = f"Summary ({filters.get("month") or datetime.today().date().isoformat()[:7]})"
+
+    # average per day
+    month = filters.get("month") or datetime.today().date().isoformat()[:7]
+    year, month = map(int, month.split("-"))
+    days_in_month = calendar.monthrange(year, month)[1]
+    average_per_day = total_amount / days_in_month if days_in_month > 0 else 0
+
+    # catergory wise percentage
+    category_percentages = {}
+    for cat, total in category_totals.items():
+        category_percentages[cat] = (
+            (total / total_amount) * 100 if total_amount > 0 else 0
+        )
+
+    # distribution of the amounts, from the per-category sketches
+    category_sketches = totals["category_sketches"]
+    amounts = new_sketch()
+    for sketch in category_sketches.values():
+        merge_sketches(amounts, sketch)
+    category_medians = {
+        cat: quantile(category_sketches[cat], 0.5) for cat in category_totals
+    }
+
+    summary = {
+        "title": summary_title,
+        "grand_total": total_amount,
+        "total_expenses": count,
+        "category_totals": category_totals,
+        "average_per_day": average_per_day,
+        "category_percentages": category_percentages,
+        "highest_expense": highest_expense,
+        "currency": totals["currency"],
+        "median": quantile(amounts, 0.5),
+        "p90": quantile(amounts, 0.9),
+        "p99": quantile(amounts, 0.99),
+        "histogram": histogram(amounts),
+        "category_medians": category_medians,
+    }
+
+    return summary
 
 
 class ExpenseService:
@@ -24,33 +150,83 @@ class ExpenseService:
         if not validateDate(date):
             raise ValueError("Invalid date format. Please use YYYY-MM-DD.")
 
+        if not math.isfinite(amount):
+            raise ValueError(f"Invalid amount '{amount}'.")
+
         if amount < 0:
             raise ValueError("Amount cannot be negative.")
 
-        # get last expense number from storage to generate next id no
-        data = load()
-        expenses = data["expenses"]
-        last_no = 0
-
-        # take the last expense and extract the number
-        if len(expenses) > 0:
-            last_expense = expenses[-1]
-            last_id = last_expense["id"]
-            last_no = int(last_id.split("-")[-1])
-
-        next_no = last_no + 1
-
-        expense = Expense(
-            id=generateExpenseId(date, next_no),
-            date=date,
-            category=category,
-            amount=amount,
-            note=note,
-        )
+        # held from allocating the ID until the derived indexes are updated
+        with write_lock():
+            # the storage engine keeps the sequence counter, no rows are read
+            next_no = next_sequence()
+
+            expense = Expense(
+                id=generateExpenseId(date, next_no),
+                date=date,
+                category=category,
+                amount=amount,
+                note=note,
+            )
 
-        savedExpense = save(expense.to_dict())
+            before = generation()
+            with phase("save"):
+                savedExpense = save(expense)
+            _record_change(before, added=[savedExpense])
         return savedExpense
 
+    def import_expenses(
+        rows: Iterator[tuple[int, dict]],
+        on_error: Callable[[int, str], None],
+        batch_size: int | None = None,
+    ) -> int:
+        """
+        Import a stream of raw rows as new expenses.
+
+        Rows are validated as they stream past, invalid rows are reported
+        through on_error instead of aborting, and the valid ones get
+        consecutive IDs starting from the next sequence number. Without a
+        batch size everything is committed in one storage write; with one,
+        at most batch_size expenses are held in memory at a time.
+
+        Args:
+            rows: Line numbers and raw rows, e.g. from importer.read_rows
+            on_error: Called with the line number and message of each invalid row
+            batch_size: Commit every batch_size expenses instead of all at once (optional)
+
+        Returns:
+            int: Number of expenses imported
+        """
+        if batch_size is not None and batch_size <= 0:
+            raise ValueError("Batch size must be a positive integer.")
+
+        # the IDs are consecutive, so no other writer may run until the end
+        with write_lock():
+            start_no = next_sequence()
+            expenses = (
+                Expense(
+                    id=generateExpenseId(row["date"], start_no + n),
+                    date=row["date"],
+                    category=row["category"],
+                    currency=row["currency"],
+                    amount=row["amount"],
+                    note=row["note"],
+                )
+                for n, row in enumerate(
+                    timed_chunks(validate_rows(rows, on_error), "parse", "rows_scanned")
+                )
+            )
+
+            batches = batched(expenses, batch_size) if batch_size else [expenses]
+            imported = 0
+            for batch in batches:
+                batch = list(batch)
+                before = generation()
+                with phase("save"):
+                    imported += save_many(batch)
+                _record_change(before, added=batch)
+        return imported
+
     def edit_expense(
         id: str, date: str, category: str, amount: float, note: str
     ) -> Expense:
@@ -70,23 +246,25 @@ class ExpenseService:
         if date and not validateDate(date):
             raise ValueError("Invalid date format. Please use YYYY-MM-DD.")
 
+        if amount is not None and not math.isfinite(amount):
+            raise ValueError(f"Invalid amount '{amount}'.")
+
         if amount and amount < 0:
             raise ValueError("Amount cannot be negative.")
 
-        data = load()
-
-        expenses = data["expenses"]
-        for idx, exp in enumerate(expenses):
-            if exp["id"] == id:
-                expenses[idx]["date"] = date or expenses[idx]["date"]
-                expenses[idx]["category"] = category or expenses[idx]["category"]
-                expenses[idx]["amount"] = amount or expenses[idx]["amount"]
-                expenses[idx]["note"] = note or expenses[idx]["note"]
-                # save back
-                with open("./data/expenses.json", "w") as f:
-                    json.dump(data, f, indent=4)
-                return expenses[idx]
-        raise ValueError(f"Expense with ID {id} not found.")
+        # a concurrent edit cannot slip in between reading and storing
+        with write_lock():
+            expense = get_by_id(id)
+            if expense is None:
+                raise ValueError(f"Expense with ID {id} not found.")
+
+            before = generation()
+            original = expense.copy()
+            expense.edit(date, category, amount, note)
+            with phase("save"):
+                updated = update(expense)
+            _record_change(before, added=[updated], removed=[original])
+        return updated
 
     def delete_expense(id: str) -> Expense:
         """
@@ -98,20 +276,23 @@ class ExpenseService:
         Returns:
             Expense: The deleted expense object
         """
-        data = load()
-        expenses = data["expenses"]
-        for idx, exp in enumerate(expenses):
-            if exp["id"] == id:
-                deleted_expense = expenses.pop(idx)
-                with open("./data/expenses.json", "w") as f:
-                    json.dump(data, f, indent=4)
-                return deleted_expense
-        raise ValueError(f"Expense with ID {id} not found.")
+        with write_lock():
+            deleted_expense = get_by_id(id)
+            if deleted_expense is None:
+                raise ValueError(f"Expense with ID {id} not found.")
+
+            before = generation()
+            with phase("save"):
+                delete(id)
+            _record_change(before, removed=[deleted_expense])
+        return deleted_expense
 
     def list_expenses(filters: ExpenseFilters) -> list[Expense]:
         """
         List expenses with optional filters and sorting.
 
+        Repeated queries are served from the result cache until the next write.
+
         Args:
             filters: ExpenseFilters dict containing month, date range, category, amount range, sorting, and limit
 
@@ -120,102 +301,140 @@ class ExpenseService:
         """
 
         validated = validateFilters(filters)
+        expenses = cached("list", validated, lambda: _list(validated))
+        count("rows_returned", len(expenses))
+        return expenses
 
-        month = validated.month
-        from_date = validated.from_date
-        to_date = validated.to_date
-        category = validated.category
-        min_amount = validated.min_amount
-        max_amount = validated.max_amount
-        sort_key = validated.sort
-        limit = validated.limit
-        sort_direction = validated.sort_direction
-
-        data = load()
-        expenses = data["expenses"]
-
-        if len(expenses) == 0:
-            return []
-
-        filtered_expenses = []
-        for exp in expenses:
-            if month and not exp["date"].startswith(month):
-                continue
-            if from_date and exp["date"] < from_date:
-                continue
-            if to_date and exp["date"] > to_date:
-                continue
-            if category and exp["category"].lower() != category:
-                continue
-            if min_amount and exp["amount"] < min_amount:
-                continue
-            if max_amount and exp["amount"] > max_amount:
-                continue
-            filtered_expenses.append(exp)
-
-        # Sort expenses
-        filtered_expenses.sort(
-            key=lambda x: x[sort_key], reverse=(sort_direction == -1)
-        )
-        # Apply limit
-        if limit:
-            filtered_expenses = filtered_expenses[:limit]
-        return filtered_expenses
+    def search_expenses(query: str, filters: ExpenseFilters) -> list[Expense]:
+        """
+        Find expenses by the words in their note and category.
+
+        Unlike list_expenses there is no default month: without date
+        filters every expense is searched.
+
+        Args:
+            query: Words that must all match, OR between alternatives, word* for a prefix
+            filters: ExpenseFilters dict containing month, date range, category, amount range, sorting, and limit
+
+        Returns:
+            list[Expense]: Matching expenses, sorted and limited like list_expenses
+        """
+        validated = validateFilters(filters, default_month=False)
+        expenses = get_index("search").search(query, validated)
+        count("rows_returned", len(expenses))
+        return expenses
+
+    def export_expenses(filters: ExpenseFilters) -> Iterator[Expense]:
+        """
+        Stream expenses matching the filters in date order.
+
+        Unlike list_expenses there is no default month: without date
+        filters every expense is exported.
+
+        Args:
+            filters: ExpenseFilters dict containing month, date range, category and amount range
+
+        Returns:
+            Iterator[Expense]: Matching expense objects, yielded one at a time
+        """
+        validated = validateFilters(filters, default_month=False)
+        return timed_chunks(iter_expenses(validated), "filter", "rows_returned")
 
     def summarize_expenses(filters: ExpenseFilters) -> ExpenseSummary:
         """
         Generate a summary of expenses with analytics.
 
+        Repeated summaries are served from the result cache until the next write.
+
         Args:
             filters: ExpenseFilters dict to filter expenses before summarizing
 
         Returns:
             ExpenseSummary: Dict containing title, grand_total, category totals, averages, percentages, and highest expense
         """
-        expenses = ExpenseService.list_expenses(filters)
+        validated = validateFilters(filters)
+        return cached("summary", validated, lambda: _summarize(filters, validated))
 
-        if len(expenses) == 0:
-            return []
+    def rebuild_indexes() -> int:
+        """
+        Rebuild the storage engine's indexes and every derived index from the stored expenses.
 
-        total_amount = sum(exp["amount"] for exp in expenses)
-        count = len(expenses)
+        Args:
+            None
 
-        category_totals = {}
-        for exp in expenses:
-            cat = exp["category"]
-            category_totals[cat] = category_totals.get(cat, 0) + exp["amount"]
+        Returns:
+            int: Number of expenses indexed
+        """
+        with write_lock():
+            count = rebuild_indexes()
+            for index in derived_indexes():
+                index.rebuild()
+        return count
 
-        # highest expense
-        highest_expense = max(expenses, key=lambda x: x["amount"])
+    def compact(if_needed: bool = False) -> tuple[int, int] | None:
+        """
+        Compact the storage engine's write-ahead log into a snapshot.
 
-        summary_title = ""
-        if filters.get("from") and filters.get("to"):
-            summary_title = f"Summary ({filters.get("from")} to {filters.get("to")})"
-        else:
-            summary_title = f"Summary ({filters.get("month") or datetime.today().date().isoformat()[:7]})"
+        Writers are only held up while the last few records are copied over,
+        and the data generation is unchanged, so the derived indexes stay valid.
 
-        # average per day
-        month = filters.get("month") or datetime.today().date().isoformat()[:7]
-        year, month = map(int, month.split("-"))
-        days_in_month = calendar.monthrange(year, month)[1]
-        average_per_day = total_amount / days_in_month if days_in_month > 0 else 0
+        Args:
+            if_needed: Only compact if the log has passed its size thresholds
 
-        # catergory wise percentage
-        category_percentages = {}
-        for cat, total in category_totals.items():
-            category_percentages[cat] = (
-                (total / total_amount) * 100 if total_amount > 0 else 0
-            )
+        Returns:
+            tuple[int, int] | None: Storage size in bytes before and after, or None if nothing was compacted
+        """
+        return compact(if_needed)
+
+    def category_totals() -> list[tuple[str, int, float]]:
+        """
+        Count and total the expenses of every category.
+
+        Args:
+            None
+
+        Returns:
+            list[tuple[str, int, float]]: Category, count and total, largest total first
+        """
+        return get_index("categories").totals()
+
+    def rollup_rows() -> list[tuple[str, str, int, float, str]]:
+        """
+        List the monthly per-category rollup.
 
-        summary = {
-            "title": summary_title,
-            "grand_total": total_amount,
-            "total_expenses": count,
-            "category_totals": category_totals,
-            "average_per_day": average_per_day,
-            "category_percentages": category_percentages,
-            "highest_expense": highest_expense,
-            "currency": expenses[0]["currency"],
-        }
-
-        return summary
+        Args:
+            None
+
+        Returns:
+            list[tuple[str, str, int, float, str]]: Month, category, count, total and highest expense ID
+        """
+        return get_index("rollup").rows()
+
+    def rebuild_rollup() -> int:
+        """
+        Recompute the monthly per-category rollup and the amount sketches
+        from one scan of the stored expenses.
+
+        Args:
+            None
+
+        Returns:
+            int: Number of (month, category) buckets
+        """
+        with write_lock():
+            state, _ = rebuild_together([get_index("rollup"), get_index("amounts")])
+        return sum(len(month) for month in state["buckets"].values())
+
+    def check_rollup() -> list[str]:
+        """
+        Check the monthly per-category rollup and the amount sketches
+        against the stored expenses.
+
+        Args:
+            None
+
+        Returns:
+            list[str]: A description of every inconsistency found
+        """
+        with write_lock():
+            return get_index("rollup").check() + get_index("amounts").check()
@@ -0,0 +1,188 @@
+import math
+from bisect import bisect_left, bisect_right
+
+# quantiles of larger sets are estimated to within this relative error
+RELATIVE_ACCURACY = 0.01
+
+# sets up to this size keep their amounts and get exact quantiles
+EXACT_LIMIT = 256
+
+# lower edges of the amount ranges counted for the histogram, after the
+# first range from 0
+HISTOGRAM_EDGES = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000)
+
+_gamma = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_log_gamma = math.log(_gamma)
+
+
+def new_sketch() -> dict:
+    """
+    Create an empty amount sketch.
+
+    A sketch summarizes a set of amounts in bounded space: bin k counts
+    the amounts in (gamma^(k-1), gamma^k], so every amount is known to
+    within RELATIVE_ACCURACY, zeros are counted apart, and the histogram
+    counts the amounts in each HISTOGRAM_EDGES range exactly. Up to
+    EXACT_LIMIT amounts are also kept, in sorted order. Sketches are plain
+    lists, dicts and numbers, so they can be stored as JSON, and two
+    sketches merge into the sketch of both sets, the same whichever order
+    the amounts were added in.
+
+    Args:
+        None
+
+    Returns:
+        dict: count, zeros, bins (keyed by str(k)), histogram and sorted values (None once past EXACT_LIMIT)
+    """
+    return {
+        "count": 0,
+        "zeros": 0,
+        "bins": {},
+        "histogram": [0] * (len(HISTOGRAM_EDGES) + 1),
+        "values": [],
+    }
+
+
+def add_amount(sketch: dict, amount: float, n: int = 1):
+    """
+    Add an amount to a sketch.
+
+    Args:
+        sketch: Sketch from new_sketch
+        amount: Non-negative amount
+        n: Number of times to add it
+
+    Returns:
+        None
+    """
+    sketch["count"] += n
+    if amount > 0:
+        bins = sketch["bins"]
+        k = str(math.ceil(math.log(amount) / _log_gamma))
+        bins[k] = bins.get(k, 0) + n
+    else:
+        sketch["zeros"] += n
+    sketch["histogram"][bisect_right(HISTOGRAM_EDGES, amount)] += n
+    values = sketch["values"]
+    if values is not None:
+        if sketch["count"] <= EXACT_LIMIT:
+            i = bisect_left(values, amount)
+            values[i:i] = [amount] * n
+        else:
+            sketch["values"] = None
+
+
+def remove_amount(sketch: dict, amount: float):
+    """
+    Remove an amount previously added to a sketch.
+
+    Args:
+        sketch: Sketch holding the amount
+        amount: The amount to remove
+
+    Returns:
+        None
+    """
+    sketch["count"] -= 1
+    if amount > 0:
+        bins = sketch["bins"]
+        k = str(math.ceil(math.log(amount) / _log_gamma))
+        bins[k] -= 1
+        if not bins[k]:
+            del bins[k]
+    else:
+        sketch["zeros"] -= 1
+    sketch["histogram"][bisect_right(HISTOGRAM_EDGES, amount)] -= 1
+    values = sketch["values"]
+    if values is not None:
+        del values[bisect_left(values, amount)]
+
+
+def merge_sketches(sketch: dict, other: dict):
+    """
+    Add every amount of another sketch to a sketch.
+
+    Args:
+        sketch: Sketch to update
+        other: Sketch to add, left unchanged
+
+    Returns:
+        None
+    """
+    sketch["count"] += other["count"]
+    sketch["zeros"] += other["zeros"]
+    bins = sketch["bins"]
+    for k, n in other["bins"].items():
+        bins[k] = bins.get(k, 0) + n
+    sketch["histogram"] = [
+        a + b for a, b in zip(sketch["histogram"], other["histogram"])
+    ]
+    if (
+        sketch["values"] is None
+        or other["values"] is None
+        or sketch["count"] > EXACT_LIMIT
+    ):
+        sketch["values"] = None
+    else:
+        sketch["values"] = sorted(sketch["values"] + other["values"])
+
+
+def _ranked(sketch: dict, rank: int) -> float:
+    # the amount at a rank in sorted order, from the bins
+    seen = sketch["zeros"]
+    if rank < seen:
+        return 0.0
+    for k in sorted(map(int, sketch["bins"])):
+        seen += sketch["bins"][str(k)]
+        if rank < seen:
+            break
+    # the midpoint of the bin, within the accuracy of both edges
+    return 2 * _gamma**k / (_gamma + 1)
+
+
+def quantile(sketch: dict, q: float) -> float | None:
+    """
+    Get a quantile of the amounts in a sketch.
+
+    Interpolates between the two amounts nearest the rank, like
+    statistics.median: exact while the sketch keeps its amounts, otherwise
+    within RELATIVE_ACCURACY.
+
+    Args:
+        sketch: Sketch from new_sketch
+        q: Quantile between 0 and 1, e.g. 0.5 for the median
+
+    Returns:
+        float | None: The quantile, or None if the sketch is empty
+    """
+    count = sketch["count"]
+    if count <= 0:
+        return None
+    rank = q * (count - 1)
+    low = math.floor(rank)
+    high = min(low + 1, count - 1)
+
+    values = sketch["values"]
+    if values is not None:
+        a, b = values[low], values[high]
+    else:
+        a, b = _ranked(sketch, low), _ranked(sketch, high)
+    return a + (b - a) * (rank - low)
+
+
+def histogram(sketch: dict) -> list[list]:
+    """
+    Count the amounts of a sketch in each HISTOGRAM_EDGES range.
+
+    Args:
+        sketch: Sketch from new_sketch
+
+    Returns:
+        list[list]: Lower edge, upper edge (None for the last range) and count, from the first to the last non-empty range
+    """
+    counts = sketch["histogram"]
+    used = [i for i, n in enumerate(counts) if n]
+    if not used:
+        return []
+    edges = (0,) + HISTOGRAM_EDGES + (None,)
+    return [[edges[i], edges[i + 1], counts[i]] for i in range(used[0], used[-1] + 1)]
@@ -1,12 +1,152 @@
-import os
-import json
+import importlib
+from typing import Iterator
+from tracker.config import get_flag, get_setting
+from tracker.models import Expense
+from tracker.query import (
+    filter_expenses,
+    iter_matching,
+    sort_expenses,
+    aggregate_expenses,
+)
+from tracker.types import ValidatedFilters
+from tracker.utils import parseExpenseNo
 
+DATA_DIR = "./data"
 DATA_FILE = "./data/expenses.json"
 
+DEFAULT_ENGINE = "journal"
+STORAGE_ENGINES = {
+    "journal": "tracker.backends.journal.JournalStorage",
+    "sqlite": "tracker.backends.sqlite.SqliteStorage",
+    "partitioned": "tracker.backends.partitioned.PartitionedStorage",
+    "blocks": "tracker.backends.blocks.BlockStorage",
+}
+
+_engine = None
+
+# set in the daemon, whose in-memory state outlives a single command
+_resident = False
+
+
+class StorageEngine:
+    """
+    Base class for storage engines.
+
+    Engines must implement load, save, update and delete. The lookup,
+    sequence, query and aggregate methods fall back to scanning every loaded
+    row in Python; engines that can answer them natively should override them.
+    """
+
+    def load(self) -> dict:
+        raise NotImplementedError
+
+    def save(self, expense_dict: dict) -> dict:
+        raise NotImplementedError
+
+    def update(self, expense_dict: dict) -> dict:
+        raise NotImplementedError
+
+    def save_many(self, expense_dicts: list[dict]) -> int:
+        for expense_dict in expense_dicts:
+            self.save(expense_dict)
+        return len(expense_dicts)
+
+    def delete(self, id: str) -> str:
+        raise NotImplementedError
+
+    def get_by_id(self, id: str) -> Expense | None:
+        for exp in self.load()["expenses"]:
+            if exp["id"] == id:
+                return exp
+        return None
+
+    def get_many(self, ids: list[str]) -> list[Expense]:
+        expenses = map(self.get_by_id, ids)
+        return [exp for exp in expenses if exp is not None]
+
+    def next_sequence(self) -> int:
+        expenses = self.load()["expenses"]
+        if len(expenses) == 0:
+            return 1
+        return (parseExpenseNo(expenses[-1]["id"]) or 0) + 1
+
+    def generation(self) -> int:
+        raise NotImplementedError
+
+    def rebuild_indexes(self) -> int:
+        return len(self.load()["expenses"])
+
+    def compact(self, if_needed: bool = False) -> tuple[int, int] | None:
+        return None
+
+    def iter_expenses(self, validated: ValidatedFilters) -> Iterator[Expense]:
+        expenses = filter_expenses(self.load()["expenses"], validated)
+        expenses.sort(key=lambda x: x.date)
+        yield from expenses
+
+    def query(self, validated: ValidatedFilters) -> list[Expense]:
+        expenses = iter_matching(self.load()["expenses"], validated)
+        return sort_expenses(expenses, validated)
+
+    def aggregate(self, validated: ValidatedFilters) -> dict:
+        expenses = filter_expenses(self.load()["expenses"], validated)
+        expenses.sort(key=lambda x: x.date)
+        return aggregate_expenses(expenses)
+
+
+def get_storage() -> StorageEngine:
+    """
+    Get the configured storage engine, creating it on first use.
+
+    The engine is chosen by the TRACKER_STORAGE environment variable or the
+    "storage" key of the config file, and defaults to the journal. With the
+    "columnar" setting switched on, queries and aggregates in the daemon
+    are answered from an in-memory column store over that engine.
+
+    Args:
+        None
+
+    Returns:
+        StorageEngine: The active storage engine
+    """
+    global _engine
+    if _engine is None:
+        name = get_setting("storage", DEFAULT_ENGINE)
+        if name not in STORAGE_ENGINES:
+            raise ValueError(
+                f"Unknown storage engine '{name}'. Must be one of: {', '.join(STORAGE_ENGINES)}."
+            )
+        module_name, class_name = STORAGE_ENGINES[name].rsplit(".", 1)
+        _engine = getattr(importlib.import_module(module_name), class_name)()
+        # building the column store costs more than a single command
+        # saves, so only a resident process uses it
+        if _resident and get_flag("columnar"):
+            from tracker.columnar import ColumnarStorage
+
+            _engine = ColumnarStorage(_engine)
+    return _engine
+
+
+def set_resident():
+    """
+    Mark this process as long-running, so that it keeps state between
+    commands worth the cost of building it (see get_storage).
+
+    Must be called before the engine is first used.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    global _resident
+    _resident = True
+
 
 def save(expense_dict):
     """
-    Save an expense to the JSON storage file.
+    Save a new expense with the active storage engine.
 
     Args:
         expense_dict: Dictionary containing expense data to save
@@ -14,29 +154,51 @@ def save(expense_dict):
     Returns:
         dict: The saved expense dictionary
     """
-    os.makedirs("./data", exist_ok=True)
+    return get_storage().save(expense_dict)
+
+
+def save_many(expense_dicts):
+    """
+    Save a batch of new expenses in a single storage write.
+
+    Args:
+        expense_dicts: List of expense dictionaries to save
+
+    Returns:
+        int: Number of expenses saved
+    """
+    return get_storage().save_many(expense_dicts)
 
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "w") as f:
-            json.dump({"version": "1.0", "expenses": []}, f, indent=4)
 
-    with open(DATA_FILE, "r") as f:
-        try:
-            data = json.load(f)
-        except json.JSONDecodeError:
-            raise ValueError("Expense data file is corrupted.")
+def update(expense_dict):
+    """
+    Store the new state of an existing expense.
 
-    data["expenses"].append(expense_dict)
+    Args:
+        expense_dict: Dictionary containing the full updated expense data
 
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    Returns:
+        dict: The updated expense dictionary
+    """
+    return get_storage().update(expense_dict)
 
-    return expense_dict
+
+def delete(id):
+    """
+    Delete an expense by ID.
+
+    Args:
+        id: Expense ID to delete
+
+    Returns:
+        str: The deleted expense ID
+    """
+    return get_storage().delete(id)
 
 
 def load():
     """
-    Load all expenses from the JSON storage file.
+    Load all expenses from the active storage engine.
 
     Args:
         None
@@ -44,16 +206,124 @@ def load():
     Returns:
         dict: The full data structure containing expenses and metadata
     """
-    os.makedirs("./data", exist_ok=True)
+    return get_storage().load()
+
+
+def get_by_id(id):
+    """
+    Find an expense by ID.
 
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "w") as f:
-            json.dump({"version": "1.0", "expenses": []}, f, indent=4)
+    Args:
+        id: Expense ID
 
-    with open(DATA_FILE, "r") as f:
-        try:
-            data = json.load(f)
-        except json.JSONDecodeError as e:
-            raise e
-    return data
-    # end try
+    Returns:
+        Expense | None: The expense, or None if it does not exist
+    """
+    return get_storage().get_by_id(id)
+
+
+def get_many(ids):
+    """
+    Find several expenses by ID at once.
+
+    Args:
+        ids: Expense IDs
+
+    Returns:
+        list[Expense]: The expenses that exist, in the order of their IDs
+    """
+    return get_storage().get_many(ids)
+
+
+def next_sequence():
+    """
+    Get the sequence number for the next expense ID.
+
+    Args:
+        None
+
+    Returns:
+        int: Next sequence number
+    """
+    return get_storage().next_sequence()
+
+
+def generation():
+    """
+    Get the data generation, a counter that grows with every mutation.
+
+    Args:
+        None
+
+    Returns:
+        int: Current generation
+    """
+    return get_storage().generation()
+
+
+def rebuild_indexes():
+    """
+    Rebuild every index kept by the active storage engine.
+
+    Args:
+        None
+
+    Returns:
+        int: Number of expenses indexed
+    """
+    return get_storage().rebuild_indexes()
+
+
+def compact(if_needed=False):
+    """
+    Fold the storage engine's write-ahead log into a new snapshot.
+
+    Args:
+        if_needed: Only compact if the log has passed its size thresholds
+
+    Returns:
+        tuple[int, int] | None: Storage size in bytes before and after, or None if nothing was compacted
+    """
+    return get_storage().compact(if_needed)
+
+
+def iter_expenses(validated: ValidatedFilters) -> Iterator[Expense]:
+    """
+    Stream the expenses matching the filters in date order.
+
+    Sorting and limits are ignored so that engines can yield rows without
+    holding the result set in memory.
+
+    Args:
+        validated: Validated filter object
+
+    Returns:
+        Iterator[Expense]: Matching expenses
+    """
+    return get_storage().iter_expenses(validated)
+
+
+def query(validated: ValidatedFilters) -> list[Expense]:
+    """
+    Get the filtered, sorted and limited expenses.
+
+    Args:
+        validated: Validated filter object
+
+    Returns:
+        list[Expense]: Matching expenses
+    """
+    return get_storage().query(validated)
+
+
+def aggregate(validated: ValidatedFilters) -> dict:
+    """
+    Get totals for the expenses matching the filters.
+
+    Args:
+        validated: Validated filter object
+
+    Returns:
+        dict: grand_total, total_expenses, category_totals, category_sketches (see tracker.sketch), highest_expense and currency
+    """
+    return get_storage().aggregate(validated)
@@ -0,0 +1,244 @@
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from itertools import islice
+from typing import Iterable, Iterator
+
+# rows pulled per phase switch by timed_chunks
+CHUNK_SIZE = 1024
+
+
+class _Local(threading.local):
+    # the collector of the command running on this thread; the daemon
+    # runs several commands at once, one per connection thread
+    active = None
+
+
+_local = _Local()
+
+
+class Timings:
+    """
+    Wall and CPU time per phase, plus counters, for one command.
+
+    Phases nest: entering a phase pauses the one around it, so every
+    moment of the command is charged to exactly one phase and the phase
+    times add up to the total. Time outside any phase is charged to
+    "other".
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+        self.stack = ["other"]
+        self.started = self.mark = (time.perf_counter(), time.thread_time())
+
+    def _charge(self):
+        now = (time.perf_counter(), time.thread_time())
+        entry = self.phases.setdefault(self.stack[-1], [0.0, 0.0, 0])
+        entry[0] += now[0] - self.mark[0]
+        entry[1] += now[1] - self.mark[1]
+        self.mark = now
+
+    def enter(self, name: str):
+        self._charge()
+        self.stack.append(name)
+        self.phases.setdefault(name, [0.0, 0.0, 0])[2] += 1
+
+    def exit(self):
+        self._charge()
+        self.stack.pop()
+
+    def report(self) -> dict:
+        """
+        Summarize the command so far.
+
+        Args:
+            None
+
+        Returns:
+            dict: wall_ms, cpu_ms, phases (wall_ms, cpu_ms and calls per phase) and counters
+        """
+        self._charge()
+        return {
+            "wall_ms": round((self.mark[0] - self.started[0]) * 1000, 3),
+            "cpu_ms": round((self.mark[1] - self.started[1]) * 1000, 3),
+            "phases": {
+                name: {
+                    "wall_ms": round(wall * 1000, 3),
+                    "cpu_ms": round(cpu * 1000, 3),
+                    "calls": calls,
+                }
+                for name, (wall, cpu, calls) in self.phases.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+
+def start() -> Timings:
+    """
+    Start collecting timings for a command.
+
+    Args:
+        None
+
+    Returns:
+        Timings: The active collector
+    """
+    _local.active = Timings()
+    return _local.active
+
+
+def stop() -> dict | None:
+    """
+    Stop collecting and summarize the command.
+
+    Args:
+        None
+
+    Returns:
+        dict | None: The collector's report, or None if none was active
+    """
+    timings, _local.active = _local.active, None
+    return timings.report() if timings else None
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Charge the time spent inside the block to a phase.
+
+    Does nothing unless a command is being timed.
+
+    Args:
+        name: Phase name, e.g. load, filter, sort, aggregate, format or write
+    """
+    timings = _local.active
+    if timings is None:
+        yield
+        return
+    timings.enter(name)
+    try:
+        yield
+    finally:
+        timings.exit()
+
+
+def timed(name: str):
+    """
+    Decorator that charges every call of a function to a phase.
+
+    Args:
+        name: Phase name
+
+    Returns:
+        function: Decorator function that wraps the function
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _local.active is None:
+                return func(*args, **kwargs)
+            with phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, n: int = 1):
+    """
+    Add to a counter of the command being timed.
+
+    Args:
+        name: Counter name, e.g. rows_scanned
+        n: Amount to add
+
+    Returns:
+        None
+    """
+    timings = _local.active
+    if timings is not None:
+        timings.counters[name] = timings.counters.get(name, 0) + n
+
+
+def timed_chunks(
+    iterable: Iterable, name: str, counter: str | None = None, size: int = CHUNK_SIZE
+) -> Iterable:
+    """
+    Charge the time spent producing the items of a lazy stage to a phase.
+
+    Items are pulled size at a time inside the phase and then handed on one
+    by one, so a pipeline of generators costs two clock reads per chunk per
+    stage rather than per row, and memory stays bounded by the chunk size.
+    When no command is being timed the iterable is returned unchanged.
+
+    Args:
+        iterable: Stage to time
+        name: Phase name
+        counter: Counter to add the number of items to (optional)
+        size: Items per chunk
+
+    Returns:
+        Iterable: The same items in the same order
+    """
+    if _local.active is None:
+        return iterable
+    return _timed_chunks(iter(iterable), name, counter, size)
+
+
+def _timed_chunks(it: Iterator, name: str, counter: str | None, size: int):
+    while True:
+        with phase(name):
+            chunk = list(islice(it, size))
+        if counter:
+            count(counter, len(chunk))
+        if not chunk:
+            return
+        yield from chunk
+
+
+def format_report(command_name: str, report: dict) -> list[str]:
+    """
+    Format a timings report as a table for stderr.
+
+    Args:
+        command_name: Name of the command
+        report: Report from stop()
+
+    Returns:
+        list[str]: Table lines
+    """
+    lines = [
+        f"timings: {command_name} | wall {report['wall_ms']:.2f} ms | cpu {report['cpu_ms']:.2f} ms",
+        f"  {'phase':<10} {'wall ms':>10} {'cpu ms':>10} {'calls':>7}",
+    ]
+    phases = sorted(report["phases"].items(), key=lambda item: -item[1]["wall_ms"])
+    for name, stats in phases:
+        lines.append(
+            f"  {name:<10} {stats['wall_ms']:>10.2f} {stats['cpu_ms']:>10.2f} {stats['calls']:>7}"
+        )
+    for name, value in report["counters"].items():
+        lines.append(f"  {name.replace('_', ' ')}: {value}")
+    return lines
+
+
+def log_fields(report: dict) -> str:
+    """
+    Flatten a timings report into key=value log fields.
+
+    Args:
+        report: Report from stop()
+
+    Returns:
+        str: Space-separated key=value pairs
+    """
+    fields = {"wall_ms": report["wall_ms"], "cpu_ms": report["cpu_ms"]}
+    for name, stats in report["phases"].items():
+        fields[f"{name}_wall_ms"] = stats["wall_ms"]
+        fields[f"{name}_cpu_ms"] = stats["cpu_ms"]
+    fields.update(report["counters"])
+    return " ".join(f"{key}={value}" for key, value in fields.items())
@@ -24,6 +24,11 @@ class ExpenseSummary(TypedDict):
     category_percentages: float
     highest_expense: dict
     currency: str
+    median: float
+    p90: float
+    p99: float
+    histogram: list
+    category_medians: dict
     summary_type: Literal["range", "monthly"]
 
 
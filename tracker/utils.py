@@ -1,7 +1,14 @@
+import sys
 from datetime import datetime
-from tracker.types import ExpenseSummary, ExpenseFilters, ValidatedFilters
-from tracker.models import Expense
-from tracker.logger import logger
+from typing import TYPE_CHECKING, Iterable, Iterator
+from tracker import timings
+from tracker.timings import phase, timed, timed_chunks
+
+# utils is imported by the CLI before any command runs, so the type
+# definitions (and dataclasses with them) load only when they are needed
+if TYPE_CHECKING:
+    from tracker.types import ExpenseSummary, ExpenseFilters
+    from tracker.models import Expense
 
 
 def generateExpenseId(dateStr: str, no: int) -> str:
@@ -19,6 +26,41 @@ def generateExpenseId(dateStr: str, no: int) -> str:
     return f"EXP-{date.year}{date.month:02d}{date.day:02d}-{no:04d}"
 
 
+def parseExpenseNo(id: str) -> int | None:
+    """
+    Extract the sequence number from an expense ID.
+
+    Args:
+        id: Expense ID (e.g., EXP-20260129-0001)
+
+    Returns:
+        int | None: The sequence number, or None if the ID is not in the expected format
+    """
+    parts = id.split("-")
+    if len(parts) != 3 or parts[0] != "EXP" or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def parseExpenseDate(id: str) -> str | None:
+    """
+    Extract the date an expense was created for from its ID.
+
+    Args:
+        id: Expense ID (e.g., EXP-20260129-0001)
+
+    Returns:
+        str | None: The date in YYYY-MM-DD format, or None if the ID is not in the expected format
+    """
+    parts = id.split("-")
+    if len(parts) != 3 or parts[0] != "EXP" or len(parts[1]) != 8:
+        return None
+    digits = parts[1]
+    if not digits.isdigit():
+        return None
+    return f"{digits[:4]}-{digits[4:6]}-{digits[6:]}"
+
+
 def validateDate(dateStr: str) -> bool:
     """
     Validate if a date string is in YYYY-MM-DD format.
@@ -53,61 +95,57 @@ def validateMonth(dateStr: str) -> bool:
         return False
 
 
-def format_table(expenses: list[Expense]) -> list[str]:
+def format_table(expenses: Iterable["Expense"]) -> Iterator[str]:
     """
     Format expenses as a table string for display.
 
     Args:
-        expenses: List of expense dictionaries to format
+        expenses: Iterable of expense records to format, consumed lazily
 
     Returns:
-        list[str]: Formatted table lines with header and expense rows
+        Iterator[str]: Formatted table lines with header and expense rows
     """
-    lines = []
     header = (
         f"{'ID':<17} | {'Date':<12} | {'Category':<15} | {'Amount':>15} |  {'Note'}"
     )
-    lines.append("-" * len(header))
-    lines.append(header)
-    lines.append("-" * len(header))
+    yield "-" * len(header)
+    yield header
+    yield "-" * len(header)
 
     for exp in expenses:
-        lines.append(
-            f"{exp['id']:<17} | "
-            f"{exp['date']:<12} | "
-            f"{exp['category']:<15} | "
-            f"{exp['amount']:>10.2f} {exp["currency"]}  | "
-            f"{exp['note']}"
+        yield (
+            f"{exp.id:<17} | "
+            f"{exp.date:<12} | "
+            f"{exp.category:<15} | "
+            f"{exp.amount:>10.2f} {exp.currency}  | "
+            f"{exp.note}"
         )
-    return lines
 
 
-def format_list_csv(expenses: list[Expense]) -> list[str]:
+def format_list_csv(expenses: Iterable["Expense"]) -> Iterator[str]:
     """
     Format expenses as CSV lines for export.
 
     Args:
-        expenses: List of expense dictionaries to format
+        expenses: Iterable of expense records to format, consumed lazily
 
     Returns:
-        list[str]: Formatted CSV lines with header and expense rows
+        Iterator[str]: Formatted CSV lines with header and expense rows
     """
-    lines = []
     header = "ID,Date,Category,Amount,Note"
-    lines.append(header)
+    yield header
 
     for exp in expenses:
-        lines.append(
-            f"{exp['id']},"
-            f"{exp['date']},"
-            f"{exp['category']},"
-            f"{exp['amount']:.2f} {exp["currency"]},"
-            f"{exp['note']}"
+        yield (
+            f"{exp.id},"
+            f"{exp.date},"
+            f"{exp.category},"
+            f"{exp.amount:.2f} {exp.currency},"
+            f"{exp.note}"
         )
-    return lines
 
 
-def print_summary(summary: ExpenseSummary) -> list[str]:
+def print_summary(summary: "ExpenseSummary") -> Iterator[str]:
     """
     Format expense summary data for display.
 
@@ -115,79 +153,135 @@ def print_summary(summary: ExpenseSummary) -> list[str]:
         summary: Dictionary containing expense summary with totals, categories, and analytics
 
     Returns:
-        list[str]: Formatted summary lines for display
+        Iterator[str]: Formatted summary lines for display
     """
-    lines = []
-    lines.append(f"{summary["title"]}")
-    lines.append(f"Total Expenses: {summary["total_expenses"]}")
-    lines.append(f"Grand Amount: {summary['grand_total']:.2f} {summary['currency']}")
-    lines.append("")
-    lines.append("By Category:")
+    yield f"{summary["title"]}"
+    yield f"Total Expenses: {summary["total_expenses"]}"
+    yield f"Grand Amount: {summary['grand_total']:.2f} {summary['currency']}"
+    yield ""
+    yield "By Category:"
     for category, total in summary["category_totals"].items():
-        lines.append(f"{category:<15} " f"{total:>15.2f} {summary['currency']}")
-    lines.append("")
-    lines.append(
-        f"Average per day: {summary['average_per_day']:.2f} {summary['currency']}"
-    )
-    lines.append("")
-    lines.append("Highest Expense:")
-    lines.append(
+        yield f"{category:<15} " f"{total:>15.2f} {summary['currency']}"
+    yield ""
+    yield (f"Average per day: {summary['average_per_day']:.2f} {summary['currency']}")
+    yield ""
+    yield "Highest Expense:"
+    yield (
         f"{summary['highest_expense']['date']}  |   {summary['highest_expense']['category']}    |   {summary['highest_expense']['amount']} {summary['currency']}"
     )
-    lines.append("")
-    lines.append("Category Percentages:")
+    yield ""
+    yield "Category Percentages:"
     for category, percentage in summary["category_percentages"].items():
-        lines.append(f"{category:<15} " f"{percentage:>14.2f}%")
-    return lines
-
-
-def format_summary_csv(summary: ExpenseSummary) -> list[str]:
+        yield f"{category:<15} " f"{percentage:>14.2f}%"
+    yield ""
+    yield "Amount Percentiles:"
+    for label, key in (
+        ("Median", "median"),
+        ("90th Percentile", "p90"),
+        ("99th Percentile", "p99"),
+    ):
+        yield f"{label:<15} " f"{summary[key]:>15.2f} {summary['currency']}"
+    yield ""
+    yield "By Amount:"
+    for low, high, n in summary["histogram"]:
+        label = f"{low} - {high}" if high is not None else f"{low}+"
+        yield f"{label:<15} " f"{n:>15}"
+    yield ""
+    yield "Category Medians:"
+    for category, median in summary["category_medians"].items():
+        yield f"{category:<15} " f"{median:>15.2f} {summary['currency']}"
+
+
+def format_summary_csv(summary: "ExpenseSummary") -> Iterator[str]:
     """
-    Convert summary dict to CSV lines.
+    Convert summary dict to CSV lines, yielded one at a time.
     """
-    lines = []
 
     # Header info
-    lines.append(f"{summary["title"]}")
-    lines.append(f"Total Expenses,{summary['total_expenses']}")
-    lines.append(f"Grand Total,{summary['grand_total']:.2f} {summary['currency']}")
-    lines.append("")
+    yield f"{summary["title"]}"
+    yield f"Total Expenses,{summary['total_expenses']}"
+    yield f"Grand Total,{summary['grand_total']:.2f} {summary['currency']}"
+    yield ""
 
     # By category
-    lines.append("Category,Total Amount")
+    yield "Category,Total Amount"
     for category, total in summary["category_totals"].items():
-        lines.append(f"{category},{total:.2f} {summary["currency"]}")
+        yield f"{category},{total:.2f} {summary["currency"]}"
 
-    lines.append("")
-    lines.append(
-        f"Average per day,{summary['average_per_day']:.2f} {summary['currency']}"
-    )
-    lines.append("")
+    yield ""
+    yield (f"Average per day,{summary['average_per_day']:.2f} {summary['currency']}")
+    yield ""
 
     # Highest expense
     he = summary["highest_expense"]
-    lines.append("Highest Expense Date,Category,Amount")
-    lines.append(f"{he['date']},{he['category']},{he['amount']} {summary['currency']}")
-    lines.append("")
+    yield "Highest Expense Date,Category,Amount"
+    yield f"{he['date']},{he['category']},{he['amount']} {summary['currency']}"
+    yield ""
 
     # Category percentages
-    lines.append("Category,Percentage")
+    yield "Category,Percentage"
     for category, percent in summary["category_percentages"].items():
-        lines.append(f"{category},{percent:.2f}%")
+        yield f"{category},{percent:.2f}%"
+    yield ""
+
+    # Amount distribution
+    yield "Percentile,Amount"
+    for label, key in (("Median", "median"), ("P90", "p90"), ("P99", "p99")):
+        yield f"{label},{summary[key]:.2f} {summary['currency']}"
+    yield ""
+    yield "Amount Range,Count"
+    for low, high, n in summary["histogram"]:
+        yield f"{low}-{high},{n}" if high is not None else f"{low}+,{n}"
+    yield ""
+    yield "Category,Median"
+    for category, median in summary["category_medians"].items():
+        yield f"{category},{median:.2f} {summary['currency']}"
+
+
+def write_lines(lines: Iterable[str], out=None, chunk_size: int = 1000):
+    """
+    Write lines to a text stream in large chunks.
 
-    return lines
+    Lines are joined into blocks of chunk_size and written with one call
+    each, instead of one print (and possibly one syscall) per line.
 
+    Args:
+        lines: Iterable of lines without trailing newlines
+        out: Text stream to write to (defaults to stdout)
+        chunk_size: Number of lines per write
 
-def validateFilters(filters: ExpenseFilters):
+    Returns:
+        None
+    """
+    out = out or sys.stdout
+    chunk = []
+    for line in timed_chunks(lines, "format", size=chunk_size):
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            chunk.append("")
+            with phase("write"):
+                out.write("\n".join(chunk))
+            chunk.clear()
+    with phase("write"):
+        if chunk:
+            chunk.append("")
+            out.write("\n".join(chunk))
+        out.flush()
+
+
+@timed("validate")
+def validateFilters(filters: "ExpenseFilters", default_month: bool = True):
     """
     Validate and normalize expense filter parameters.
 
     Args:
         filters: Dictionary of filter parameters (month, sort, date range, category, amount range, limit, desc)
+        default_month: Fall back to the current month when no month or date range is given
 
     Returns:
         ValidatedFilters: Normalized filter object with validated values
     """
+    from tracker.types import ValidatedFilters
 
     from_date = filters.get("from") or None
     to_date = filters.get("to") or None
@@ -200,7 +294,12 @@ def validateFilters(filters: ExpenseFilters):
     if (from_date and not to_date) or (to_date and not from_date):
         raise ValueError("'--from' and '--to' should be used together")
 
-    month = filters.get("month") or datetime.today().date().isoformat()[:7]
+    # default to the current month only when no date range was given
+    month = filters.get("month") or (
+        None
+        if from_date or not default_month
+        else datetime.today().date().isoformat()[:7]
+    )
     if month and not validateMonth(month):
         raise ValueError("Invalid month format. Please use YYYY-MM.")
 
@@ -248,6 +347,12 @@ def log_command(command_name):
     """
     Decorator to log command execution with arguments and results.
 
+    The command is timed phase by phase (see tracker.timings). The wall and
+    CPU time of every phase, the row counters and the bytes read and written
+    are appended to the completion log line as key=value fields, attached
+    to the record as its "timings" attribute, and printed to stderr when
+    the command was given --timings or the "timings" setting is on.
+
     Args:
         command_name: Name of the command being logged
 
@@ -257,7 +362,10 @@ def log_command(command_name):
 
     def decorator(func):
         def wrapper(*args, **kwargs):
-            from tracker.logger import logger
+            from tracker.config import get_flag
+            from tracker.logger import get_logger
+
+            logger = get_logger()
 
             # Filter out None arguments for clean logging
             if args:
@@ -268,24 +376,37 @@ def log_command(command_name):
                 arg_dict.update({k: v for k, v in kwargs.items() if v is not None})
 
             logger.info("Command: '%s' | Args: %s", command_name, arg_dict)
+            show_timings = arg_dict.get("timings") or get_flag("timings")
 
+            timings.start()
             try:
                 result = func(*args, **kwargs)
-                logger.info("Command '%s' completed successfully", command_name)
+                report = timings.stop()
+                logger.info(
+                    "Command '%s' completed successfully | %s",
+                    command_name,
+                    timings.log_fields(report),
+                    extra={"timings": report},
+                )
+                if show_timings:
+                    write_lines(timings.format_report(command_name, report), sys.stderr)
                 return result
             except Exception as e:
+                report = timings.stop()
                 # Log only the exception message, no full stack trace
                 logger.error(
-                    "Error in command '%s' | Args: %s | Error: %s",
+                    "Error in command '%s' | Args: %s | Error: %s | %s",
                     command_name,
                     arg_dict,
                     str(e),
+                    timings.log_fields(report),
+                    extra={"timings": report},
                 )
                 # Optionally print to CLI as well
                 print(f"Error: {e}")
+                if show_timings:
+                    write_lines(timings.format_report(command_name, report), sys.stderr)
                 # raise  # re-raise if you want the program to exit with error
-                import sys
-
                 sys.exit(1)
 
         return wrapper